@@ -1,24 +1,38 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
 from langgraph.types import interrupt, Command
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+from typing_extensions import Annotated
 import uuid
+import json
 import asyncio
+import functools
+import time
 from contextlib import asynccontextmanager
 
 # Models
 class StoryRequest(BaseModel):
     prompt: str
     session_id: Optional[str] = None
+    webhook_url: Optional[str] = None  # /api/jobs/start: POSTed the finished job
 
 class FeedbackRequest(BaseModel):
     session_id: str
     feedback: str
+    webhook_url: Optional[str] = None  # /api/jobs/feedback: POSTed the finished job
 
 class EnhancementRequest(BaseModel):
     session_id: str
-    enhancement_type: str  # "title" or "moral"
+    enhancement_type: str  # "title", "moral" or "both"
+
+class BatchRequest(BaseModel):
+    prompts: List[str] = []
+    batch_id: Optional[str] = None  # resume this batch instead of starting one
+    mode: str = "graph"  # "graph" (full story graph) or "static" (batched model calls)
+    concurrency: int = 4
+    feedback: List[str] = []  # revision feedback applied to every story, then "done"
 
 class SessionResponse(BaseModel):
     session_id: str
@@ -33,13 +47,87 @@ class SessionResponse(BaseModel):
     story_complete: bool = False  # New field to indicate if story is finalized
 
 # Import the graph after defining models
-from graph_builder import graph
+from graph_builder import open_async_graph
+from compaction import Compactor
+from session_index import open_session_index, etag, title_and_moral, story_hash
+from session_locks import open_session_locks, SessionBusy, fingerprint
+from hot_sessions import HotSessions, follow
+from metrics import registry
+from batch import BatchStore, run_batch
+from speculation import speculator
+from llm_clients import clients
+from jobs import jobs, QueueFull, WebhookRejected, check_webhook
+from config import BATCH_DB, BATCH_MAX_CONCURRENCY
+from config import CHECKPOINT_BACKEND, API_HOST, API_PORT, API_WORKERS, WARMUP
+from config import JOB_LONG_POLL_SECONDS
+from config import DB_PATH, COMPACTION_KEEP_LAST, COMPACTION_FINISHED_TTL_HOURS, COMPACTION_ABANDONED_TTL_HOURS, COMPACTION_INTERVAL_MINUTES
+
+# Async graph, opened in lifespan so its checkpointer is closed on shutdown
+graph = None
+compactor = None
+session_index = None
+session_locks = None
+hot_sessions = None
+batch_store = None
+
+async def compaction_loop():
+    """Background job: prune old checkpoints and expire sessions periodically."""
+    while True:
+        await asyncio.sleep(COMPACTION_INTERVAL_MINUTES * 60)
+        try:
+            report = await asyncio.to_thread(compactor.run)
+            print(f"Compaction: {report}")
+        except Exception as e:
+            print(f"Error in compaction: {e}")
+
+async def warm_up():
+    """Builds what the first requests would otherwise wait for, concurrently:
+    the spelling index, the model client and the response caches."""
+    from spellcheck import get_engine
+    from graph_nodes import get_llm, get_response_cache, get_semantic_cache
+    started = time.perf_counter()
+    loaders = (get_engine, get_llm, get_response_cache, get_semantic_cache)
+    await asyncio.gather(*(asyncio.to_thread(load) for load in loaders))
+    print(f"Warm-up finished in {time.perf_counter() - started:.2f}s")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global graph, compactor, session_index, session_locks, hot_sessions, batch_store
     # Startup
     print("Story Generator API starting...")
-    yield
+    # Runs in threads alongside opening the stores below; the sleep lets the
+    # task start them before the synchronous setup takes the loop
+    warming = asyncio.create_task(warm_up()) if WARMUP else None
+    await asyncio.sleep(0)
+    batch_store = BatchStore(BATCH_DB)
+    async with open_async_graph() as async_graph:
+        graph = async_graph
+        session_index = open_session_index(graph.checkpointer, CHECKPOINT_BACKEND, DB_PATH, API_WORKERS)
+        session_locks = open_session_locks(graph.checkpointer, CHECKPOINT_BACKEND, DB_PATH, API_WORKERS)
+        hot_sessions = HotSessions(graph, session_index)
+        # Redis and Postgres sessions expire in the store itself
+        if CHECKPOINT_BACKEND == "sqlite":
+            compactor = Compactor(
+                DB_PATH,
+                graph,
+                keep_last=COMPACTION_KEEP_LAST,
+                finished_ttl=COMPACTION_FINISHED_TTL_HOURS * 3600,
+                abandoned_ttl=COMPACTION_ABANDONED_TTL_HOURS * 3600,
+                session_index=session_index,
+            )
+        compaction_task = asyncio.create_task(compaction_loop()) if compactor and COMPACTION_INTERVAL_MINUTES > 0 else None
+        if warming:
+            await warming
+        jobs.start()
+        yield
+        await jobs.close()
+        if compaction_task:
+            compaction_task.cancel()
+        speculator.close()
+        session_locks.close()
+    session_index.close()
+    await clients.aclose()
+    batch_store.close()
     # Shutdown
     print("Story Generator API shutting down...")
 
@@ -54,6 +142,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+async def _run_graph(graph_input, config, speculate: bool = True, hot: bool = True):
+    """Run the graph to the next interrupt (or the end), keeping the session
+    index up to date as nodes finish. Returns the resulting state, kept in
+    the hot session cache, or the full snapshot if `hot` is False."""
+    session_id = config["configurable"]["thread_id"]
+    state = None
+    async for mode, chunk in graph.astream(graph_input, config, stream_mode=["updates", "values", "tasks"]):
+        if mode == "updates":
+            await session_index.aobserve(session_id, chunk)
+        else:
+            state = follow(state, mode, chunk)
+    if hot:
+        state = await _finish(session_id, state)
+    else:
+        # Batches tell a paused run from a crashed one by the snapshot's tasks
+        state = await graph.aget_state(config)
+        await session_index.afinish(session_id, paused=bool(state.next))
+    if speculate and state.next:
+        speculator.start(session_id, state.values.get("story"))
+    return state
+
+async def _finish(session_id: str, state):
+    """Records the end of a run given the state followed from its stream."""
+    if state is None or not state.values:
+        # Nothing ran (e.g. resuming a finished session)
+        state = await hot_sessions.load(session_id)
+    summary = await session_index.afinish(session_id, paused=bool(state.next))
+    return hot_sessions.put(session_id, state, summary["version"])
+
+def _resume(session_id: str, feedback: str) -> Command:
+    """Command resuming a paused session. Anything but "done" changes the
+    story, so title/moral speculated for the current draft are dropped."""
+    if feedback.lower() != "done":
+        speculator.cancel(session_id)
+    return Command(resume=feedback)
+
+def _idempotency(request: FeedbackRequest, state, idempotency_key: Optional[str]):
+    """(key, fingerprint, source) identifying a feedback request. Without an
+    Idempotency-Key header, the same feedback for the same draft counts as
+    the same request, so a double click revises once."""
+    expected = fingerprint(request.session_id, request.feedback)
+    if idempotency_key:
+        return f"{request.session_id}:key:{idempotency_key}", expected, "header"
+    draft = story_hash(state.values.get("story")) or "-"
+    return f"{request.session_id}:auto:{draft}:{expected}", expected, "implicit"
+
+async def _recall(key: str, expected: str, source: str) -> Optional[dict]:
+    try:
+        stored = await session_locks.arecall(key, expected)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if stored is not None:
+        registry.inc("story_idempotent_replays_total", (("source", source),))
+    return stored
+
+@asynccontextmanager
+async def _session_lock(session_id: str):
+    """The session's lock (see session_locks.py), as a 409 if it stays busy."""
+    try:
+        async with session_locks.hold(session_id):
+            yield
+    except SessionBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+def _not_modified(request: Request, tag: str) -> bool:
+    candidates = request.headers.get("if-none-match", "")
+    return any(c.strip().removeprefix("W/") in (tag, "*") for c in candidates.split(",") if c.strip())
+
 @app.post("/api/start", response_model=SessionResponse)
 async def start_story(request: StoryRequest):
     session_id = request.session_id or str(uuid.uuid4())
@@ -69,12 +225,10 @@ async def start_story(request: StoryRequest):
         "messages":[]
     }
 
-    # Stream until interrupt (or completion)
-    output = None
-    for event in graph.stream(initial_state, config, stream_mode="values"):
-        output = event
-
-    state = graph.get_state(config)
+    # Run until interrupt (or completion)
+    async with _session_lock(session_id):
+        state = await _run_graph(initial_state, config)
+    output = state.values
 
     requires_feedback = bool(state.next)  # If interrupted, next will still have nodes
     story_complete = not requires_feedback
@@ -90,31 +244,44 @@ async def start_story(request: StoryRequest):
         status="awaiting_feedback" if requires_feedback else "completed"
     )
 @app.post("/api/feedback", response_model=SessionResponse)
-async def provide_feedback(request: FeedbackRequest):
+async def provide_feedback(request: FeedbackRequest, idempotency_key: Annotated[Optional[str], Header()] = None):
+    """Resume a paused session. A repeated request (same Idempotency-Key, or
+    the same feedback for the same draft) gets the first one's response
+    instead of another revision"""
     config = {"configurable": {"thread_id": request.session_id}}
 
-    state = graph.get_state(config)
+    state = await hot_sessions.get(request.session_id)
     if not state.values:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    feedback = request.feedback
+    key, expected, source = _idempotency(request, state, idempotency_key)
+    stored = await _recall(key, expected, source)
+    if stored is not None:
+        return SessionResponse(**stored)
+    async with _session_lock(request.session_id):
+        # The run we waited for may have been this same request
+        stored = await _recall(key, expected, source)
+        if stored is not None:
+            return SessionResponse(**stored)
+        response = await _feedback_run(request, config)
+        await session_locks.aremember(key, expected, response.model_dump())
+    return response
 
-    # Resume the interrupted graph with the feedback
-    for event in graph.stream(Command(resume=feedback), config, stream_mode="values"):
-        pass  # Consume stream to run until next interrupt or end
+async def _feedback_run(request: FeedbackRequest, config) -> SessionResponse:
+    feedback = request.feedback
 
-    # Get final state after resume
-    updated_state = graph.get_state(config)
+    # Resume the interrupted graph with the feedback, until next interrupt or end
+    updated_state = await _run_graph(_resume(request.session_id, feedback), config)
     output = updated_state.values
 
     requires_feedback = bool(updated_state.next)
     story_complete = not requires_feedback
 
-    # Extract title/moral from history if needed (your existing logic)
-
     return SessionResponse(
         session_id=request.session_id,
         story=output.get("story"),
+        title=output.get("title"),
+        moral=output.get("moral"),
         revision_count=output.get("revision_count", 0),
         history=output.get("history", []),
         requires_feedback=requires_feedback,
@@ -129,91 +296,81 @@ async def enhance_story(request: EnhancementRequest):
     config = {"configurable": {"thread_id": session_id}}
     
     try:
-        # Get current state
-        state = graph.get_state(config)
-        if not state.values:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        current_story = state.values.get("story", "")
-        current_history = state.values.get("history", [])
-        
-        # Run specific enhancement node
-        if request.enhancement_type == "title":
-            from graph_nodes import title_generator
-            
-            # Run title generator
-            title_result = title_generator({"story": current_story, "history": current_history})
-            
-            # Update state
-            new_state = {
-                **state.values,
-                "title": title_result.get("history", [])[-1].replace("Title: ", "") if title_result.get("history") else None,
-                "history": title_result.get("history", current_history)
-            }
-            
-            graph.update_state(config, new_state)
-            
-        elif request.enhancement_type == "moral":
-            from graph_nodes import moral_extractor
-            
-            # Run moral extractor
-            moral_result = moral_extractor({"story": current_story, "history": current_history})
-            
-            # Update state
-            new_state = {
-                **state.values,
-                "moral": moral_result.get("history", [])[-1].replace("Moral: ", "") if moral_result.get("history") else None,
-                "history": moral_result.get("history", current_history)
-            }
-            
-            graph.update_state(config, new_state)
-        
-        # Get updated state
-        updated_state = graph.get_state(config)
-        output = updated_state.values
-        
-        # Extract title and moral from history if not directly in output
-        title = output.get("title")
-        moral = output.get("moral")
-        
-        if not title:
-            # Try to extract from history
-            for item in output.get("history", []):
-                if item.startswith("Title: "):
-                    title = item.replace("Title: ", "")
-                    break
-        
-        if not moral:
-            # Try to extract from history
-            for item in output.get("history", []):
-                if item.startswith("Moral: "):
-                    moral = item.replace("Moral: ", "")
-                    break
-        
-        return SessionResponse(
-            session_id=session_id,
-            story=output.get("story"),
-            title=title,
-            moral=moral,
-            status="completed",
-            revision_count=output.get("revision_count", 0),
-            history=output.get("history", []),
-            message=f"Story {request.enhancement_type} generated successfully",
-            requires_feedback=False,
-            story_complete=True
-        )
-            
+        async with _session_lock(session_id):
+            return await _enhance(request, config)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in enhance_story: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/session/{session_id}", response_model=SessionResponse)
-async def get_session(session_id: str):
-    """Get current session state"""
-    config = {"configurable": {"thread_id": session_id}}
+async def _enhance(request: EnhancementRequest, config) -> SessionResponse:
+    session_id = request.session_id
+    # Get current state
+    state = await hot_sessions.get(session_id)
+    if not state.values:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    current_story = state.values.get("story", "")
+    current_history = state.values.get("history", [])
     
+    # Run the requested enhancement node(s); "both" runs them concurrently
+    from graph_nodes import atitle_generator, amoral_extractor
+    enhancers = {"title": atitle_generator, "moral": amoral_extractor}
+    if request.enhancement_type == "both":
+        selected = list(enhancers)
+    elif request.enhancement_type in enhancers:
+        selected = [request.enhancement_type]
+    else:
+        raise HTTPException(status_code=400, detail="enhancement_type must be 'title', 'moral' or 'both'")
+
+    node_input = {"story": current_story, "history": current_history}
+    results = await asyncio.gather(*(enhancers[kind](node_input) for kind in selected))
+
+    # Only send the new values; the history reducer appends the entries
+    update = {"history": []}
+    for result in results:
+        update["history"] += result["history"]
+        update.update({key: value for key, value in result.items() if key != "history"})
+
+    # A finished session is updated as a finalization node so it stays
+    # finished; a paused one keeps its pending human_feedback step
+    await graph.aupdate_state(config, update, as_node=None if state.next else "title_generator")
+    await session_index.aobserve(session_id, {"enhance": update})
+    
+    # Get updated state
+    updated_state = await hot_sessions.load(session_id)
+    summary = await session_index.afinish(session_id, paused=bool(updated_state.next))
+    hot_sessions.put(session_id, updated_state, summary["version"])
+    output = updated_state.values
+    title, moral = title_and_moral(output)
+    
+    return SessionResponse(
+        session_id=session_id,
+        story=output.get("story"),
+        title=title,
+        moral=moral,
+        status="completed",
+        revision_count=output.get("revision_count", 0),
+        history=output.get("history", []),
+        message=f"Story {request.enhancement_type} generated successfully",
+        requires_feedback=False,
+        story_complete=True
+    )
+
+@app.get("/api/session/{session_id}", response_model=SessionResponse)
+async def get_session(session_id: str, request: Request, response: Response):
+    """Get current session state.
+
+    Carries an ETag from the session index; a client that sends it back in
+    If-None-Match gets 304 without the checkpoint being read.
+    """
+    summary = await session_index.aget(session_id)
+    if summary is not None and _not_modified(request, etag(summary)):
+        return Response(status_code=304, headers={"ETag": etag(summary)})
+
     try:
-        state = graph.get_state(config)
+        state = await hot_sessions.get(session_id, summary)
         
         if not state.values:
             raise HTTPException(status_code=404, detail="Session not found")
@@ -225,23 +382,10 @@ async def get_session(session_id: str):
             requires_feedback = True
             message = "Please provide feedback to improve the story or type 'done' to finish"
         
-        # Extract title and moral from history
-        title = state.values.get("title")
-        moral = state.values.get("moral")
-        
-        if not title:
-            # Try to extract from history
-            for item in state.values.get("history", []):
-                if item.startswith("Title: "):
-                    title = item.replace("Title: ", "")
-                    break
-        
-        if not moral:
-            # Try to extract from history
-            for item in state.values.get("history", []):
-                if item.startswith("Moral: "):
-                    moral = item.replace("Moral: ", "")
-                    break
+        if summary is None:
+            summary = await session_index.arebuild(session_id, state.values, paused=requires_feedback)
+        response.headers["ETag"] = etag(summary)
+        title, moral = title_and_moral(state.values)
         
         return SessionResponse(
             session_id=session_id,
@@ -255,14 +399,350 @@ async def get_session(session_id: str):
             requires_feedback=requires_feedback,
             story_complete=not requires_feedback
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in get_session: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/session/{session_id}/summary")
+async def get_session_summary(session_id: str, request: Request, response: Response):
+    """Status, revision count, title, moral and story hash of a session,
+    served from the session index (for polling)."""
+    summary = await session_index.aget(session_id)
+    if summary is None:
+        # Sessions from before the index existed are backfilled once
+        state = await hot_sessions.get(session_id)
+        if not state.values:
+            raise HTTPException(status_code=404, detail="Session not found")
+        summary = await session_index.arebuild(session_id, state.values, paused=bool(state.next))
+    if _not_modified(request, etag(summary)):
+        return Response(status_code=304, headers={"ETag": etag(summary)})
+    response.headers["ETag"] = etag(summary)
+    return summary
+
+# -----------------------------
+# Streaming (Server-Sent Events)
+# -----------------------------
+# Nodes whose LLM output is the story itself; their tokens are forwarded to
+# the client as they arrive. Other nodes only report transitions.
+STREAMED_NODES = {"generate_story", "revise_story"}
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _stream_graph(graph_input, session_id: str, remember=None):
+    """Run the graph to the next interrupt, yielding SSE frames.
+
+    Emits `token` events for story text (tagged with the paragraph index
+    during incremental revisions), `node` events when a node finishes, and a
+    final `done` event carrying the same payload as the JSON endpoints,
+    which is also passed to `remember` (a coroutine function) if given.
+    """
+    config = {"configurable": {"thread_id": session_id}}
+    yield _sse("session", {"session_id": session_id})
+    state = None
+    try:
+        async for mode, chunk in graph.astream(graph_input, config, stream_mode=["messages", "updates", "values", "tasks"]):
+            if mode == "messages":
+                message, metadata = chunk
+                node = metadata.get("langgraph_node")
+                step = metadata.get("revision_step")
+                if node in STREAMED_NODES and message.content and step != "locate":
+                    # Incremental revisions stream their paragraphs interleaved
+                    token = {"node": node, "text": message.content}
+                    if step == "paragraph":
+                        token["paragraph"] = metadata["paragraph"]
+                    yield _sse("token", token)
+            elif mode == "updates":
+                await session_index.aobserve(session_id, chunk)
+                for node in chunk:
+                    if node != "__interrupt__":
+                        yield _sse("node", {"node": node})
+            else:
+                state = follow(state, mode, chunk)
+
+        state = await _finish(session_id, state)
+        output = state.values
+        requires_feedback = bool(state.next)
+        if requires_feedback:
+            speculator.start(session_id, output.get("story"))
+        response = SessionResponse(
+            session_id=session_id,
+            story=output.get("story"),
+            title=output.get("title"),
+            moral=output.get("moral"),
+            revision_count=output.get("revision_count", 0),
+            history=output.get("history", []),
+            requires_feedback=requires_feedback,
+            story_complete=not requires_feedback,
+            message="Provide feedback or 'done'" if requires_feedback else "Story finalized!",
+            status="awaiting_feedback" if requires_feedback else "completed"
+        )
+        if remember:
+            await remember(response.model_dump())
+        yield _sse("done", response.model_dump())
+    except Exception as e:
+        print(f"Error in stream for {session_id}: {e}")
+        yield _sse("error", {"detail": str(e)})
+
+def _event_stream(generator) -> StreamingResponse:
+    return StreamingResponse(
+        generator,
+        media_type="text/event-stream",
+        # Disable proxy buffering so tokens are flushed immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/api/stream/start")
+async def stream_start_story(request: StoryRequest):
+    session_id = request.session_id or str(uuid.uuid4())
+    initial_state = {
+        "prompt": request.prompt,
+        "story": "",
+        "feedback": None,
+        "revision_count": 0,
+        "history": [],
+        "session_id": session_id,
+        "messages":[]
+    }
+    return _event_stream(_locked_stream(lambda: initial_state, session_id))
+
+async def _locked_stream(graph_input, session_id: str, idempotency=None):
+    """_stream_graph under the session's lock, for the input `graph_input()`
+    returns once the lock is held. With an idempotency (key, fingerprint,
+    source) whose result is stored by the time the lock is free, that result
+    is sent as the `done` event instead."""
+    try:
+        async with session_locks.hold(session_id):
+            stored = await _recall(*idempotency) if idempotency else None
+            if stored is not None:
+                frames = _replayed(session_id, stored)
+            else:
+                remember = functools.partial(session_locks.aremember, *idempotency[:2]) if idempotency else None
+                frames = _stream_graph(graph_input(), session_id, remember)
+            async for frame in frames:
+                yield frame
+    except (SessionBusy, HTTPException) as e:
+        yield _sse("error", {"detail": getattr(e, "detail", None) or str(e)})
+
+@app.post("/api/stream/feedback")
+async def stream_feedback(request: FeedbackRequest, idempotency_key: Annotated[Optional[str], Header()] = None):
+    state = await hot_sessions.get(request.session_id)
+    if not state.values:
+        raise HTTPException(status_code=404, detail="Session not found")
+    idempotency = _idempotency(request, state, idempotency_key)
+    stored = await _recall(*idempotency)
+    if stored is not None:
+        return _event_stream(_replayed(request.session_id, stored))
+    # Resumed only once the lock is held: cancelling speculation earlier
+    # would pull it from under a "done" run still holding the session
+    resume = functools.partial(_resume, request.session_id, request.feedback)
+    return _event_stream(_locked_stream(resume, request.session_id, idempotency))
+
+async def _replayed(session_id: str, stored: dict):
+    yield _sse("session", {"session_id": session_id})
+    yield _sse("done", stored)
+
+# -----------------------------
+# Background jobs
+# -----------------------------
+# The same runs as /api/start and /api/feedback, queued (see jobs.py): the
+# POST answers 202 with a job id, and the result is the response the
+# synchronous endpoint would have returned.
+
+async def _submit(kind: str, session_id: str, run, webhook_url: Optional[str], response: Response) -> dict:
+    if webhook_url:
+        try:
+            await check_webhook(webhook_url)
+        except WebhookRejected as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    try:
+        job = jobs.submit(kind, session_id, run, webhook_url)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Job queue is full", headers={"Retry-After": "5"})
+    response.headers["Location"] = f"/api/jobs/{job.job_id}"
+    return {**job.view(), "position": jobs.position(job)}
+
+def _job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/api/jobs/start", status_code=202)
+async def job_start(request: StoryRequest, response: Response):
+    """Queue a new story; returns its job id without waiting for the model"""
+    story = StoryRequest(prompt=request.prompt, session_id=request.session_id or str(uuid.uuid4()))
+
+    async def run():
+        return (await start_story(story)).model_dump()
+
+    return await _submit("start", story.session_id, run, request.webhook_url, response)
+
+@app.post("/api/jobs/feedback", status_code=202)
+async def job_feedback(request: FeedbackRequest, response: Response,
+                       idempotency_key: Annotated[Optional[str], Header()] = None):
+    """Queue feedback (or "done") for a paused session. Runs like
+    /api/feedback, Idempotency-Key included"""
+    state = await hot_sessions.get(request.session_id)
+    if not state.values:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    async def run():
+        return (await provide_feedback(request, idempotency_key)).model_dump()
+
+    return await _submit("feedback", request.session_id, run, request.webhook_url, response)
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """Status and, once done, result of a job. With `wait` (seconds, up to
+    JOB_LONG_POLL_SECONDS) the request is held until the job finishes"""
+    job = _job(job_id)
+    if wait > 0:
+        await jobs.wait(job, min(wait, JOB_LONG_POLL_SECONDS))
+    return {**job.view(), "position": jobs.position(job)}
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """SSE: a `job` event now and on every status change, the last one
+    carrying the result"""
+    job = _job(job_id)
+
+    async def events():
+        async for view in jobs.follow(job):
+            yield _sse("job", view)
+
+    return _event_stream(events())
+
+# -----------------------------
+# Batch generation (JSON lines)
+# -----------------------------
+async def _batch_lines(batch_id: str, concurrency: int):
+    """One JSON object per line: the batch's progress, every item as it
+    finishes (items finished by an earlier run first, marked resumed), and a
+    final summary."""
+    yield json.dumps({"event": "batch", **await batch_store.aprogress(batch_id)}) + "\n"
+    for item in await batch_store.aitems(batch_id, status="done"):
+        yield json.dumps({"event": "item", "index": item["index"], "prompt": item["prompt"], "status": "done",
+                          "result": item["result"], "resumed": True}) + "\n"
+    try:
+        # Batch items answer the interrupt right away: nothing to speculate
+        # on, and no reason to push interactive sessions out of memory
+        run = functools.partial(_run_graph, speculate=False, hot=False)
+        async for record in run_batch(batch_store, batch_id, concurrency, graph, run):
+            yield json.dumps({"event": "item", **record}) + "\n"
+    except Exception as e:
+        print(f"Error in batch {batch_id}: {e}")
+        yield json.dumps({"event": "error", "detail": str(e)}) + "\n"
+    yield json.dumps({"event": "summary", **await batch_store.aprogress(batch_id)}) + "\n"
+
+@app.post("/api/batch")
+async def batch_generate(request: BatchRequest):
+    """Generate stories for many prompts without human feedback, streamed
+    back as JSON lines. Posting the same prompts (or the batch_id) again
+    resumes an interrupted batch."""
+    if request.mode not in ("graph", "static"):
+        raise HTTPException(status_code=400, detail="mode must be 'graph' or 'static'")
+    try:
+        batch_id = await batch_store.aopen(request.prompts, {"mode": request.mode, "feedback": request.feedback}, request.batch_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    concurrency = max(1, min(request.concurrency, BATCH_MAX_CONCURRENCY))
+    return StreamingResponse(_batch_lines(batch_id, concurrency), media_type="application/x-ndjson")
+
+@app.get("/api/batch/{batch_id}")
+async def batch_progress(batch_id: str):
+    try:
+        return await batch_store.aprogress(batch_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+@app.get("/api/admin/cache")
+async def cache_stats():
+    """Hit/miss counters and sizes of the LLM response cache"""
+    from graph_nodes import get_response_cache
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **response_cache.stats()}
+
+@app.get("/api/admin/semantic-cache")
+async def semantic_cache_stats():
+    """Hit ratio, similarity of the best matches and generation time saved
+    by the semantic prompt cache, for tuning SEMANTIC_CACHE_THRESHOLD"""
+    from graph_nodes import get_semantic_cache
+    cache = get_semantic_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@app.get("/api/admin/sessions")
+async def hot_session_stats():
+    """Sessions whose state is held in memory, their estimated size against
+    HOT_SESSIONS_MAX_MB and the hit ratio of reads"""
+    return hot_sessions.stats()
+
+@app.get("/api/admin/ratelimit")
+async def rate_limit_stats():
+    """Remaining Gemini budget and callers waiting for it, by priority; routed
+    models other than LLM_MODEL have their own budget under `models`"""
+    from rate_limiter import limiter, limiters
+    return {**limiter.stats(), "models": {model: other.stats() for model, other in list(limiters.items())}}
+
+@app.get("/api/admin/routes")
+async def route_stats():
+    """Model route of each node, with latency, fallbacks, hedges and cost per model"""
+    from model_router import router
+    return router.stats()
+
+@app.get("/api/admin/speculation")
+async def speculation_stats():
+    """Sessions holding speculative title/moral and the tokens they used or wasted"""
+    return speculator.stats()
+
+@app.get("/api/admin/locks")
+async def lock_stats():
+    """Sessions locked by a run, requests waiting behind them and how long they waited"""
+    return session_locks.stats()
+
+@app.get("/api/admin/jobs")
+async def job_stats():
+    """Background job queue: depth, running jobs and wait/run time percentiles"""
+    return jobs.stats()
+
+@app.get("/api/admin/clients")
+async def client_stats():
+    """Shared LLM clients: connections opened vs reused and setup time saved"""
+    return clients.stats()
+
+@app.post("/api/admin/compact")
+async def compact_checkpoints(vacuum: bool = True):
+    """Run checkpoint compaction now and report what was reclaimed"""
+    if compactor is None:
+        raise HTTPException(status_code=400, detail=f"Compaction only applies to the sqlite backend, not {CHECKPOINT_BACKEND}")
+    return await asyncio.to_thread(compactor.run, vacuum)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint: node latency, errors, in-flight nodes and
+    LLM calls, tokens and estimated cost"""
+    from metrics import registry
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/admin/traces/{session_id}")
+async def session_traces(session_id: str):
+    """Recent node spans of one session, oldest first"""
+    from metrics import spans_for
+    return {"session_id": session_id, "spans": spans_for(session_id)}
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if API_WORKERS > 1 and CHECKPOINT_BACKEND == "sqlite":
+        print(f"{API_WORKERS} workers sharing {DB_PATH}: sessions are shared on this host only")
+    # Worker processes import the app themselves, so it is passed by name
+    uvicorn.run("app:app" if API_WORKERS > 1 else app, host=API_HOST, port=API_PORT, workers=API_WORKERS)
\ No newline at end of file
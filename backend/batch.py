@@ -0,0 +1,464 @@
+"""Batch story generation.
+
+Runs a list of prompts with bounded concurrency and no human in the loop,
+yielding one result per prompt as it finishes. Progress is stored per item,
+so running the same batch again only does the work that is left.
+
+As a CLI (one prompt per line, or JSONL objects with a "prompt" key):
+
+    python batch.py prompts.txt --out stories.jsonl --concurrency 8
+
+Rerunning the same command after an interruption resumes the batch.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from typing import AsyncIterator, List, Optional
+
+from langgraph.types import Command
+
+from config import BATCH_DB, BATCH_MAX_ATTEMPTS, BATCH_STALE_SECONDS
+from rate_limiter import llm_priority
+
+# -----------------------------
+# Progress store
+# -----------------------------
+# One row per prompt. Items move pending -> running -> done | failed; a
+# rerun picks up everything that is not done (failed items up to
+# BATCH_MAX_ATTEMPTS times). In graph mode each item is also a checkpointed
+# thread, so an item interrupted mid-run continues from its last node.
+#
+# Runs claim items one UPDATE at a time, tagged with the run's owner id, so
+# two runs of one batch (two requests, two workers) never take the same
+# item. A run keeps its items' rows fresh while it works on them; rows left
+# running by a run that crashed go back to pending after
+# BATCH_STALE_SECONDS, and items out of attempts are marked failed.
+#
+# Every write may wait out another process's lock on BATCH_DB, so the async
+# runner goes through the a* twins below, which run in a thread.
+
+
+def batch_id_for(prompts: List[str], options: dict) -> str:
+    """Same prompts and options, same batch: resubmitting resumes it."""
+    payload = json.dumps({"prompts": prompts, "options": options}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class BatchStore:
+    def __init__(self, path: str = BATCH_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS batches (
+                batch_id TEXT PRIMARY KEY,
+                options TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS batch_items (
+                batch_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                prompt TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                owner TEXT,
+                PRIMARY KEY (batch_id, idx)
+            );
+            """
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(batch_items)")]
+        if "owner" not in columns:
+            # Stores created before runs claimed their items
+            with self._conn:
+                self._conn.execute("ALTER TABLE batch_items ADD COLUMN owner TEXT")
+
+    def open(self, prompts: List[str], options: dict, batch_id: Optional[str] = None) -> str:
+        """Creates the batch, or returns the existing one with this id."""
+        batch_id = batch_id or batch_id_for(prompts, options)
+        with self._lock, self._conn:
+            exists = self._conn.execute("SELECT 1 FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+            if exists:
+                return batch_id
+            if not prompts:
+                raise KeyError(batch_id)
+            now = time.time()
+            self._conn.execute(
+                "INSERT INTO batches (batch_id, options, total, created_at) VALUES (?, ?, ?, ?)",
+                (batch_id, json.dumps(options), len(prompts), now),
+            )
+            self._conn.executemany(
+                "INSERT INTO batch_items (batch_id, idx, prompt, status, updated_at) VALUES (?, ?, ?, 'pending', ?)",
+                [(batch_id, i, prompt, now) for i, prompt in enumerate(prompts)],
+            )
+        return batch_id
+
+    def options(self, batch_id: str) -> dict:
+        with self._lock:
+            row = self._conn.execute("SELECT options FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        if row is None:
+            raise KeyError(batch_id)
+        return json.loads(row[0])
+
+    def items(self, batch_id: str, status: Optional[str] = None) -> List[dict]:
+        query = "SELECT idx, prompt, status, attempts, result, error FROM batch_items WHERE batch_id = ?"
+        params = [batch_id]
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY idx", params).fetchall()
+        return [
+            {"index": idx, "prompt": prompt, "status": item_status, "attempts": attempts,
+             "result": json.loads(result) if result else None, "error": error}
+            for idx, prompt, item_status, attempts, result, error in rows
+        ]
+
+    def todo(self, batch_id: str, max_attempts: int = BATCH_MAX_ATTEMPTS) -> List[dict]:
+        return [
+            item for item in self.items(batch_id)
+            if item["status"] != "done" and item["attempts"] < max_attempts
+        ]
+
+    # -----------------------------
+    # Claiming items
+    # -----------------------------
+    def recover(self, batch_id: str, max_attempts: int = BATCH_MAX_ATTEMPTS,
+                stale_after: float = BATCH_STALE_SECONDS) -> None:
+        """Hands back items whose run stopped checking in, and fails the ones
+        that have used up their attempts."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE batch_items SET status = 'pending', owner = NULL "
+                "WHERE batch_id = ? AND status = 'running' AND updated_at < ?",
+                (batch_id, time.time() - stale_after),
+            )
+            self._conn.execute(
+                "UPDATE batch_items SET status = 'failed', updated_at = ?, "
+                "error = COALESCE(error, 'gave up after ' || attempts || ' attempts') "
+                "WHERE batch_id = ? AND status = 'pending' AND attempts >= ?",
+                (time.time(), batch_id, max_attempts),
+            )
+
+    def claim(self, batch_id: str, owner: str, limit: int = 1, max_attempts: int = BATCH_MAX_ATTEMPTS) -> List[dict]:
+        """Marks up to `limit` items running for `owner` and returns them.
+        Items the owner already tried (and failed) are left to a later run."""
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "UPDATE batch_items SET status = 'running', owner = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE batch_id = ? AND idx IN ("
+                "  SELECT idx FROM batch_items WHERE batch_id = ? AND attempts < ? AND owner IS NOT ? "
+                "  AND status IN ('pending', 'failed') ORDER BY idx LIMIT ?"
+                ") RETURNING idx, prompt, attempts",
+                (owner, time.time(), batch_id, batch_id, max_attempts, owner, limit),
+            ).fetchall()
+        return [{"index": idx, "prompt": prompt, "attempts": attempts} for idx, prompt, attempts in sorted(rows)]
+
+    def touch(self, batch_id: str, owner: str) -> None:
+        """Tells other runs the owner's running items are still alive."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE batch_items SET updated_at = ? WHERE batch_id = ? AND owner = ? AND status = 'running'",
+                (time.time(), batch_id, owner),
+            )
+
+    def release(self, batch_id: str, owner: str) -> None:
+        """Puts the owner's unfinished items back, without counting the attempt."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE batch_items SET status = 'pending', owner = NULL, attempts = attempts - 1, updated_at = ? "
+                "WHERE batch_id = ? AND owner = ? AND status = 'running'",
+                (time.time(), batch_id, owner),
+            )
+
+    def mark(self, batch_id: str, index: int, status: str, result: Optional[dict] = None, error: Optional[str] = None) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE batch_items SET status = ?, result = ?, error = ?, updated_at = ?, "
+                "attempts = attempts + ? WHERE batch_id = ? AND idx = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(),
+                 1 if status == "running" else 0, batch_id, index),
+            )
+
+    def progress(self, batch_id: str) -> dict:
+        with self._lock:
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM batch_items WHERE batch_id = ? GROUP BY status", (batch_id,)
+            ).fetchall())
+        total = sum(counts.values())
+        if not total:
+            raise KeyError(batch_id)
+        return {"batch_id": batch_id, "total": total, **{s: counts.get(s, 0) for s in ("pending", "running", "done", "failed")}}
+
+    # -----------------------------
+    # Async interface (off the event loop)
+    # -----------------------------
+    async def aopen(self, prompts: List[str], options: dict, batch_id: Optional[str] = None) -> str:
+        return await asyncio.to_thread(self.open, prompts, options, batch_id)
+
+    async def aoptions(self, batch_id: str) -> dict:
+        return await asyncio.to_thread(self.options, batch_id)
+
+    async def aitems(self, batch_id: str, status: Optional[str] = None) -> List[dict]:
+        return await asyncio.to_thread(self.items, batch_id, status)
+
+    async def aprogress(self, batch_id: str) -> dict:
+        return await asyncio.to_thread(self.progress, batch_id)
+
+    async def arecover(self, batch_id: str) -> None:
+        await asyncio.to_thread(self.recover, batch_id)
+
+    async def aclaim(self, batch_id: str, owner: str, limit: int = 1) -> List[dict]:
+        return await asyncio.to_thread(self.claim, batch_id, owner, limit)
+
+    async def atouch(self, batch_id: str, owner: str) -> None:
+        await asyncio.to_thread(self.touch, batch_id, owner)
+
+    async def arelease(self, batch_id: str, owner: str) -> None:
+        await asyncio.to_thread(self.release, batch_id, owner)
+
+    async def amark(self, batch_id: str, index: int, status: str, result: Optional[dict] = None,
+                    error: Optional[str] = None) -> None:
+        await asyncio.to_thread(self.mark, batch_id, index, status, result, error)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+# -----------------------------
+# Workers
+# -----------------------------
+async def graph_item(graph, run, batch_id: str, item: dict, feedback: List[str]) -> dict:
+    """Runs one prompt through the story graph, answering the feedback
+    interrupts with `feedback` in order and then "done"."""
+    session_id = f"batch-{batch_id}-{item['index']}"
+    config = {"configurable": {"thread_id": session_id}}
+
+    state = await graph.aget_state(config)
+    if not state.values:
+        state = await run({
+            "prompt": item["prompt"],
+            "story": "",
+            "feedback": None,
+            "revision_count": 0,
+            "history": [],
+            "session_id": session_id,
+            "messages": [],
+        }, config)
+    # Bounded: one step per feedback round, "done", and a possible restart
+    for _ in range(len(feedback) + 3):
+        if not state.next:
+            break
+        if any(task.interrupts for task in state.tasks):
+            round_ = state.values.get("revision_count", 0)
+            state = await run(Command(resume=feedback[round_] if round_ < len(feedback) else "done"), config)
+        else:
+            # Stopped mid-run by a crash or restart: continue from the checkpoint
+            state = await run(None, config)
+    if state.next:
+        raise RuntimeError(f"session {session_id} did not finish")
+
+    values = state.values
+    return {
+        "session_id": session_id,
+        "story": values.get("story"),
+        "title": values.get("title"),
+        "moral": values.get("moral"),
+        "revision_count": values.get("revision_count", 0),
+    }
+
+
+def _text(response) -> Optional[str]:
+    return getattr(response, "content", None)
+
+
+async def static_chunk(items: List[dict], feedback: List[str], concurrency: int) -> List[dict]:
+    """Runs a chunk of prompts stage by stage with static_workflow's prompts:
+    one batched model call per stage instead of one call chain per prompt."""
+    import static_workflow
+
+    # Queued behind interactive sessions by the rate limiter
+    llm = static_workflow.model("batch")
+    config = {"max_concurrency": concurrency}
+    results: List[dict] = [{"revision_count": 0} for _ in items]
+    live = list(range(len(items)))
+
+    def settle(indexes, responses, key):
+        still_live = []
+        for i, response in zip(indexes, responses):
+            if isinstance(response, Exception):
+                results[i] = {"error": f"{key}: {response!r}"}
+            else:
+                results[i][key] = _text(response)
+                still_live.append(i)
+        return still_live
+
+    drafts = await llm.abatch([static_workflow.story_messages(items[i]["prompt"]) for i in live], config, return_exceptions=True)
+    live = settle(live, drafts, "story")
+    for text in feedback:
+        revisions = await llm.abatch(
+            [static_workflow.revision_messages(results[i]["story"], text) for i in live], config, return_exceptions=True
+        )
+        for i in live:
+            results[i]["revision_count"] += 1
+        live = settle(live, revisions, "story")
+    finals = await llm.abatch(
+        [static_workflow.title_messages(results[i]["story"]) for i in live]
+        + [static_workflow.moral_messages(results[i]["story"]) for i in live],
+        config,
+        return_exceptions=True,
+    )
+    settle(live, finals[:len(live)], "title")
+    settle(live, finals[len(live):], "moral")
+    return results
+
+
+# -----------------------------
+# Runner
+# -----------------------------
+async def run_batch(store: BatchStore, batch_id: str, concurrency: int, graph=None, run=None) -> AsyncIterator[dict]:
+    """Works through the batch's remaining items, yielding each item's record
+    (index, prompt, status, result or error) as soon as it is stored.
+
+    Graph mode needs the compiled async `graph` and a `run(input, config)`
+    coroutine that runs it to the next interrupt and returns the state.
+    """
+    options = await store.aoptions(batch_id)
+    feedback = options.get("feedback", [])
+    owner = uuid.uuid4().hex
+    await store.arecover(batch_id)
+
+    async def finished(item: dict, result: dict) -> dict:
+        if "error" in result:
+            await store.amark(batch_id, item["index"], "failed", error=result["error"])
+            return {"index": item["index"], "prompt": item["prompt"], "status": "failed", "error": result["error"]}
+        await store.amark(batch_id, item["index"], "done", result=result)
+        return {"index": item["index"], "prompt": item["prompt"], "status": "done", "result": result}
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(BATCH_STALE_SECONDS / 3)
+            await store.atouch(batch_id, owner)
+
+    beating = asyncio.create_task(heartbeat())
+    try:
+        if options.get("mode") == "static":
+            while True:
+                chunk = await store.aclaim(batch_id, owner, limit=concurrency)
+                if not chunk:
+                    return
+                for item, result in zip(chunk, await static_chunk(chunk, feedback, concurrency)):
+                    yield await finished(item, result)
+
+        records: asyncio.Queue = asyncio.Queue()
+
+        async def work() -> None:
+            # Each task has its own context: this only affects this worker's calls
+            llm_priority.set("batch")
+            while True:
+                claimed = await store.aclaim(batch_id, owner)
+                if not claimed:
+                    return
+                item = claimed[0]
+                try:
+                    result = await graph_item(graph, run, batch_id, item, feedback)
+                except Exception as e:
+                    result = {"error": repr(e)}
+                records.put_nowait(await finished(item, result))
+
+        def stopped(future) -> None:
+            # Marks a cancellation as seen; errors are raised by result() below
+            if not future.cancelled():
+                future.exception()
+            records.put_nowait(None)
+
+        workers = asyncio.gather(*(work() for _ in range(concurrency)))
+        workers.add_done_callback(stopped)
+        try:
+            while (record := await records.get()) is not None:
+                yield record
+            workers.result()
+        finally:
+            workers.cancel()
+    finally:
+        # A client that disconnects stops the batch; its unfinished items go
+        # back to pending for the next run
+        beating.cancel()
+        await asyncio.shield(store.arelease(batch_id, owner))
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def read_prompts(path: str) -> List[str]:
+    prompts = []
+    with (sys.stdin if path == "-" else open(path, encoding="utf-8")) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            prompts.append(json.loads(line)["prompt"] if line.startswith("{") else line)
+    return prompts
+
+
+async def main_async(args) -> int:
+    prompts = read_prompts(args.prompts)
+    options = {"mode": args.mode, "feedback": args.feedback}
+    store = BatchStore(args.db)
+    batch_id = store.open(prompts, options, args.batch_id)
+    print(f"batch {batch_id}: {store.progress(batch_id)}", file=sys.stderr)
+
+    out = open(args.out, "a", encoding="utf-8") if args.out else sys.stdout
+    try:
+        if args.mode == "graph":
+            from graph_builder import open_async_graph
+
+            async with open_async_graph() as graph:
+                async def run(graph_input, config):
+                    await graph.ainvoke(graph_input, config)
+                    return await graph.aget_state(config)
+
+                async for record in run_batch(store, batch_id, args.concurrency, graph, run):
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+        else:
+            async for record in run_batch(store, batch_id, args.concurrency):
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+    finally:
+        if args.out:
+            out.close()
+    progress = store.progress(batch_id)
+    print(f"batch {batch_id}: {progress}", file=sys.stderr)
+    store.close()
+    return 1 if progress["failed"] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("prompts", help="prompt file, or - for stdin")
+    parser.add_argument("--out", help="append JSONL results here instead of stdout")
+    parser.add_argument("--mode", choices=["static", "graph"], default="static",
+                        help="static: batched model calls per stage; graph: the full story graph per prompt")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--feedback", action="append", default=[],
+                        help="revision feedback applied to every story, in order (repeatable)")
+    parser.add_argument("--batch-id", help="resume this batch instead of the one matching the prompts")
+    parser.add_argument("--db", default=BATCH_DB, help="progress database")
+    sys.exit(asyncio.run(main_async(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Offline performance benchmarks for the story backend.
+
+Run from the backend folder, e.g.:
+
+    python benchmark.py async --sessions 20 --latency 0.3
+    python benchmark.py load --target app --users 50 --jitter 0.5
+
+Every benchmark swaps the Gemini client (in graph_nodes and static_workflow)
+for fake_llm.FakeStoryLLM and points the checkpointer at a throwaway database,
+so no API key or network is needed.
+
+The scenarios live in the benchmarks package, one module per area; each
+registers its own subcommands.
+"""
+import argparse
+import asyncio
+
+from benchmarks import api, caches, load, models, runtime, sessions, storage, text
+from benchmarks.common import install_fake_llm, use_temp_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    for module in (load, api, sessions, caches, storage, models, text, runtime):
+        module.register(sub)
+
+    args = parser.parse_args()
+    if getattr(args, "needs_db", False):
+        use_temp_db(cache=getattr(args, "cache", False))
+    if getattr(args, "needs_llm", True):
+        install_fake_llm(
+            getattr(args, "latency", 0.05),
+            getattr(args, "token_delay", 0.0),
+            getattr(args, "jitter", 0.0),
+            getattr(args, "seed", 0),
+        )
+
+    result = args.func(args)
+    if asyncio.iscoroutine(result):
+        asyncio.run(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Benchmark scenarios, one module per area; see benchmark.py for the CLI."""
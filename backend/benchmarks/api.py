@@ -0,0 +1,226 @@
+"""Latency of the API's story features: streaming, the title/moral
+fan-out, paragraph revisions, speculation and session reads."""
+import asyncio
+import random
+import time
+
+from benchmarks.common import report, latency_row
+
+
+# -----------------------------
+# stream: time to first byte over SSE
+# -----------------------------
+async def bench_stream(args):
+    """Compares time-to-first-token on /api/stream/start with the blocking
+    /api/start response time, using the same fake model."""
+    import app
+
+    ttft, stream_total, blocking = [], [], []
+    async with app.lifespan(app.app):
+        for i in range(args.sessions):
+            start = time.perf_counter()
+            response = await app.stream_start_story(app.StoryRequest(prompt=f"a lighthouse keeper #{i}"))
+            first = None
+            async for frame in response.body_iterator:
+                if first is None and frame.startswith("event: token"):
+                    first = time.perf_counter() - start
+            stream_total.append(time.perf_counter() - start)
+            ttft.append(first)
+
+            start = time.perf_counter()
+            await app.start_story(app.StoryRequest(prompt=f"a lighthouse keeper #{i}"))
+            blocking.append(time.perf_counter() - start)
+
+    report(f"SSE streaming (n={args.sessions}, first token {args.latency}s, {args.token_delay}s/token)", [
+        ("stream time to first token", f"{sum(ttft) / len(ttft):.3f}s"),
+        ("stream time to done", f"{sum(stream_total) / len(stream_total):.3f}s"),
+        ("blocking /api/start", f"{sum(blocking) / len(blocking):.3f}s"),
+    ])
+
+
+# -----------------------------
+# finalize: title + moral fan-out
+# -----------------------------
+async def bench_finalize(args):
+    """Times finalization ("done") and compares /api/enhance with title and
+    moral requested one after the other vs enhancement_type="both"."""
+    import app
+
+    done, sequential, both = [], [], []
+    async with app.lifespan(app.app):
+        for i in range(args.sessions):
+            started = await app.start_story(app.StoryRequest(prompt=f"a clockmaker's apprentice #{i}"))
+            start = time.perf_counter()
+            await app.provide_feedback(app.FeedbackRequest(session_id=started.session_id, feedback="done"))
+            done.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for kind in ("title", "moral"):
+                await app.enhance_story(app.EnhancementRequest(session_id=started.session_id, enhancement_type=kind))
+            sequential.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await app.enhance_story(app.EnhancementRequest(session_id=started.session_id, enhancement_type="both"))
+            both.append(time.perf_counter() - start)
+
+    report(f"finalization (n={args.sessions}, fake latency={args.latency}s)", [
+        ("feedback 'done' (fan-out)", f"{sum(done) / len(done):.3f}s"),
+        ("enhance title, then moral", f"{sum(sequential) / len(sequential):.3f}s"),
+        ("enhance both", f"{sum(both) / len(both):.3f}s"),
+    ])
+
+
+# -----------------------------
+# revise: full rewrites vs paragraph-level revisions
+# -----------------------------
+async def bench_revise(args):
+    """Revision latency and output tokens with REVISION_MODE full vs
+    incremental. The fake streams --token-delay seconds per output token, so
+    a revision costs time in proportion to what the model writes, as with
+    the real one."""
+    import app
+    import graph_nodes
+    from fake_llm import FakeStoryLLM
+
+    output_tokens = []
+
+    class MeteredLLM(FakeStoryLLM):
+        def _reply(self, messages, tools):
+            message = super()._reply(messages, tools)
+            output_tokens.append(message.usage_metadata["output_tokens"])
+            return message
+
+    graph_nodes.llm = MeteredLLM(latency=args.latency, token_delay=args.token_delay)
+    # "change the ending" is located from its wording; "darker" asks the model
+    feedback = ["change the ending", "make it darker"]
+    rows = []
+    for mode in ("full", "incremental"):
+        graph_nodes.REVISION_MODE = mode
+        latencies = []
+        async with app.lifespan(app.app):
+            started = [await app.start_story(app.StoryRequest(prompt=f"a beekeeper's storm #{i}")) for i in range(args.sessions)]
+            del output_tokens[:]
+            for text in feedback:
+                async def revise(session_id):
+                    start = time.perf_counter()
+                    await app.provide_feedback(app.FeedbackRequest(session_id=session_id, feedback=text))
+                    latencies.append(time.perf_counter() - start)
+                await asyncio.gather(*(revise(s.session_id) for s in started))
+        revisions = len(feedback) * args.sessions
+        rows.append((f"{mode}: revision", latency_row(latencies)))
+        rows.append((f"{mode}: output tokens", f"{sum(output_tokens) / revisions:.0f}/revision, {len(output_tokens) / revisions:.1f} calls/revision"))
+    report(f"revise (n={args.sessions}, fake latency={args.latency}s + {args.token_delay}s/token)", rows)
+
+
+# -----------------------------
+# speculate: title/moral generated while the user reads the draft
+# -----------------------------
+async def bench_speculate(args):
+    """Users read each draft for --think seconds, revise it with probability
+    --revise, and finally answer "done". Compares the latency of "done" and
+    the tokens spent with and without speculative finalization."""
+    import app
+    from speculation import speculator
+
+    async def user(i: int, rng: random.Random, done: list):
+        started = await app.start_story(app.StoryRequest(prompt=f"a lighthouse keeper's dog #{i}"))
+        for _ in range(3):
+            await asyncio.sleep(args.think)
+            if rng.random() >= args.revise:
+                break
+            await app.provide_feedback(app.FeedbackRequest(session_id=started.session_id, feedback="make it shorter"))
+        start = time.perf_counter()
+        await app.provide_feedback(app.FeedbackRequest(session_id=started.session_id, feedback="done"))
+        done.append(time.perf_counter() - start)
+
+    rows = []
+    for enabled in (False, True):
+        speculator.enabled = enabled
+        speculator.tokens = {"used": 0, "wasted": 0}
+        done = []
+        async with app.lifespan(app.app):
+            rng = random.Random(args.seed)
+            await asyncio.gather(*(user(i, random.Random(rng.random()), done) for i in range(args.users)))
+        name = "speculative" if enabled else "on demand"
+        rows.append((f"{name}: 'done'", latency_row(done)))
+        if enabled:
+            tokens = speculator.tokens
+            rows.append((f"{name}: tokens", f"used {tokens['used']}, wasted {tokens['wasted']}"))
+    report(f"speculate: {args.users} users, think {args.think}s, revise p={args.revise}, fake latency={args.latency}s", rows)
+
+
+# -----------------------------
+# poll: session reads
+# -----------------------------
+async def _api_session_started(i: int):
+    from app import start_story, StoryRequest
+    return await start_story(StoryRequest(prompt=f"a heron who collects lost buttons #{i}"))
+
+
+async def bench_poll(args):
+    """Per-request latency of polling a session: the full state read, the
+    summary from the session index, and a conditional request answered 304."""
+    import httpx
+    import app
+
+    async with app.lifespan(app.app):
+        sessions = [
+            (await _api_session_started(i)).session_id for i in range(args.sessions)
+        ]
+        transport = httpx.ASGITransport(app=app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def poll(path: str, conditional: bool = False):
+                tags = {}
+                start = time.perf_counter()
+                for _ in range(args.polls):
+                    for session_id in sessions:
+                        headers = {"If-None-Match": tags[session_id]} if session_id in tags else {}
+                        r = await client.get(path.format(session_id), headers=headers)
+                        assert r.status_code in (200, 304), r.status_code
+                        if conditional:
+                            tags[session_id] = r.headers["ETag"]
+                return (time.perf_counter() - start) / (args.polls * len(sessions))
+
+            full = await poll("/api/session/{}")
+            summary = await poll("/api/session/{}/summary")
+            not_modified = await poll("/api/session/{}/summary", conditional=True)
+            full_not_modified = await poll("/api/session/{}", conditional=True)
+
+    report(f"session polling ({args.sessions} sessions x {args.polls} polls)", [
+        ("full state (200)", f"{full * 1000:.3f}ms"),
+        ("summary (200)", f"{summary * 1000:.3f}ms"),
+        ("summary (304)", f"{not_modified * 1000:.3f}ms"),
+        ("full state (304)", f"{full_not_modified * 1000:.3f}ms"),
+    ])
+
+
+def register(sub) -> None:
+    p = sub.add_parser("stream", help="time to first token on the SSE endpoint")
+    p.add_argument("--sessions", type=int, default=5)
+    p.add_argument("--latency", type=float, default=0.3)
+    p.add_argument("--token-delay", type=float, default=0.02)
+    p.set_defaults(func=bench_stream, needs_db=True)
+
+    p = sub.add_parser("finalize", help="title/moral latency with the parallel fan-out")
+    p.add_argument("--sessions", type=int, default=5)
+    p.add_argument("--latency", type=float, default=0.3)
+    p.set_defaults(func=bench_finalize, needs_db=True)
+
+    p = sub.add_parser("revise", help="full-story vs paragraph-level revisions")
+    p.add_argument("--sessions", type=int, default=10)
+    p.add_argument("--latency", type=float, default=0.3)
+    p.add_argument("--token-delay", type=float, default=0.005)
+    p.set_defaults(func=bench_revise, needs_db=True)
+
+    p = sub.add_parser("speculate", help="'done' latency and wasted tokens with speculative title/moral")
+    p.add_argument("--users", type=int, default=20)
+    p.add_argument("--think", type=float, default=1.0, help="seconds a user reads a draft before answering")
+    p.add_argument("--revise", type=float, default=0.5, help="chance of answering with feedback instead of 'done'")
+    p.add_argument("--latency", type=float, default=0.3)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_speculate, needs_db=True)
+
+    p = sub.add_parser("poll", help="full vs summary vs 304 session reads")
+    p.add_argument("--sessions", type=int, default=20)
+    p.add_argument("--polls", type=int, default=20)
+    p.set_defaults(func=bench_poll, needs_db=True, latency=0.0)
@@ -0,0 +1,115 @@
+"""Repeat work answered from the response cache and the semantic prompt
+cache."""
+import random
+import time
+
+from benchmarks.common import report, latency_row
+
+
+# -----------------------------
+# cache: repeat work served from the response cache
+# -----------------------------
+async def bench_cache(args):
+    """Regenerates the same prompt and re-requests title/moral for an
+    unchanged story; everything after the first round should be a hit."""
+    import app
+    import graph_nodes
+
+    rounds = {"start (first)": [], "start (repeat)": [], "enhance (first)": [], "enhance (repeat)": []}
+    async with app.lifespan(app.app):
+        for i in range(args.repeats):
+            label = "first" if i == 0 else "repeat"
+            start = time.perf_counter()
+            started = await app.start_story(app.StoryRequest(prompt="a dragon who is afraid of the dark"))
+            rounds[f"start ({label})"].append(time.perf_counter() - start)
+            await app.provide_feedback(app.FeedbackRequest(session_id=started.session_id, feedback="done"))
+
+            start = time.perf_counter()
+            for kind in ("title", "moral"):
+                await app.enhance_story(app.EnhancementRequest(session_id=started.session_id, enhancement_type=kind))
+            rounds[f"enhance ({label})"].append(time.perf_counter() - start)
+
+    stats = graph_nodes.get_response_cache().stats()
+    report(f"LLM response cache (repeats={args.repeats}, fake latency={args.latency}s)", [
+        *[(name, f"{sum(v) / len(v):.3f}s") for name, v in rounds.items() if v],
+        ("memory hits", stats["hits"]["memory"]),
+        ("sqlite hits", stats["hits"]["sqlite"]),
+        ("misses", stats["misses"]),
+        ("hit ratio", stats["hit_ratio"]),
+    ])
+
+
+# -----------------------------
+# semantic: near-duplicate prompts against the semantic cache
+# -----------------------------
+SEMANTIC_SUBJECTS = [
+    ("brave", "cat", "climbs the tallest tree in town"),
+    ("lazy", "cat", "learns to fish"),
+    ("brave", "dog", "guards a sleeping village"),
+    ("lonely", "robot", "builds a friend from spare parts"),
+    ("curious", "robot", "explores the bottom of the sea"),
+    ("tiny", "dragon", "is afraid of the dark"),
+    ("grumpy", "dragon", "opens a bakery"),
+    ("young", "witch", "loses her broom before the big race"),
+    ("old", "sailor", "finds a map inside a bottle"),
+    ("clever", "fox", "outwits a hungry wolf"),
+]
+SEMANTIC_TEMPLATES = [
+    "a story about a {adj} {noun} who {goal}",
+    "write me a story about a {adj} {noun} who {goal}, please",
+    "tell a short tale of the {adj} {noun} that {goal}",
+    "{adj} {noun} {goal}",
+    "Story: a {adj} {noun} who {goal}.",
+    "a {noun} who {goal}",
+    "the {noun} who {goal} was very {adj}",
+    "once there was a {adj} {noun}; one day it {goal}",
+]
+
+async def bench_semantic(args):
+    """Users ask for the same few stories in different words. For each
+    threshold: hit ratio, start latency, and wrong matches (a draft served
+    for a different story), which is what a too-low threshold costs."""
+    import app
+    import graph_nodes
+    from semantic_cache import SemanticCache
+
+    rng = random.Random(args.seed)
+    picks = [rng.randrange(len(SEMANTIC_SUBJECTS)) for _ in range(args.requests)]
+    requests = [(k, rng.choice(SEMANTIC_TEMPLATES).format(adj=SEMANTIC_SUBJECTS[k][0], noun=SEMANTIC_SUBJECTS[k][1],
+                                                          goal=SEMANTIC_SUBJECTS[k][2])) for k in picks]
+    rows = []
+    for threshold in [None] + args.thresholds:
+        graph_nodes.semantic_cache = SemanticCache(None, threshold=threshold) if threshold is not None else None
+        latencies, wrong = [], 0
+        # Drafts generated for each story; a served draft is the same text
+        subject_of = {}
+        async with app.lifespan(app.app):
+            for subject, prompt in requests:
+                start = time.perf_counter()
+                started = await app.start_story(app.StoryRequest(prompt=prompt))
+                latencies.append(time.perf_counter() - start)
+                if "reused" in started.history[0]:
+                    wrong += subject_of[started.story] != subject
+                else:
+                    subject_of[started.story] = subject
+        if threshold is None:
+            rows.append(("no semantic cache", latency_row(latencies)))
+            continue
+        stats = graph_nodes.semantic_cache.stats()
+        rows.append((f"threshold {threshold}", f"{latency_row(latencies)}  hits {stats['hits'] / len(requests):5.1%}  wrong {wrong}"))
+    graph_nodes.semantic_cache = None
+    report(f"semantic cache: {args.requests} requests for {len(SEMANTIC_SUBJECTS)} stories, fake latency={args.latency}s", rows)
+
+
+def register(sub) -> None:
+    p = sub.add_parser("cache", help="repeat prompts and enhancements against the response cache")
+    p.add_argument("--repeats", type=int, default=5)
+    p.add_argument("--latency", type=float, default=0.3)
+    p.set_defaults(func=bench_cache, needs_db=True, cache=True)
+
+    p = sub.add_parser("semantic", help="hit ratio, latency and wrong matches of the semantic prompt cache by threshold")
+    p.add_argument("--requests", type=int, default=100)
+    p.add_argument("--thresholds", type=float, nargs="+", default=[0.3, 0.5, 0.65, 0.8, 0.95])
+    p.add_argument("--latency", type=float, default=0.3)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_semantic, needs_db=True)
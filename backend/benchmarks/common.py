@@ -0,0 +1,69 @@
+"""Helpers shared by the benchmark modules."""
+import os
+import sys
+import tempfile
+
+# The CLI, started again by benchmarks that need more processes
+BENCHMARK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmark.py")
+
+
+# -----------------------------
+# Setup helpers
+# -----------------------------
+def use_temp_db(cache: bool = False):
+    # Must run before config is imported
+    root = tempfile.mkdtemp(prefix="story-bench-")
+    os.environ["STORIES_DB"] = os.path.join(root, "stories.db")
+    os.environ["LLM_CACHE_DB"] = os.path.join(root, "llm_cache.db")
+    # Only the cache benchmark wants repeat calls answered from the cache
+    os.environ["LLM_CACHE_ENABLED"] = "true" if cache else "false"
+
+
+def install_fake_llm(latency: float, token_delay: float = 0.0, jitter: float = 0.0, seed: int = 0):
+    import graph_nodes
+    import static_workflow
+    from fake_llm import FakeStoryLLM
+    from rate_limiter import limiter
+    fake = FakeStoryLLM(latency=latency, token_delay=token_delay, jitter=jitter, seed=seed)
+    graph_nodes.llm = fake
+    static_workflow.llm = fake
+    # The fake has no quota to protect (bench_ratelimit sets its own)
+    limiter.configure(rpm=0, tpm=0)
+
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def report(title: str, rows):
+    print(f"\n{title}")
+    print("-" * len(title))
+    width = max(len(name) for name, _ in rows)
+    for name, value in rows:
+        print(f"{name.ljust(width)}  {value}")
+
+
+def percentile(samples, q: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(samples)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def latency_row(samples) -> str:
+    return (f"n={len(samples):<4} p50 {percentile(samples, 0.5) * 1000:8.1f}ms  "
+            f"p95 {percentile(samples, 0.95) * 1000:8.1f}ms  p99 {percentile(samples, 0.99) * 1000:8.1f}ms")
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        # Peak instead of current where /proc is unavailable (macOS: bytes)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
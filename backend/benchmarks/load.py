@@ -0,0 +1,298 @@
+"""End-to-end load: simulated users through the API, the graph or the
+static workflow, in one process or spread over several API workers."""
+import asyncio
+import os
+import sys
+import time
+
+from benchmarks.common import free_port, report, latency_row, rss_mb, BENCHMARK
+
+
+# -----------------------------
+# load: simulated users end to end
+# -----------------------------
+# Each user starts a story, sends `feedback` rounds of feedback, finishes with
+# "done" and (through the API) asks for a title and moral. All users run at
+# once; every step's latency is recorded under its name.
+async def _app_user(client, i: int, rounds: int, timings: dict):
+    async def call(step: str, path: str, body: dict) -> dict:
+        start = time.perf_counter()
+        response = await client.post(path, json=body)
+        timings.setdefault(step, []).append(time.perf_counter() - start)
+        response.raise_for_status()
+        return response.json()
+
+    session_id = (await call("start", "/api/start", {"prompt": f"a lantern maker's apprentice #{i}"}))["session_id"]
+    for n in range(rounds):
+        await call("feedback", "/api/feedback", {"session_id": session_id, "feedback": f"add more wonder, round {n}"})
+    await call("done", "/api/feedback", {"session_id": session_id, "feedback": "done"})
+    await call("enhance", "/api/enhance", {"session_id": session_id, "enhancement_type": "both"})
+
+
+async def _graph_user(graph, i: int, rounds: int, timings: dict):
+    from langgraph.types import Command
+
+    config = {"configurable": {"thread_id": f"load-{i}"}}
+
+    async def call(step: str, graph_input):
+        start = time.perf_counter()
+        await graph.ainvoke(graph_input, config)
+        timings.setdefault(step, []).append(time.perf_counter() - start)
+
+    await call("start", {"prompt": f"a lantern maker's apprentice #{i}", "story": "", "revision_count": 0,
+                         "history": [], "session_id": config["configurable"]["thread_id"], "messages": []})
+    for n in range(rounds):
+        await call("feedback", Command(resume=f"add more wonder, round {n}"))
+    await call("done", Command(resume="done"))
+
+
+def _static_user(i: int, rounds: int, timings: dict):
+    import static_workflow
+
+    def call(step: str, fn, *fn_args):
+        start = time.perf_counter()
+        result = fn(*fn_args)
+        timings.setdefault(step, []).append(time.perf_counter() - start)
+        return result
+
+    story = call("start", static_workflow.generate_story, f"a lantern maker's apprentice #{i}")
+    for n in range(rounds):
+        story = call("feedback", static_workflow.revise_story, story, f"add more wonder, round {n}")
+    call("title", static_workflow.generate_title, story)
+    call("moral", static_workflow.extract_moral, story)
+
+
+async def bench_load(args):
+    """N concurrent simulated users through the FastAPI app, the compiled
+    graph, or the static (no graph) workflow."""
+    import gc
+    import tracemalloc
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    gc.collect()
+    rss_before = rss_mb()
+    timings: dict = {}
+    errors = 0
+
+    async def run_users(user, *user_args):
+        results = await asyncio.gather(
+            *(user(*user_args, i, args.feedback, timings) for i in range(args.users)),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"user failed: {result!r}")
+        return sum(isinstance(result, Exception) for result in results)
+
+    start = time.perf_counter()
+    if args.target == "app":
+        import httpx
+        import app
+
+        async with app.lifespan(app.app):
+            transport = httpx.ASGITransport(app=app.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                start = time.perf_counter()
+                errors = await run_users(_app_user, client)
+    elif args.target == "graph":
+        from graph_builder import open_async_graph
+        from spellcheck import get_engine
+
+        # Warm up like the app's lifespan does
+        await asyncio.to_thread(get_engine)
+        async with open_async_graph() as graph:
+            start = time.perf_counter()
+            errors = await run_users(_graph_user, graph)
+    else:
+        async def static_user(i, rounds, timings):
+            await asyncio.to_thread(_static_user, i, rounds, timings)
+
+        errors = await run_users(static_user)
+    wall = time.perf_counter() - start
+
+    rows = [(step, latency_row(samples)) for step, samples in timings.items()]
+    requests = sum(len(samples) for samples in timings.values())
+    rows += [
+        ("wall time", f"{wall:.2f}s"),
+        ("throughput", f"{(args.users - errors) / wall:.2f} sessions/s, {requests / wall:.1f} requests/s"),
+        ("failed users", str(errors)),
+        ("rss", f"{rss_before:.0f}MB -> {rss_mb():.0f}MB"),
+    ]
+    if args.tracemalloc:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rows.append(("python heap peak", f"{peak / 2**20:.1f}MB"))
+    report(
+        f"load: {args.users} users x {args.feedback} feedback rounds via {args.target} "
+        f"(first token {args.latency}s, jitter {args.jitter})",
+        rows,
+    )
+
+
+# -----------------------------
+# async: concurrent API sessions
+# -----------------------------
+async def _api_session(i: int) -> float:
+    from app import start_story, provide_feedback, StoryRequest, FeedbackRequest
+
+    start = time.perf_counter()
+    started = await start_story(StoryRequest(prompt=f"a fox who learns to swim #{i}"))
+    await provide_feedback(FeedbackRequest(session_id=started.session_id, feedback="done"))
+    return time.perf_counter() - start
+
+
+async def bench_async(args):
+    """Runs start -> done sessions one at a time, then all at once.
+
+    With a non-blocking event loop the concurrent wall time stays close to a
+    single session's latency instead of growing with the session count.
+    """
+    import app
+
+    async with app.lifespan(app.app):
+        start = time.perf_counter()
+        sequential = [await _api_session(i) for i in range(args.sessions)]
+        sequential_wall = time.perf_counter() - start
+
+        start = time.perf_counter()
+        concurrent = await asyncio.gather(*(_api_session(i) for i in range(args.sessions)))
+        concurrent_wall = time.perf_counter() - start
+
+    report(f"async API sessions (n={args.sessions}, fake latency={args.latency}s)", [
+        ("mean session latency", f"{sum(sequential) / len(sequential):.3f}s"),
+        ("sequential wall time", f"{sequential_wall:.3f}s"),
+        ("concurrent wall time", f"{concurrent_wall:.3f}s"),
+        ("overlap speedup", f"{sequential_wall / concurrent_wall:.1f}x"),
+        ("max concurrent session", f"{max(concurrent):.3f}s"),
+    ])
+
+
+# -----------------------------
+# workers: API workers sharing a Redis checkpoint store
+# -----------------------------
+def bench_serve(args):
+    """One API worker with the fake LLM (started by `workers`)."""
+    import uvicorn
+    import app
+
+    uvicorn.run(app.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+class _RoundRobin:
+    """Spreads requests over several workers, one request at a time, so
+    consecutive requests of a session land on different processes."""
+
+    def __init__(self, clients):
+        self.clients = clients
+        self.next = 0
+
+    async def post(self, path: str, json: dict):
+        client = self.clients[self.next % len(self.clients)]
+        self.next += 1
+        return await client.post(path, json=json)
+
+
+async def bench_workers(args):
+    """Session throughput with 1..N API worker processes on one Redis store
+    (fakeredis over TCP as the stand-in), requests spread round-robin with no
+    session affinity."""
+    import socket
+    import subprocess
+    import threading
+    import httpx
+    import redis
+    from fakeredis import TcpFakeServer
+
+    class StandInServer(TcpFakeServer):
+        # Without TCP_NODELAY the stand-in's multi-part replies to pipelines
+        # wait out delayed ACKs (~40ms each); real Redis does not
+        def get_request(self):
+            conn, addr = super().get_request()
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return conn, addr
+
+    redis_port = free_port()
+    server = StandInServer(("127.0.0.1", redis_port), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"redis://127.0.0.1:{redis_port}/0"
+    env = {**os.environ, "CHECKPOINT_BACKEND": "redis", "CHECKPOINT_URL": url, "API_WORKERS": "2"}
+
+    rows = []
+    counts = sorted({1, *(n for n in (2, 4, 8) if n < args.workers), args.workers})
+    for n in counts:
+        redis.Redis.from_url(url).flushdb()
+        ports = [free_port() for _ in range(n)]
+        procs = [
+            subprocess.Popen(
+                [sys.executable, BENCHMARK, "serve", "--port", str(port), "--latency", str(args.latency),
+                 "--jitter", str(args.jitter)],
+                env=env,
+            )
+            for port in ports
+        ]
+        clients = [httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None) for port in ports]
+        try:
+            for client in clients:
+                for _ in range(300):
+                    try:
+                        if (await client.get("/health")).status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    await asyncio.sleep(0.1)
+            timings: dict = {}
+            start = time.perf_counter()
+            results = await asyncio.gather(
+                *(_app_user(_RoundRobin(clients[i % n:] + clients[:i % n]), i, args.feedback, timings)
+                  for i in range(args.users)),
+                return_exceptions=True,
+            )
+            wall = time.perf_counter() - start
+        finally:
+            for client in clients:
+                await client.aclose()
+            for proc in procs:
+                proc.terminate()
+            for proc in procs:
+                proc.wait()
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed:
+            print(f"{len(failed)} users failed, e.g. {failed[0]!r}")
+        rows.append((f"{n} worker{'s' if n > 1 else ''}",
+                     f"{(args.users - len(failed)) / wall:6.2f} sessions/s  start {latency_row(timings.get('start', [0]))}"))
+    server.shutdown()
+    rows.append(("cpu cores", str(os.cpu_count())))
+    report(f"workers: {args.users} users x {args.feedback} feedback rounds, redis checkpoints, no affinity", rows)
+
+
+def register(sub) -> None:
+    p = sub.add_parser("load", help="N concurrent users: start, feedback rounds, done, enhance")
+    p.add_argument("--target", choices=["app", "graph", "static"], default="app")
+    p.add_argument("--users", type=int, default=20)
+    p.add_argument("--feedback", type=int, default=2, help="feedback rounds per user (at most 3 revisions)")
+    p.add_argument("--latency", type=float, default=0.3)
+    p.add_argument("--jitter", type=float, default=0.5, help="log-normal sigma of the model latency")
+    p.add_argument("--token-delay", type=float, default=0.0)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--tracemalloc", action="store_true", help="also report the Python heap peak (slower)")
+    p.set_defaults(func=bench_load, needs_db=True)
+
+    p = sub.add_parser("async", help="concurrent sessions through the async API handlers")
+    p.add_argument("--sessions", type=int, default=10)
+    p.add_argument("--latency", type=float, default=0.3)
+    p.set_defaults(func=bench_async, needs_db=True)
+
+    p = sub.add_parser("workers", help="session throughput vs API worker processes sharing a Redis store")
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--users", type=int, default=40)
+    p.add_argument("--feedback", type=int, default=1)
+    p.add_argument("--latency", type=float, default=0.05)
+    p.add_argument("--jitter", type=float, default=0.0)
+    p.set_defaults(func=bench_workers, needs_llm=False)
+
+    p = sub.add_parser("serve", help="one API worker with the fake LLM (used by workers)")
+    p.add_argument("--port", type=int, default=8000)
+    p.add_argument("--latency", type=float, default=0.05)
+    p.add_argument("--jitter", type=float, default=0.0)
+    p.set_defaults(func=bench_serve, needs_db=True)
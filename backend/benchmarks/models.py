@@ -0,0 +1,252 @@
+"""Calls to the model provider: the rate limiter, the shared client pool
+and per-node routing."""
+import asyncio
+import random
+import time
+
+from benchmarks.common import free_port, report, latency_row
+
+
+# -----------------------------
+# ratelimit: shared limiter vs hitting the quota
+# -----------------------------
+class QuotaError(Exception):
+    code = 429
+
+
+def _quota_llm(budget: int, window: float, latency: float):
+    """FakeStoryLLM that answers 429 once `budget` calls started in the last
+    `window` seconds, like a provider enforcing RPM.
+    Returns the model and the list its rejections are appended to."""
+    from collections import deque
+    from fake_llm import FakeStoryLLM
+
+    started = deque()
+    rejected = []
+
+    class QuotaLLM(FakeStoryLLM):
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            now = time.monotonic()
+            while started and started[0] <= now - window:
+                started.popleft()
+            if len(started) >= budget:
+                rejected.append(now)
+                raise QuotaError("429 RESOURCE_EXHAUSTED")
+            started.append(now)
+            return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+    return QuotaLLM(latency=latency), rejected
+
+
+async def bench_ratelimit(args):
+    """Interactive and batch callers sharing a request budget. "fixed sleep"
+    is the old approach (sleep 1s before each call, retry on 429); "limiter"
+    is rate_limiter.py. The provider's minute is shortened to --window
+    seconds so the run stays short. Counts the 429s the provider returned and
+    the latency of each class."""
+    from langchain_core.messages import HumanMessage, SystemMessage
+    import rate_limiter
+
+    messages = [SystemMessage(content="You generate a creative title for a story."), HumanMessage(content="A story.")]
+    rows = []
+    for mode in ("fixed sleep", "limiter"):
+        llm, rejected = _quota_llm(args.budget, args.window, args.latency)
+        limiter = rate_limiter.RateLimiter(rpm=0, tpm=0)
+        if mode == "limiter":
+            # burst is in seconds of a real minute; scale it with the window
+            limiter.configure(rpm=args.budget, tpm=0, burst_seconds=args.burst * args.window / 60, period=args.window)
+        timings = {"interactive": [], "batch": []}
+
+        async def caller(priority: str):
+            model = rate_limiter.limited(llm, priority, limiter=limiter)
+            for _ in range(args.calls):
+                start = time.perf_counter()
+                if mode == "fixed sleep":
+                    await asyncio.sleep(1)
+                await model.ainvoke(messages)
+                timings[priority].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(caller("interactive") for _ in range(args.interactive)),
+                             *(caller("batch") for _ in range(args.batch)))
+        elapsed = time.perf_counter() - start
+        calls = args.calls * (args.interactive + args.batch)
+        rows.append((f"{mode} wall time", f"{elapsed:.2f}s ({calls / elapsed * args.window:.1f} calls per window, "
+                                          f"budget {args.budget})"))
+        rows.append((f"{mode} 429s from the provider", str(len(rejected))))
+        for priority, samples in timings.items():
+            if samples:
+                rows.append((f"{mode} {priority} call", latency_row(samples)))
+
+    report(f"rate limiting ({args.interactive} interactive + {args.batch} batch callers x {args.calls} calls, "
+           f"{args.budget} calls per {args.window:g}s)", rows)
+
+
+# -----------------------------
+# clients: shared connection pool and cached model variants
+# -----------------------------
+async def bench_clients(args):
+    """Real Gemini clients (langchain_google_genai over httpx) against a
+    local stand-in for the API, with a new connection per call vs the
+    registry's shared keep-alive pool, and the cost of building a
+    rate-limited, tool-bound model per call vs taking it from the registry.
+    The stand-in is plain HTTP on loopback, so a new connection is far
+    cheaper here than a TLS handshake with the real endpoint; the
+    connection counts are what carries over."""
+    import threading
+    import uvicorn
+    from fastapi import FastAPI
+    from langchain_core.messages import HumanMessage
+    from llm_clients import ClientRegistry
+    from rate_limiter import limited
+    from tools import fix_grammar_locally
+
+    gemini = FastAPI()
+
+    @gemini.post("/{version}/models/{call}")
+    async def generate_content(version: str, call: str):
+        await asyncio.sleep(args.latency)
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": "Once upon a time."}]}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": 10, "candidatesTokenCount": 5, "totalTokenCount": 15},
+        }
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(gemini, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    rows = []
+    for name, keepalive in (("new connection per call", 0), ("shared pool", args.keepalive)):
+        clients = ClientRegistry(max_keepalive=keepalive)
+        model = clients.chat_model(api_key="offline-benchmark", base_url=f"http://127.0.0.1:{port}")
+        latencies = []
+
+        async def session():
+            for _ in range(args.calls):
+                start = time.perf_counter()
+                await model.ainvoke([HumanMessage(content="a story about a kite")])
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(session() for _ in range(args.sessions)))
+        stats = clients.stats()
+        rows.append((f"{name}: call", latency_row(latencies)))
+        rows.append((f"{name}: connections", f"{stats['new']} opened, {stats['reused']} reused, "
+                                              f"{(stats['mean_connect_seconds'] or 0) * 1000:.2f}ms each"))
+        await clients.aclose()
+
+    clients = ClientRegistry()
+    model = clients.chat_model(api_key="offline-benchmark", base_url=f"http://127.0.0.1:{port}")
+    for name, build in (
+        ("model per call", lambda: limited(model, tools=[fix_grammar_locally])),
+        ("from registry", lambda: clients.variant("grammar", lambda: limited(model, tools=[fix_grammar_locally]))),
+    ):
+        start = time.perf_counter()
+        for _ in range(args.builds):
+            build()
+        rows.append((f"tool-bound model, {name}", f"{(time.perf_counter() - start) / args.builds * 1e6:8.1f}us"))
+    await clients.aclose()
+    server.should_exit = True
+    report(f"clients: {args.sessions} sessions x {args.calls} calls, stand-in latency {args.latency}s", rows)
+
+
+# -----------------------------
+# routes: per-node models, fallbacks and hedging
+# -----------------------------
+async def bench_routes(args):
+    """Title and moral calls under four routing setups: everything on the
+    drafting model; title/moral routed to a faster, cheaper model; the same
+    with that model failing --failures of its calls with a 429 (served by the
+    fallback); and hedged between the two. Both fakes have log-normal
+    latency, so the slow tail is what hedging cuts. Cost uses LLM_MODEL_COSTS."""
+    import graph_nodes
+    import model_router
+    from fake_llm import FakeStoryLLM
+    from config import LLM_MODEL
+
+    fast_model = "gemini-2.5-flash-lite"
+    rng = random.Random(args.seed)
+
+    class FlakyLLM(FakeStoryLLM):
+        failures: float = 0.0
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            if rng.random() < self.failures:
+                raise QuotaError("429 RESOURCE_EXHAUSTED")
+            return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+    strong = FakeStoryLLM(latency=args.latency, jitter=args.jitter, seed=1)
+    nodes = {"title_generator": graph_nodes._title_messages, "moral_extractor": graph_nodes._moral_messages}
+    route = (fast_model, LLM_MODEL)
+    setups = [
+        ("single model", {}, (), 0.0),
+        ("routed", {node: route for node in nodes}, (), 0.0),
+        (f"routed, {args.failures:.0%} 429s", {node: route for node in nodes}, (), args.failures),
+        ("routed + hedged", {node: route for node in nodes}, tuple(nodes), 0.0),
+    ]
+    rows = []
+    for name, routes, hedged, failures in setups:
+        graph_nodes.models = {LLM_MODEL: strong,
+                              fast_model: FlakyLLM(latency=args.latency * args.fast, jitter=args.jitter, seed=2,
+                                                   failures=failures)}
+        router = graph_nodes.router = model_router.ModelRouter(routes, hedged, args.hedge_delay)
+        latencies = []
+        failed = 0
+
+        async def user(i: int):
+            nonlocal failed
+            state = {"story": f"Story #{i}: a lighthouse keeper counts ships. " * 4}
+            for _ in range(args.calls):
+                for node, messages in nodes.items():
+                    start = time.perf_counter()
+                    try:
+                        await graph_nodes.model_for(node).ainvoke(messages(state))
+                    except Exception:
+                        failed += 1
+                    latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(user(i) for i in range(args.users)))
+        stats = [model for view in router.stats()["nodes"].values() for model in view["models"].values()]
+        sent = sum(m["calls"] for m in stats)
+        cost = sum(m["cost_usd"] for m in stats)
+        rows.append((f"{name}: call", latency_row(latencies)))
+        rows.append((f"{name}: requests", f"{sent} sent for {len(latencies)} calls, {failed} failed, "
+                                          f"{sum(m['fallbacks'] for m in stats)} fallbacks, "
+                                          f"{sum(m['hedges'] for m in stats)} hedges, "
+                                          f"${cost / len(latencies) * 1000:.4f} per 1000 calls"))
+    graph_nodes.models = {}
+    graph_nodes.router = model_router.router
+    report(f"routes: {args.users} users x {args.calls} title+moral calls, fake latency {args.latency}s "
+           f"(fast model x{args.fast}), jitter {args.jitter}", rows)
+
+
+def register(sub) -> None:
+    p = sub.add_parser("ratelimit", help="shared RPM limiter vs fixed sleeps against a quota-enforcing fake")
+    p.add_argument("--interactive", type=int, default=4)
+    p.add_argument("--batch", type=int, default=16)
+    p.add_argument("--calls", type=int, default=10)
+    p.add_argument("--budget", type=int, default=40, help="calls the provider allows per window")
+    p.add_argument("--window", type=float, default=2.0, help="the provider's quota window (a minute in production)")
+    p.add_argument("--burst", type=float, default=3.0, help="limiter burst, in seconds of a minute")
+    p.add_argument("--latency", type=float, default=0.2)
+    p.set_defaults(func=bench_ratelimit, needs_llm=False)
+
+    p = sub.add_parser("clients", help="shared connection pool and cached model variants vs per-call setup")
+    p.add_argument("--sessions", type=int, default=20)
+    p.add_argument("--calls", type=int, default=10)
+    p.add_argument("--latency", type=float, default=0.05)
+    p.add_argument("--keepalive", type=int, default=20)
+    p.add_argument("--builds", type=int, default=2000)
+    p.set_defaults(func=bench_clients, needs_llm=False)
+
+    p = sub.add_parser("routes", help="title/moral latency and cost with per-node models, fallbacks and hedging")
+    p.add_argument("--users", type=int, default=20)
+    p.add_argument("--calls", type=int, default=10)
+    p.add_argument("--latency", type=float, default=0.3)
+    p.add_argument("--jitter", type=float, default=0.6)
+    p.add_argument("--fast", type=float, default=0.4, help="latency of the fast model relative to the drafting one")
+    p.add_argument("--failures", type=float, default=0.3, help="share of the fast model's calls answered with a 429")
+    p.add_argument("--hedge-delay", type=float, default=0.0, help="seconds; 0 hedges at the observed p95")
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_routes, needs_db=True)
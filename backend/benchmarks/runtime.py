@@ -0,0 +1,103 @@
+"""Process overheads: node instrumentation and cold start."""
+import asyncio
+import os
+import sys
+import time
+
+from benchmarks.common import report, percentile
+
+
+# -----------------------------
+# tracker: instrumentation overhead
+# -----------------------------
+def bench_tracker(args):
+    """Per-call cost of @track_node on a no-op node, sync and async, with the
+    stdout log off (default) and on."""
+    import contextlib
+    import tracker
+
+    state = {"session_id": "bench"}
+
+    def node(state):
+        return state
+
+    async def anode(state):
+        return state
+
+    def per_call(fn, is_async: bool) -> float:
+        if is_async:
+            async def loop():
+                start = time.perf_counter()
+                for _ in range(args.calls):
+                    await fn(state)
+                return time.perf_counter() - start
+            return asyncio.run(loop()) / args.calls
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            fn(state)
+        return (time.perf_counter() - start) / args.calls
+
+    rows = []
+    for label, fn, is_async in (("sync", node, False), ("async", anode, True)):
+        bare = per_call(fn, is_async)
+        tracked = per_call(tracker.track_node("bench")(fn), is_async)
+        tracker.NODE_LOG = True
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            logged = per_call(tracker.track_node("bench")(fn), is_async)
+        tracker.NODE_LOG = False
+        rows.append((f"{label} overhead", f"{(tracked - bare) * 1e6:.1f}us per call"))
+        rows.append((f"{label} overhead with NODE_LOG", f"{(logged - bare) * 1e6:.1f}us per call (stdout to /dev/null)"))
+
+    report(f"track_node overhead ({args.calls} calls)", rows)
+
+
+# -----------------------------
+# startup: cold import and warm-up time
+# -----------------------------
+STARTUP_SCRIPT = """
+import asyncio, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+if {warm}:
+    asyncio.run({module}.warm_up())
+print(imported - start, time.perf_counter() - imported)
+"""
+
+def bench_startup(args):
+    """What a new API worker pays before serving: importing each backend
+    module in a fresh interpreter, and the lifespan warm-up (model client,
+    response cache, spelling index). With --budget the run fails when
+    importing app takes longer, so a regression shows up in CI."""
+    import subprocess
+
+    env = {**os.environ, "GOOGLE_API_KEY": os.environ.get("GOOGLE_API_KEY", "offline-benchmark")}
+    rows = []
+    app_import = []
+    for module in ("config", "graph_nodes", "graph_builder", "app"):
+        imports, warm = [], []
+        for _ in range(args.runs):
+            script = STARTUP_SCRIPT.format(module=module, warm=module == "app")
+            out = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True)
+            import_seconds, warm_seconds = map(float, out.stdout.split()[-2:])
+            imports.append(import_seconds)
+            warm.append(warm_seconds)
+        rows.append((f"import {module}", f"p50 {percentile(imports, 0.5) * 1000:7.1f}ms  max {max(imports) * 1000:7.1f}ms"))
+        if module == "app":
+            app_import = imports
+            rows.append(("app warm-up", f"p50 {percentile(warm, 0.5) * 1000:7.1f}ms  max {max(warm) * 1000:7.1f}ms"))
+    report(f"startup (fresh interpreter, n={args.runs})", rows)
+    if args.budget and percentile(app_import, 0.5) > args.budget:
+        print(f"\nimport app took {percentile(app_import, 0.5):.2f}s, over the {args.budget}s budget")
+        sys.exit(1)
+
+
+def register(sub) -> None:
+    p = sub.add_parser("tracker", help="per-call overhead of the node instrumentation")
+    p.add_argument("--calls", type=int, default=20000)
+    p.set_defaults(func=bench_tracker, needs_llm=False)
+
+    p = sub.add_parser("startup", help="cold import time per module and API warm-up, in fresh interpreters")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--budget", type=float, default=0.0, help="fail if importing app takes longer (seconds, p50)")
+    p.set_defaults(func=bench_startup, needs_db=True, needs_llm=False)
@@ -0,0 +1,242 @@
+"""Session concurrency and lifecycle: queued jobs, duplicate feedback and
+the hot session cache."""
+import asyncio
+import time
+
+from benchmarks.common import free_port, report, latency_row
+
+
+# -----------------------------
+# jobs: queued runs vs requests held open
+# -----------------------------
+async def bench_jobs(args):
+    """start -> done sessions three ways: the blocking endpoints (each request
+    open for its whole run), queued jobs followed by long-poll, and queued
+    jobs reported by webhook to a local receiver. Reports how long requests
+    stay open, end-to-end latency, queue wait and peak graph runs."""
+    import threading
+    from urllib.parse import urlsplit
+    import uvicorn
+    from fastapi import FastAPI, Request as HTTPRequest
+    from fastapi import Response as HTTPResponse
+    import app
+    import jobs as job_queue
+
+    job_queue.jobs.concurrency = args.concurrency
+    # The receiver is plain http on loopback, which real webhooks may not use
+    async def any_webhook(url, allowed=None):
+        return urlsplit(url).hostname
+
+    app.check_webhook = job_queue.check_webhook = any_webhook
+    loop = asyncio.get_running_loop()
+    delivered = {}
+
+    receiver = FastAPI()
+
+    @receiver.post("/hook")
+    async def hook(request: HTTPRequest):
+        body = await request.json()
+        event = delivered.get(body["job_id"])
+        if event is not None:
+            loop.call_soon_threadsafe(event.set)
+        return {}
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(receiver, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    async def blocking(i: int, held: list):
+        start = time.perf_counter()
+        started = await app.start_story(app.StoryRequest(prompt=f"a heron who counts stars #{i}"))
+        held.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        await app.provide_feedback(app.FeedbackRequest(session_id=started.session_id, feedback="done"))
+        held.append(time.perf_counter() - start)
+
+    async def queued(i: int, held: list, webhook: bool):
+        url = f"http://127.0.0.1:{port}/hook" if webhook else None
+        session_id = None
+        for kind in ("start", "feedback"):
+            start = time.perf_counter()
+            if kind == "start":
+                job = await app.job_start(app.StoryRequest(prompt=f"a heron who counts stars #{i}", webhook_url=url),
+                                          HTTPResponse())
+                session_id = job["session_id"]
+            else:
+                job = await app.job_feedback(app.FeedbackRequest(session_id=session_id, feedback="done", webhook_url=url),
+                                             HTTPResponse())
+            held.append(time.perf_counter() - start)
+            if webhook:
+                event = delivered[job["job_id"]] = asyncio.Event()
+                await event.wait()
+            else:
+                while job["status"] not in ("done", "failed"):
+                    start = time.perf_counter()
+                    job = await app.get_job(job["job_id"], wait=args.poll)
+                    held.append(time.perf_counter() - start)
+
+    rows = []
+    for name in ("blocking endpoints", "jobs + long-poll", "jobs + webhook"):
+        held, sessions, peak = [], [], [0]
+        async with app.lifespan(app.app):
+            async def session(i: int):
+                start = time.perf_counter()
+                if name == "blocking endpoints":
+                    await blocking(i, held)
+                else:
+                    await queued(i, held, webhook=name.endswith("webhook"))
+                sessions.append(time.perf_counter() - start)
+
+            async def sample():
+                while True:
+                    peak[0] = max(peak[0], job_queue.jobs.running)
+                    await asyncio.sleep(0.005)
+
+            sampler = asyncio.create_task(sample())
+            start = time.perf_counter()
+            await asyncio.gather(*(session(i) for i in range(args.sessions)))
+            wall = time.perf_counter() - start
+            sampler.cancel()
+            stats = job_queue.jobs.stats()
+        rows.append((f"{name}: request open", latency_row(held)))
+        rows.append((f"{name}: session", latency_row(sessions)))
+        if name != "blocking endpoints":
+            waits = stats["wait_seconds"]
+            rows.append((f"{name}: queue", f"peak {peak[0]} running, wait p95 <= "
+                                           f"{max(w['p95'] for w in waits.values()):g}s, wall {wall:.2f}s"))
+        else:
+            rows.append((f"{name}: wall", f"{wall:.2f}s"))
+    server.should_exit = True
+    report(f"jobs: {args.sessions} sessions, {args.concurrency} job workers, fake latency {args.latency}s", rows)
+
+
+# -----------------------------
+# dedupe: overlapping feedback for one session
+# -----------------------------
+async def bench_dedupe(args):
+    """Every session gets --copies identical feedback requests at once (a
+    double click, a client retrying). "no locks" is the old behavior; then
+    duplicates without a key, retries sharing an Idempotency-Key, and
+    distinct keys, which are separate requests and run one after the other.
+    Counts revision calls to the model and the sessions' revision_count."""
+    from contextlib import asynccontextmanager
+    import app
+    import graph_nodes
+    from fake_llm import FakeStoryLLM
+    from session_locks import SessionLocks
+
+    revisions = []
+
+    class MeteredLLM(FakeStoryLLM):
+        def _reply(self, messages, tools):
+            if messages and messages[0].content == "You are an editor.":
+                revisions.append(1)
+            return super()._reply(messages, tools)
+
+    class NoLocks(SessionLocks):
+        def __init__(self):
+            self._init(False, 0, 0, 0)
+
+        @asynccontextmanager
+        async def hold(self, session_id):
+            yield
+
+        def _load(self, key):
+            return None
+
+        def _save(self, key, expected, response, now):
+            pass
+
+        def close(self):
+            pass
+
+    graph_nodes.llm = MeteredLLM(latency=args.latency)
+    rows = []
+    for mode in ("no locks", "duplicates, no key", "same Idempotency-Key", "distinct keys"):
+        latencies, errors = [], []
+        async with app.lifespan(app.app):
+            if mode == "no locks":
+                app.session_locks = NoLocks()
+            started = [await app.start_story(app.StoryRequest(prompt=f"a tinker's clock #{i}")) for i in range(args.sessions)]
+            del revisions[:]
+
+            async def send(session_id: str, copy: int):
+                key = {"same Idempotency-Key": f"retry-{session_id}", "distinct keys": f"click-{copy}"}.get(mode)
+                start = time.perf_counter()
+                try:
+                    await app.provide_feedback(app.FeedbackRequest(session_id=session_id, feedback="make it funnier"), key)
+                except Exception as e:
+                    errors.append(type(e).__name__)
+                latencies.append(time.perf_counter() - start)
+
+            await asyncio.gather(*(send(s.session_id, c) for s in started for c in range(args.copies)))
+            counts = [(await app.graph.aget_state({"configurable": {"thread_id": s.session_id}})).values["revision_count"]
+                      for s in started]
+        rows.append((f"{mode}: request", latency_row(latencies)))
+        rows.append((f"{mode}: revisions", f"{len(revisions)} model calls for {args.sessions} sessions, "
+                                           f"revision_count {min(counts)}-{max(counts)}, {len(errors)} errors"))
+    report(f"dedupe: {args.sessions} sessions x {args.copies} identical feedback requests, fake latency {args.latency}s", rows)
+
+
+# -----------------------------
+# sessions: hot session cache
+# -----------------------------
+async def bench_sessions(args):
+    """Interactive sessions polled and revised round after round, reading
+    their state from the checkpoints every time ("off") and through the hot
+    session cache, unbounded and under a --ceiling-kb memory ceiling that
+    holds only part of them. Reports GET /api/session and feedback latency,
+    hit ratio and resident size."""
+    import httpx
+    import app
+    from hot_sessions import HotSessions
+
+    ceilings = (("off", 0), ("cache", 1 << 30), (f"{args.ceiling_kb}KB ceiling", args.ceiling_kb * 1024))
+    rows = []
+    for mode, max_bytes in ceilings:
+        reads, feedback = [], []
+        async with app.lifespan(app.app):
+            app.hot_sessions = HotSessions(app.graph, app.session_index, max_bytes)
+            started = [await app.start_story(app.StoryRequest(prompt=f"a night ferry #{i}")) for i in range(args.sessions)]
+            transport = httpx.ASGITransport(app=app.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for round_ in range(args.rounds):
+                    for s in started:
+                        start = time.perf_counter()
+                        r = await client.get(f"/api/session/{s.session_id}")
+                        reads.append(time.perf_counter() - start)
+                        assert r.status_code == 200, r.status_code
+                        start = time.perf_counter()
+                        await app.provide_feedback(app.FeedbackRequest(session_id=s.session_id, feedback=f"round {round_}"))
+                        feedback.append(time.perf_counter() - start)
+            stats = app.hot_sessions.stats()
+        rows.append((f"{mode}: GET session", latency_row(reads)))
+        rows.append((f"{mode}: feedback", latency_row(feedback)))
+        rows.append((f"{mode}: cache", f"hit ratio {stats['hit_ratio']:.2f}, {stats['sessions']} sessions resident, "
+                                       f"{stats['resident_bytes'] / 1024:.0f}KB, {stats['evictions']} evictions, "
+                                       f"{stats['loads']} checkpoint reads"))
+    report(f"sessions: {args.sessions} sessions x {args.rounds} rounds of GET + feedback, fake latency {args.latency}s", rows)
+
+
+def register(sub) -> None:
+    p = sub.add_parser("jobs", help="queued jobs (long-poll, webhook) vs blocking endpoints")
+    p.add_argument("--sessions", type=int, default=40)
+    p.add_argument("--concurrency", type=int, default=8, help="job workers")
+    p.add_argument("--poll", type=float, default=30.0, help="long-poll wait (seconds)")
+    p.add_argument("--latency", type=float, default=0.3)
+    p.set_defaults(func=bench_jobs, needs_db=True)
+
+    p = sub.add_parser("dedupe", help="duplicate feedback requests with session locks and idempotency keys")
+    p.add_argument("--sessions", type=int, default=10)
+    p.add_argument("--copies", type=int, default=3)
+    p.add_argument("--latency", type=float, default=0.3)
+    p.set_defaults(func=bench_dedupe, needs_db=True)
+
+    p = sub.add_parser("sessions", help="session reads and feedback with the hot session cache and a memory ceiling")
+    p.add_argument("--sessions", type=int, default=50)
+    p.add_argument("--rounds", type=int, default=5)
+    p.add_argument("--ceiling-kb", type=int, default=256)
+    p.add_argument("--latency", type=float, default=0.0)
+    p.set_defaults(func=bench_sessions, needs_db=True)
@@ -0,0 +1,153 @@
+"""Checkpoint storage: saver throughput and delta-encoded checkpoints."""
+import os
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.common import report
+
+
+# -----------------------------
+# checkpoint: saver throughput vs concurrent sessions
+# -----------------------------
+def _checkpoint_worker(saver, thread_id: str, ops: int, story: str, put_times: list, get_times: list):
+    from langgraph.checkpoint.base import empty_checkpoint
+
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    for step in range(ops):
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = {"story": story, "revision_count": step}
+        start = time.perf_counter()
+        config = saver.put(config, checkpoint, {"source": "loop", "step": step}, {})
+        put_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        saver.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}})
+        get_times.append(time.perf_counter() - start)
+
+
+def bench_checkpoint(args):
+    """Checkpoint puts/gets per second as the number of concurrent sessions
+    (threads) grows: shared-connection SqliteSaver vs PooledSqliteSaver."""
+    import threading
+    from langgraph.checkpoint.sqlite import SqliteSaver
+    from checkpointer import PooledSqliteSaver
+
+    story = "Once upon a time, a story was checkpointed. " * 80
+    rows = []
+    for sessions in args.sessions:
+        for name in ("SqliteSaver", "PooledSqliteSaver"):
+            path = os.path.join(tempfile.mkdtemp(prefix="story-bench-"), "checkpoints.db")
+            if name == "SqliteSaver":
+                saver = SqliteSaver(sqlite3.connect(path, check_same_thread=False))
+            else:
+                saver = PooledSqliteSaver(path, pool_size=min(sessions, 16))
+            saver.setup()
+
+            put_times, get_times = [], []
+            threads = [
+                threading.Thread(target=_checkpoint_worker, args=(saver, f"t{i}", args.ops, story, put_times, get_times))
+                for i in range(sessions)
+            ]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            wall = time.perf_counter() - start
+
+            detail = ""
+            if isinstance(saver, PooledSqliteSaver):
+                detail = f", {saver.stats()['writes_per_commit']} writes/commit"
+                saver.close()
+            total = sessions * args.ops
+            rows.append((f"{sessions:>3} sessions  {name}",
+                         f"{total / wall:,.0f} put+get/s, put p50 {sorted(put_times)[len(put_times) // 2] * 1000:.2f}ms{detail}"))
+
+    report(f"checkpoint throughput ({args.ops} put+get per session)", rows)
+
+
+# -----------------------------
+# storage: delta-encoded checkpoints
+# -----------------------------
+def _storage_session(graph, i: int, revisions: int):
+    from langgraph.types import Command
+
+    config = {"configurable": {"thread_id": f"storage-{i}", "grammar_mode": "llm"}}
+    graph.invoke({"prompt": f"a lighthouse keeper who befriends a whale #{i}", "revision_count": 0}, config)
+    for n in range(revisions):
+        graph.invoke(Command(resume=f"make part {n} more vivid"), config)
+    graph.invoke(Command(resume="done"), config)
+    return graph.get_state(config).values
+
+
+def bench_storage(args):
+    """Checkpoint bytes, put latency and read-back time with and without delta
+    encoding. Full sessions (draft, LLM grammar pass, revisions, finalization)
+    are recorded once, then their checkpoints and writes are replayed into a
+    fresh SqliteSaver per serializer so only storage is being timed."""
+    from langgraph.checkpoint.sqlite import SqliteSaver
+    from checkpointer import PooledSqliteSaver
+    from graph_builder import create_graph
+    from revision_store import DeltaSerializer
+    from compaction import database_bytes
+
+    recorder = PooledSqliteSaver(os.path.join(tempfile.mkdtemp(prefix="story-bench-"), "recorded.db"))
+    graph = create_graph(recorder)
+    for i in range(args.sessions):
+        _storage_session(graph, i, args.revisions)
+    recorded = list(reversed(list(recorder.list(None))))
+    recorder.close()
+
+    rows = []
+    for name, serde in (("plain", None), ("delta", DeltaSerializer())):
+        path = os.path.join(tempfile.mkdtemp(prefix="story-bench-"), "checkpoints.db")
+        saver = SqliteSaver(sqlite3.connect(path, check_same_thread=False), serde=serde)
+        saver.setup()
+
+        put_times = []
+        for item in recorded:
+            config = item.parent_config or {"configurable": {**item.config["configurable"], "checkpoint_id": None}}
+            start = time.perf_counter()
+            saved = saver.put(config, item.checkpoint, item.metadata, {})
+            put_times.append(time.perf_counter() - start)
+            tasks = {}
+            for task_id, channel, value in item.pending_writes:
+                tasks.setdefault(task_id, []).append((channel, value))
+            for task_id, writes in tasks.items():
+                saver.put_writes(saved, writes, task_id)
+
+        start = time.perf_counter()
+        loaded = list(reversed(list(saver.list(None))))
+        read_time = time.perf_counter() - start
+        by_id = {item.checkpoint["id"]: item for item in loaded}
+        identical = all(
+            item.checkpoint["channel_values"] == by_id[item.checkpoint["id"]].checkpoint["channel_values"]
+            and sorted(map(repr, item.pending_writes)) == sorted(map(repr, by_id[item.checkpoint["id"]].pending_writes))
+            for item in recorded
+        )
+
+        checkpoints, blob_bytes = saver.conn.execute("SELECT COUNT(*), SUM(LENGTH(checkpoint)) FROM checkpoints").fetchone()
+        write_bytes = saver.conn.execute("SELECT SUM(LENGTH(value)) FROM writes").fetchone()[0]
+        saver.conn.close()
+
+        put_times.sort()
+        rows.append((f"{name} checkpoint blobs", f"{blob_bytes / 1024:,.1f} KB over {checkpoints} checkpoints ({blob_bytes / checkpoints:,.0f} B each)"))
+        rows.append((f"{name} write blobs", f"{write_bytes / 1024:,.1f} KB"))
+        rows.append((f"{name} database file", f"{database_bytes(path) / 1024:,.1f} KB"))
+        rows.append((f"{name} put p50/p95", f"{put_times[len(put_times) // 2] * 1000:.3f}ms / {put_times[int(len(put_times) * 0.95)] * 1000:.3f}ms"))
+        rows.append((f"{name} read all back", f"{read_time * 1000:.1f}ms, identical: {identical}"))
+
+    report(f"checkpoint storage ({args.sessions} sessions, {args.revisions} revisions each)", rows)
+
+
+def register(sub) -> None:
+    p = sub.add_parser("checkpoint", help="checkpointer puts/gets per second vs concurrent sessions")
+    p.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16, 64])
+    p.add_argument("--ops", type=int, default=100)
+    p.set_defaults(func=bench_checkpoint, needs_llm=False)
+
+    p = sub.add_parser("storage", help="checkpoint size and put latency with delta-encoded stories")
+    p.add_argument("--sessions", type=int, default=10)
+    p.add_argument("--revisions", type=int, default=3)
+    p.set_defaults(func=bench_storage, needs_db=True, latency=0.0)
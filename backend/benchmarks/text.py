@@ -0,0 +1,165 @@
+"""The spelling pass: the correction engine against TextBlob, and its
+latency in the graph per grammar mode."""
+import os
+import random
+import re
+import sqlite3
+import time
+
+from benchmarks.common import report
+
+
+# -----------------------------
+# spell: correction engine vs TextBlob
+# -----------------------------
+def load_story_corpus(path: str, limit: int):
+    """Distinct stories from a checkpoint database (opened read-only), or
+    fake-model drafts when there is none."""
+    stories = []
+    if os.path.exists(path):
+        # Reads plain and delta-encoded checkpoints alike
+        from revision_store import DeltaSerializer
+        serde = DeltaSerializer()
+        conn = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True)
+        seen = set()
+        for type_, blob in conn.execute("SELECT type, checkpoint FROM checkpoints"):
+            story = serde.loads_typed((type_, blob))["channel_values"].get("story")
+            if isinstance(story, str) and len(story) > 200 and story not in seen:
+                seen.add(story)
+                stories.append(story)
+        conn.close()
+    if not stories:
+        from fake_llm import FakeStoryLLM
+        from langchain_core.messages import HumanMessage, SystemMessage
+        fake = FakeStoryLLM(latency=0)
+        stories = [
+            fake.invoke([SystemMessage(content="You are a storyteller."), HumanMessage(content=f"a traveller crossing mountain pass number {i}")]).content
+            for i in range(limit)
+        ]
+    return stories[:limit]
+
+
+def add_typos(text: str, rate: float, rng: random.Random) -> str:
+    """One random delete/transpose/replace/insert in `rate` of the longer words."""
+    def mangle(match):
+        word = match.group(0)
+        if len(word) < 4 or rng.random() > rate:
+            return word
+        i = rng.randrange(1, len(word) - 1)
+        op = rng.choice("dtri")
+        if op == "d":
+            return word[:i] + word[i + 1:]
+        if op == "t":
+            return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        letter = rng.choice("abcdefghijklmnopqrstuvwxyz")
+        if op == "r":
+            return word[:i] + letter + word[i + 1:]
+        return word[:i] + letter + word[i:]
+    return re.sub(r"[A-Za-z]+", mangle, text)
+
+
+def word_accuracy(expected: str, actual: str) -> float:
+    a = re.findall(r"[A-Za-z]+", expected.lower())
+    b = re.findall(r"[A-Za-z]+", actual.lower())
+    if len(a) != len(b):
+        import difflib
+        return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+    return sum(x == y for x, y in zip(a, b)) / max(len(a), 1)
+
+
+def bench_spell(args):
+    """Throughput (words/sec) and word accuracy of the SymSpell-style engine
+    against TextBlob's corrector on typo-injected stories."""
+    from textblob import TextBlob
+    from spellcheck import SpellingEngine, default_dictionary_path
+
+    rng = random.Random(args.seed)
+    clean = load_story_corpus(args.corpus, args.limit)
+    noisy = [add_typos(story, args.typo_rate, rng) for story in clean]
+    words = sum(len(re.findall(r"[A-Za-z]+", story)) for story in noisy)
+
+    start = time.perf_counter()
+    textblob_out = [str(TextBlob(story).correct()) for story in noisy]
+    textblob_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    engine = SpellingEngine.from_file(default_dictionary_path())
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    engine_out = [engine.correct(story) for story in noisy]
+    engine_time = time.perf_counter() - start
+
+    # A revision that rewrites one paragraph: only that paragraph is new work
+    revised = [
+        story.replace(story.split("\n\n")[-1], "And so, at last, the journey ended where it began.")
+        for story in noisy
+    ]
+    start = time.perf_counter()
+    for story in revised:
+        engine.correct(story)
+    revision_time = time.perf_counter() - start
+
+    report(f"spelling correction ({len(noisy)} stories, {words} words, typo rate {args.typo_rate})", [
+        ("uncorrected accuracy", f"{sum(map(word_accuracy, clean, noisy)) / len(clean):.3%}"),
+        ("textblob accuracy", f"{sum(map(word_accuracy, clean, textblob_out)) / len(clean):.3%}"),
+        ("engine accuracy", f"{sum(map(word_accuracy, clean, engine_out)) / len(clean):.3%}"),
+        ("textblob words/sec", f"{words / textblob_time:,.0f}"),
+        ("engine index build", f"{build_time:.2f}s (once per process)"),
+        ("engine words/sec (cold)", f"{words / engine_time:,.0f}"),
+        ("engine words/sec (1-paragraph revision)", f"{words / revision_time:,.0f}"),
+        ("engine token cache hit ratio", f"{engine.stats['token_hits'] / max(engine.stats['tokens'], 1):.1%}"),
+    ])
+
+
+# -----------------------------
+# grammar: per-mode latency of the spelling pass
+# -----------------------------
+async def bench_grammar(args):
+    """Time from prompt to the feedback interrupt for each GRAMMAR_MODE, with
+    the number of model calls made per session."""
+    from langchain_core.callbacks import AsyncCallbackHandler
+    from graph_builder import open_async_graph
+
+    class CallCounter(AsyncCallbackHandler):
+        calls = 0
+
+        async def on_chat_model_start(self, *args, **kwargs):
+            CallCounter.calls += 1
+
+    from spellcheck import get_engine
+    get_engine()  # index build is a one-off startup cost, not per session
+
+    rows = []
+    async with open_async_graph() as graph:
+        for mode in ("direct", "auto", "llm"):
+            CallCounter.calls = 0
+            latencies = []
+            for i in range(args.sessions):
+                config = {
+                    "configurable": {"thread_id": f"grammar-{mode}-{i}", "grammar_mode": mode},
+                    "callbacks": [CallCounter()],
+                }
+                state = {"prompt": f"a beekeeper's first winter #{i}", "story": "", "feedback": None,
+                         "revision_count": 0, "history": [], "session_id": f"grammar-{mode}-{i}", "messages": []}
+                start = time.perf_counter()
+                await graph.ainvoke(state, config)
+                latencies.append(time.perf_counter() - start)
+            rows.append((f"{mode}", f"{sum(latencies) / len(latencies):.3f}s/session, "
+                                    f"{CallCounter.calls / args.sessions:.1f} LLM calls/session"))
+
+    report(f"grammar modes (n={args.sessions}, fake latency={args.latency}s)", rows)
+
+
+def register(sub) -> None:
+    p = sub.add_parser("spell", help="spelling engine vs TextBlob throughput and accuracy")
+    p.add_argument("--corpus", default="stories.db", help="checkpoint database to read stories from")
+    p.add_argument("--limit", type=int, default=30)
+    p.add_argument("--typo-rate", type=float, default=0.05)
+    p.add_argument("--seed", type=int, default=7)
+    p.set_defaults(func=bench_spell, needs_llm=False)
+
+    p = sub.add_parser("grammar", help="latency of the direct vs LLM tool-calling spelling pass")
+    p.add_argument("--sessions", type=int, default=5)
+    p.add_argument("--latency", type=float, default=0.3)
+    p.set_defaults(func=bench_grammar, needs_db=True)
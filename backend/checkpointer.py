@@ -0,0 +1,260 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, List, Tuple
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+# -----------------------------
+# Pooled SQLite checkpointer
+# -----------------------------
+# SqliteSaver funnels every read and write through one connection behind one
+# lock, so concurrent sessions queue up on each other. PooledSqliteSaver keeps
+# SqliteSaver's schema and queries but:
+#   * reads check a connection out of a bounded pool, pinned to the calling
+#     thread for the duration of the query, so readers run in parallel (WAL);
+#   * writes are recorded and handed to a single writer thread that commits
+#     everything queued at that moment in one transaction (group commit), so
+#     N concurrent sessions pay for one fsync instead of N;
+#   * the async interface runs the sync methods in worker threads
+#     (ThreadedAsyncSaver), so the same saver serves the FastAPI app without
+#     blocking the event loop.
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+)
+
+
+def connect(path: str) -> sqlite3.Connection:
+    # cached_statements keeps the saver's handful of queries prepared per
+    # connection instead of re-parsing them on every call
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30, cached_statements=256)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class _RecordingCursor:
+    """Stands in for a cursor on write paths; statements run in the writer."""
+
+    def __init__(self):
+        self.statements: List[Tuple[str, Any, bool]] = []
+
+    def execute(self, sql, params=()):
+        self.statements.append((sql, params, False))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self.statements.append((sql, list(seq_of_params), True))
+        return self
+
+
+class GroupCommitter:
+    """Single writer thread that commits queued write batches together."""
+
+    def __init__(self, path: str, window: float = 0.0, max_batch: int = 256):
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.writes = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._conn = connect(path)
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, statements) -> None:
+        done = threading.Event()
+        result = {}
+        self._queue.put((statements, done, result))
+        done.wait()
+        if "error" in result:
+            raise result["error"]
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        self._conn.close()
+
+    def _apply(self, statements) -> None:
+        for sql, params, many in statements:
+            if many:
+                self._conn.executemany(sql, params)
+            else:
+                self._conn.execute(sql, params)
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # Take whatever else is already waiting (optionally lingering for
+            # `window` seconds) so it shares this transaction
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    timeout = deadline - time.monotonic()
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            try:
+                with self._conn:
+                    for statements, _, _ in batch:
+                        self._apply(statements)
+            except Exception:
+                # Retry one by one so a bad write only fails its own caller
+                for statements, _, result in batch:
+                    try:
+                        with self._conn:
+                            self._apply(statements)
+                    except Exception as e:
+                        result["error"] = e
+            self.batches += 1
+            self.writes += len(batch)
+            for _, done, _ in batch:
+                done.set()
+
+
+class ThreadedAsyncSaver:
+    """Async interface for a saver with a blocking client: every call runs the
+    sync method in a worker thread, so one saver serves both the scripts and
+    the FastAPI app without blocking the event loop."""
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None) -> AsyncIterator:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path: str = ""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    async def aget_delta_channel_history(self, *, config, channels):
+        return await asyncio.to_thread(
+            lambda: self.get_delta_channel_history(config=config, channels=channels)
+        )
+
+
+class PooledSqliteSaver(ThreadedAsyncSaver, SqliteSaver):
+    def __init__(self, path: str, *, pool_size: int = 8, commit_window: float = 0.0, serde=None):
+        self.path = path
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        for _ in range(pool_size):
+            self._pool.put(connect(path))
+        self._local = threading.local()
+        self._setup_lock = threading.Lock()
+        self._committer = GroupCommitter(path, window=commit_window)
+        super().__init__(connect(path), serde=serde)
+
+    # SqliteSaver reads `self.conn` directly in a few places; hand it the
+    # connection this thread has checked out, if any
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return getattr(self._local, "conn", None) or self._fallback_conn
+
+    @conn.setter
+    def conn(self, value: sqlite3.Connection) -> None:
+        self._fallback_conn = value
+
+    @contextmanager
+    def _checkout(self):
+        if getattr(self._local, "conn", None) is not None:
+            # Nested use on the same thread (list() opens a second cursor)
+            yield self._local.conn
+            return
+        conn = self._pool.get()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._pool.put(conn)
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        with self._setup_lock:
+            if self.is_setup:
+                return
+            with self._checkout() as conn:
+                super().setup()
+                conn.commit()
+
+    @contextmanager
+    def cursor(self, transaction: bool = True):
+        self.setup()
+        if transaction:
+            recorder = _RecordingCursor()
+            yield recorder
+            if recorder.statements:
+                self._committer.submit(recorder.statements)
+            return
+        with self._checkout() as conn:
+            cur = conn.cursor()
+            try:
+                yield cur
+            finally:
+                cur.close()
+
+    def close(self) -> None:
+        self._committer.close()
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+        self._fallback_conn.close()
+
+    def stats(self) -> dict:
+        return {
+            "write_batches": self._committer.batches,
+            "writes": self._committer.writes,
+            "writes_per_commit": round(self._committer.writes / max(self._committer.batches, 1), 2),
+            "idle_connections": self._pool.qsize(),
+        }
+
+
+# -----------------------------
+# Postgres
+# -----------------------------
+def postgres_saver(url: str, *, pool_size: int = 8, serde=None):
+    """LangGraph's PostgresSaver over a connection pool, with the threaded
+    async interface. Needs langgraph-checkpoint-postgres and psycopg."""
+    from psycopg.rows import dict_row
+    from psycopg_pool import ConnectionPool
+    from langgraph.checkpoint.postgres import PostgresSaver
+
+    class ThreadedPostgresSaver(ThreadedAsyncSaver, PostgresSaver):
+        def close(self) -> None:
+            self.conn.close()
+
+    pool = ConnectionPool(
+        url,
+        max_size=pool_size,
+        kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+        open=True,
+    )
+    saver = ThreadedPostgresSaver(pool, serde=serde)
+    saver.setup()
+    return saver
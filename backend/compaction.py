@@ -0,0 +1,132 @@
+import os
+import sqlite3
+import time
+import uuid
+from typing import Optional
+
+# -----------------------------
+# Checkpoint compaction
+# -----------------------------
+# Every graph step appends a full checkpoint to stories.db and nothing is ever
+# removed. Compaction keeps only the newest `keep_last` checkpoints of each
+# thread (enough for the current state and a short undo history), deletes the
+# writes that belonged to dropped checkpoints, and expires whole sessions once
+# they have been finished (or abandoned) for long enough.
+
+# Offset between the UUID epoch (1582-10-15) and the Unix epoch, in 100ns units
+_UUID_EPOCH_OFFSET = 0x01B21DD213814000
+
+
+def checkpoint_time(checkpoint_id: str) -> float:
+    """Unix time encoded in a LangGraph (UUIDv6) checkpoint id."""
+    value = uuid.UUID(checkpoint_id).int
+    ticks = ((value >> 80) << 12) | ((value >> 64) & 0xFFF)
+    return (ticks - _UUID_EPOCH_OFFSET) / 1e7
+
+
+def database_bytes(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+
+class Compactor:
+    def __init__(
+        self,
+        path: str,
+        graph=None,
+        keep_last: int = 5,
+        finished_ttl: Optional[float] = 7 * 24 * 3600,
+        abandoned_ttl: Optional[float] = 30 * 24 * 3600,
+        session_index=None,
+    ):
+        self.path = path
+        # Used to tell finished sessions from ones paused at human_feedback
+        self.graph = graph
+        self.keep_last = max(keep_last, 1)
+        self.finished_ttl = finished_ttl
+        self.abandoned_ttl = abandoned_ttl
+        # Summaries of expired sessions are dropped along with them
+        self.session_index = session_index
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def _is_finished(self, thread_id: str) -> bool:
+        if self.graph is None:
+            return False
+        state = self.graph.get_state({"configurable": {"thread_id": thread_id}})
+        return not state.next
+
+    def expire_sessions(self, conn: sqlite3.Connection, now: float) -> int:
+        if not self.finished_ttl and not self.abandoned_ttl:
+            return 0
+        expired = []
+        rows = conn.execute("SELECT thread_id, MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id").fetchall()
+        for thread_id, latest in rows:
+            age = now - checkpoint_time(latest)
+            if self.abandoned_ttl and age > self.abandoned_ttl:
+                expired.append(thread_id)
+            elif self.finished_ttl and age > self.finished_ttl and self._is_finished(thread_id):
+                expired.append(thread_id)
+        with conn:
+            for thread_id in expired:
+                conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+                conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+        if self.session_index is not None and expired:
+            self.session_index.forget(expired)
+        return len(expired)
+
+    def prune_checkpoints(self, conn: sqlite3.Connection) -> int:
+        with conn:
+            removed = conn.execute(
+                """
+                DELETE FROM checkpoints WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+                        ) AS position
+                        FROM checkpoints
+                    ) WHERE position > ?
+                )
+                """,
+                (self.keep_last,),
+            ).rowcount
+            # Writes are only read together with their checkpoint
+            conn.execute(
+                """
+                DELETE FROM writes WHERE NOT EXISTS (
+                    SELECT 1 FROM checkpoints c
+                    WHERE c.thread_id = writes.thread_id
+                      AND c.checkpoint_ns = writes.checkpoint_ns
+                      AND c.checkpoint_id = writes.checkpoint_id
+                )
+                """
+            )
+        return removed
+
+    def run(self, vacuum: bool = True) -> dict:
+        start = time.perf_counter()
+        bytes_before = database_bytes(self.path)
+        conn = self._connect()
+        try:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            if "checkpoints" not in tables:
+                return {"sessions_expired": 0, "checkpoints_removed": 0, "bytes_before": bytes_before,
+                        "bytes_after": bytes_before, "bytes_reclaimed": 0, "seconds": 0.0}
+            sessions_expired = self.expire_sessions(conn, time.time())
+            checkpoints_removed = self.prune_checkpoints(conn)
+            if vacuum and (sessions_expired or checkpoints_removed):
+                conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+        bytes_after = database_bytes(self.path)
+        return {
+            "sessions_expired": sessions_expired,
+            "checkpoints_removed": checkpoints_removed,
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "bytes_reclaimed": max(bytes_before - bytes_after, 0),
+            "seconds": round(time.perf_counter() - start, 3),
+        }
@@ -0,0 +1,209 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# -----------------------------
+# Settings
+# -----------------------------
+# Everything is read from the environment (or .env) so deployments and the
+# benchmark scripts can tune the backend without code changes.
+
+# SQLite file holding graph checkpoints
+DB_PATH = os.getenv("STORIES_DB", "stories.db")
+
+# LLM response cache (see llm_cache.py)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "llm_cache.db")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+LLM_CACHE_MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", "10000"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+# Nodes whose output is reused for identical inputs
+LLM_CACHE_NODES = set(os.getenv("LLM_CACHE_NODES", "generate_story,grammar_check,title_generator,moral_extractor").split(","))
+
+# How generated drafts get their spelling pass:
+#   direct - run the local correction engine as a graph node (no LLM call)
+#   llm    - let the model call the fix_grammar_locally tool
+#   auto   - direct, unless the engine would change more than
+#            GRAMMAR_LLM_THRESHOLD of the words (a draft that needs more than
+#            spelling fixes is sent through the model)
+GRAMMAR_MODE = os.getenv("GRAMMAR_MODE", "direct")
+GRAMMAR_LLM_THRESHOLD = float(os.getenv("GRAMMAR_LLM_THRESHOLD", "0.08"))
+
+# Where checkpoints live:
+#   sqlite   - DB_PATH on this host (one API process, or several on one host)
+#   redis    - CHECKPOINT_URL, e.g. redis://cache:6379/0 (see redis_saver.py)
+#   postgres - CHECKPOINT_URL, e.g. postgresql://user:pass@db/stories
+# With redis or postgres any worker on any host can serve any session.
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "sqlite")
+CHECKPOINT_URL = os.getenv("CHECKPOINT_URL", "")
+
+# Checkpointer connection pool (see checkpointer.py)
+CHECKPOINT_POOL_SIZE = int(os.getenv("CHECKPOINT_POOL_SIZE", "8"))
+# How long the writer lingers to group more concurrent writes into a commit
+CHECKPOINT_COMMIT_WINDOW_MS = float(os.getenv("CHECKPOINT_COMMIT_WINDOW_MS", "0"))
+# Store repeated story text as diffs inside checkpoints (see revision_store.py);
+# checkpoints written either way can always be read back
+STORY_DELTA_ENCODING = os.getenv("STORY_DELTA_ENCODING", "true").lower() == "true"
+# Strings shorter than this are stored as they are
+STORY_DELTA_MIN_LENGTH = int(os.getenv("STORY_DELTA_MIN_LENGTH", "256"))
+
+# Checkpoint compaction (see compaction.py)
+COMPACTION_KEEP_LAST = int(os.getenv("COMPACTION_KEEP_LAST", "5"))
+COMPACTION_FINISHED_TTL_HOURS = float(os.getenv("COMPACTION_FINISHED_TTL_HOURS", str(7 * 24)))
+COMPACTION_ABANDONED_TTL_HOURS = float(os.getenv("COMPACTION_ABANDONED_TTL_HOURS", str(30 * 24)))
+# Minutes between background runs; 0 disables the background job
+COMPACTION_INTERVAL_MINUTES = float(os.getenv("COMPACTION_INTERVAL_MINUTES", "60"))
+# Redis has no compaction job: every key of a session expires this long after
+# its last write instead
+CHECKPOINT_TTL_HOURS = float(os.getenv("CHECKPOINT_TTL_HOURS", os.getenv("COMPACTION_ABANDONED_TTL_HOURS", str(30 * 24))))
+
+# API server (python app.py). Workers are separate processes that share
+# nothing but the checkpoint backend, so requests need no session affinity
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+
+# Instrumentation (see metrics.py and tracker.py)
+# Print ENTER/EXIT lines for every node (off by default: stdout is slow and
+# serializes concurrent sessions)
+NODE_LOG = os.getenv("NODE_LOG", "false").lower() == "true"
+# Finished spans kept in memory for /api/admin/traces
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "10000"))
+# USD per million tokens, for the estimated cost counter of models not in
+# LLM_MODEL_COSTS (Gemini 2.5 Flash)
+LLM_INPUT_COST_PER_MTOK = float(os.getenv("LLM_INPUT_COST_PER_MTOK", "0.30"))
+LLM_OUTPUT_COST_PER_MTOK = float(os.getenv("LLM_OUTPUT_COST_PER_MTOK", "2.50"))
+
+# Gemini rate limits (see rate_limiter.py), shared by every model call in the
+# process. The defaults are Gemini 2.5 Flash's free tier; 0 turns a budget off
+LLM_RPM = float(os.getenv("LLM_RPM", "10"))
+LLM_TPM = float(os.getenv("LLM_TPM", "250000"))
+# Seconds' worth of the per-minute budget that may be spent at once. The rest
+# is paced evenly over the minute, so a larger burst means lower steady
+# throughput (budget * (1 - burst / 60))
+LLM_BURST_SECONDS = float(os.getenv("LLM_BURST_SECONDS", "3"))
+# Starting guess for the tokens a call uses, until real usage is seen
+LLM_TOKENS_PER_CALL = float(os.getenv("LLM_TOKENS_PER_CALL", "1500"))
+# Attempts per call on 429/5xx, with jittered exponential backoff (seconds)
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "5"))
+LLM_BACKOFF_INITIAL = float(os.getenv("LLM_BACKOFF_INITIAL", "1"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+
+# Batch generation (see batch.py)
+BATCH_DB = os.getenv("BATCH_DB", DB_PATH)
+# Items that failed this many times are skipped when a batch is resumed
+BATCH_MAX_ATTEMPTS = int(os.getenv("BATCH_MAX_ATTEMPTS", "3"))
+# A running item whose run has not checked in for this long (seconds) is
+# taken to have crashed and is handed to the next run of its batch
+BATCH_STALE_SECONDS = float(os.getenv("BATCH_STALE_SECONDS", "300"))
+# Upper bound for the concurrency a /api/batch caller may ask for
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+
+# Speculative finalization (see speculation.py): start title and moral while
+# a draft waits for feedback, at the cost of the tokens spent on drafts that
+# are revised instead
+SPECULATIVE_FINALIZE = os.getenv("SPECULATIVE_FINALIZE", "false").lower() == "true"
+# Sessions with speculation held at once, and how long an unanswered one is kept
+SPECULATION_MAX_SESSIONS = int(os.getenv("SPECULATION_MAX_SESSIONS", "1000"))
+SPECULATION_TTL_SECONDS = float(os.getenv("SPECULATION_TTL_SECONDS", "900"))
+
+# Prompt context (see context.py): approximate tokens of conversation history
+# sent with a chat turn; older turns are dropped (or summarized)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+# Fold dropped turns into a running summary, at the cost of one extra call
+CONTEXT_SUMMARIZE = os.getenv("CONTEXT_SUMMARIZE", "false").lower() == "true"
+# Tool results longer than this are replaced by a stub once the model has read them
+CONTEXT_TOOL_RESULT_CHARS = int(os.getenv("CONTEXT_TOOL_RESULT_CHARS", "200"))
+
+# How revise_story applies feedback:
+#   full        - the model rewrites the whole story
+#   incremental - only the paragraphs the feedback is about are rewritten
+#                 (in parallel) and spliced back in; feedback about more than
+#                 REVISION_MAX_FRACTION of the story falls back to full
+REVISION_MODE = os.getenv("REVISION_MODE", "full")
+REVISION_MAX_FRACTION = float(os.getenv("REVISION_MAX_FRACTION", "0.5"))
+
+# Load the model client, response cache and spelling index when the API
+# starts instead of on the first request that needs them
+WARMUP = os.getenv("WARMUP", "true").lower() == "true"
+
+# LLM clients (see llm_clients.py): one connection pool shared by every model
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.5-flash")
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+# Idle connections kept open for reuse, and for how long (seconds)
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+# Multiplex concurrent calls over fewer connections (needs the h2 package)
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "false").lower() == "true"
+
+# Semantic prompt cache in front of generate_story (see semantic_cache.py)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+# Stored next to the checkpoint database by default
+SEMANTIC_CACHE_DB = os.getenv("SEMANTIC_CACHE_DB", os.path.join(os.path.dirname(DB_PATH), "semantic_cache.db"))
+# Cosine similarity (0-1) from which a cached prompt counts as the same request
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.8"))
+# serve - answer with the cached draft, no model call
+# seed  - have the model adapt the cached draft to the new prompt
+SEMANTIC_CACHE_MODE = os.getenv("SEMANTIC_CACHE_MODE", "serve")
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Model routing (see model_router.py): the models serving each node, in
+# fallback order, as "node,node=model>model" routes separated by ";". "*"
+# sets the route of every node not listed; without one they use LLM_MODEL.
+# Title, moral, grammar and paragraph locating write a few words, so a
+# smaller model does them by default
+LLM_ROUTES = os.getenv(
+    "LLM_ROUTES",
+    "title_generator,moral_extractor,grammar_check,locate_paragraphs=gemini-2.5-flash-lite>gemini-2.5-flash",
+)
+# Attempts on a model before its call goes to the next one in the route (the
+# last model of a route gets LLM_MAX_ATTEMPTS). A model whose rate limit
+# budget is spent is skipped at once instead of queued for
+LLM_FALLBACK_ATTEMPTS = int(os.getenv("LLM_FALLBACK_ATTEMPTS", "1"))
+# Nodes whose calls race the first two models of their route: the second
+# starts when the first has not answered after LLM_HEDGE_DELAY_MS, and the
+# slower one is cancelled. Each hedge can pay for two calls, and both would
+# stream tokens, so leave generate_story and revise_story out
+LLM_HEDGE_NODES = set(filter(None, os.getenv("LLM_HEDGE_NODES", "").split(",")))
+# 0 hedges at the first model's observed p95 latency for that node
+LLM_HEDGE_DELAY_MS = float(os.getenv("LLM_HEDGE_DELAY_MS", "0"))
+# USD per million input/output tokens by model; models not listed use
+# LLM_INPUT_COST_PER_MTOK and LLM_OUTPUT_COST_PER_MTOK
+LLM_MODEL_COSTS = os.getenv(
+    "LLM_MODEL_COSTS",
+    "gemini-2.5-flash=0.30/2.50,gemini-2.5-flash-lite=0.10/0.40,gemini-2.5-pro=1.25/10",
+)
+
+# Background jobs (see jobs.py): graph runs queued by /api/jobs/* and run by
+# this many workers per API process
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "8"))
+# Jobs allowed to wait for a worker; more are refused with 503
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "1000"))
+# How long finished jobs can still be looked up (seconds)
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", "3600"))
+# Longest a GET /api/jobs/{id}?wait=... long-poll is held open (seconds)
+JOB_LONG_POLL_SECONDS = float(os.getenv("JOB_LONG_POLL_SECONDS", "30"))
+# Webhooks: per-attempt timeout (seconds), attempts, and the key signing
+# their bodies (X-Signature: sha256=<hmac>); unsigned when empty
+JOB_WEBHOOK_TIMEOUT = float(os.getenv("JOB_WEBHOOK_TIMEOUT", "10"))
+JOB_WEBHOOK_ATTEMPTS = int(os.getenv("JOB_WEBHOOK_ATTEMPTS", "3"))
+JOB_WEBHOOK_SECRET = os.getenv("JOB_WEBHOOK_SECRET", "")
+# Where webhooks may be sent: hosts ("hooks.example.com", "*.example.com")
+# or URL prefixes ("https://example.com/hooks/"), comma separated. Only
+# https, and never to private, loopback or link-local addresses; with the
+# list empty, webhook_url is refused
+JOB_WEBHOOK_ALLOWED = [h.strip() for h in os.getenv("JOB_WEBHOOK_ALLOWED", "").split(",") if h.strip()]
+
+# Session locks (see session_locks.py): how long a request waits for another
+# run on the same session before it is refused with 409 (seconds), and how
+# long a worker's lease on a session lasts unless renewed
+SESSION_LOCK_WAIT_SECONDS = float(os.getenv("SESSION_LOCK_WAIT_SECONDS", "120"))
+SESSION_LEASE_SECONDS = float(os.getenv("SESSION_LEASE_SECONDS", "30"))
+# How long a finished /api/feedback result is replayed for its idempotency key
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+
+# Hot session cache (see hot_sessions.py): the state of recently active
+# sessions kept in memory, up to this many megabytes (0 turns it off)
+HOT_SESSIONS_MAX_MB = float(os.getenv("HOT_SESSIONS_MAX_MB", "64"))
@@ -0,0 +1,91 @@
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately, trim_messages
+
+from metrics import registry
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_TOOL_RESULT_CHARS
+
+# -----------------------------
+# Prompt context
+# -----------------------------
+# `messages` channels use the add_messages reducer, so they only ever grow.
+# Sending all of them on every turn makes input tokens, latency and
+# checkpoint size grow with the length of the session. The helpers here keep
+# a node's prompt within a token budget (the system prompt, a running summary
+# of older turns and the most recent turns), and shrink the stored history
+# once messages have served their purpose.
+#
+# Token counts are approximate (about 4 characters a token), which is close
+# enough for budgeting and costs nothing.
+
+registry.describe("story_llm_context_tokens_total", "Approximate prompt tokens per node: the whole history vs what was sent.")
+registry.describe("story_context_messages_dropped_total", "Messages removed from stored conversations by node and reason.")
+
+
+def count_tokens(messages) -> int:
+    return count_tokens_approximately(messages)
+
+
+def split(messages: List, budget: int) -> Tuple[List, List]:
+    """(older, recent): the most recent whole turns that fit in `budget`
+    tokens, and everything before them. A turn starts at a human message, so
+    tool calls are never separated from their results. The last turn is kept
+    even if it alone is over budget."""
+    recent = trim_messages(messages, max_tokens=max(budget, 0), token_counter=count_tokens,
+                           strategy="last", start_on="human", allow_partial=False)
+    if not recent:
+        starts = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+        recent = messages[starts[-1]:] if starts else list(messages)
+    return list(messages[:len(messages) - len(recent)]), list(recent)
+
+
+def fit(node: str, system: SystemMessage, messages: List, summary: Optional[str] = None,
+        budget: int = CONTEXT_TOKEN_BUDGET) -> List:
+    """The prompt for `node`: system message, summary of older turns if there
+    is one, and as many recent turns as the budget allows."""
+    head = [system]
+    if summary:
+        head.append(SystemMessage(content=f"Summary of the earlier conversation: {summary}"))
+    _, recent = split(messages, budget - count_tokens(head))
+    prompt = head + recent
+    registry.inc("story_llm_context_tokens_total", (("node", node), ("stage", "history")), count_tokens([system] + messages))
+    registry.inc("story_llm_context_tokens_total", (("node", node), ("stage", "sent")), count_tokens(prompt))
+    return prompt
+
+
+def forget(node: str, messages: List, budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[List, List]:
+    """(removals, older): RemoveMessage updates for the turns that no longer
+    fit in the budget, and those turns, e.g. to fold into a summary."""
+    older, _ = split(messages, budget)
+    if older:
+        registry.inc("story_context_messages_dropped_total", (("node", node), ("reason", "budget")), len(older))
+    return [RemoveMessage(id=m.id) for m in older], older
+
+
+def stub_tool_results(node: str, messages: List, max_chars: int = CONTEXT_TOOL_RESULT_CHARS) -> List:
+    """Replacements (same ids) for tool results longer than `max_chars`:
+    once the model has read a result, later turns only need to know it was
+    there, not the whole payload."""
+    stubs = [
+        ToolMessage(content=f"[{len(m.content)} characters of tool output, already used]",
+                    tool_call_id=m.tool_call_id, name=m.name, id=m.id)
+        for m in messages
+        if isinstance(m, ToolMessage) and isinstance(m.content, str) and len(m.content) > max_chars
+    ]
+    if stubs:
+        registry.inc("story_context_messages_dropped_total", (("node", node), ("reason", "tool_result")), len(stubs))
+    return stubs
+
+
+def remove_tool_turn(node: str, messages: List) -> List:
+    """RemoveMessage updates for the last tool-calling AI message and its
+    results, once whatever they produced has been copied into the state."""
+    for i in range(len(messages) - 1, -1, -1):
+        message = messages[i]
+        if isinstance(message, AIMessage) and message.tool_calls:
+            call_ids = {call["id"] for call in message.tool_calls}
+            turn = [message] + [m for m in messages[i + 1:] if isinstance(m, ToolMessage) and m.tool_call_id in call_ids]
+            registry.inc("story_context_messages_dropped_total", (("node", node), ("reason", "tool_turn")), len(turn))
+            return [RemoveMessage(id=m.id) for m in turn]
+    return []
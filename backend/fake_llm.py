@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# Body of every fake draft: about 1KB, like a short generated story, with a
+# couple of misspellings for the correction pass to find
+STORY_PARAGRAPHS = [
+    "Every morning the hero set out across the valey, past the mill and the old stone bridge, "
+    "and every evening returned a little wiser than before.",
+    "The villagers watched from their doorways. Some laughed, some shook their heads, and a few, "
+    "the ones who remembered what the valley had been like before the long winter, simply waited.",
+    "One day a storm rolled down from the mountains. The river rose, the bridge groaned, and the "
+    "hero found that all those ordinary mornings had taught them exactly where the water would run.",
+    "They led the families to the high meadow by the path no one else had bothered to learn, "
+    "carrying the smallest children on their shoulders and singing to keep evryone moving.",
+    "When the water fell again, the village was muddy and tired but whole, and nobody laughed at "
+    "the hero's morning walks any more.",
+]
+STORY_ENDING = "In the end, they learned that courage is a habit, not a gift."
+
+# -----------------------------
+# Fake chat model
+# -----------------------------
+# Offline stand-in for Gemini used by the benchmarks. Replies are derived from
+# the node's system prompt so the graph sees the same shapes it gets from the
+# real model, including a fix_grammar_locally tool call when tools are bound.
+# Text is streamed word by word when a streaming callback is attached (e.g.
+# graph.astream(..., stream_mode="messages")).
+# With jitter > 0 the time to first token is log-normal around `latency`,
+# seeded from the conversation so a rerun sees the same delays.
+class FakeStoryLLM(BaseChatModel):
+    latency: float = 0.05  # median seconds until the first token
+    token_delay: float = 0.0  # seconds between streamed tokens
+    jitter: float = 0.0  # sigma of the log-normal latency; 0 is fixed
+    seed: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-story"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _reply(self, messages: List[BaseMessage], tools: Optional[list]) -> AIMessage:
+        message = self._answer(messages, tools)
+        # Roughly four characters per token, like English text on Gemini
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4 + 1
+        output_tokens = len(message.content) // 4 + 10 * len(message.tool_calls) + 1
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        return message
+
+    def _answer(self, messages: List[BaseMessage], tools: Optional[list]) -> AIMessage:
+        system = next((m.content for m in messages if isinstance(m, SystemMessage)), "")
+        human = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+
+        if tools:
+            name = tools[0]["function"]["name"]
+            return AIMessage(
+                content="",
+                tool_calls=[{"name": name, "args": {"text": human}, "id": f"call_{uuid.uuid4().hex[:12]}"}]
+            )
+        if "storyteller" in system:
+            content = "\n\n".join([f"Once upon a time, {human.rstrip('.')}.", *STORY_PARAGRAPHS, STORY_ENDING])
+        elif "locate" in system:
+            # Feedback is about the ending, as in the editor branch below
+            content = str(len(re.findall(r"^\[\d+\]", human, re.M)))
+        elif "one paragraph" in system:
+            feedback = human.partition("\n\nStory:")[0].replace("Feedback: ", "").strip()
+            content = f"{human.rpartition(':' + chr(10))[2]} ({feedback})"
+        elif "editor" in system:
+            # Rewrites the ending only, like most real feedback does
+            feedback, _, story = human.partition("\n\nStory: ")
+            paragraphs = story.split("\n\n")
+            ending = f"{STORY_ENDING} ({feedback.replace('Feedback: ', '').strip()})"
+            content = "\n\n".join(paragraphs[:-1] + [ending])
+        elif "title" in system:
+            content = "The Hero of the Valley"
+        elif "moral" in system:
+            content = "Courage grows through small, repeated acts."
+        else:
+            content = human
+        return AIMessage(content=content)
+
+    def _chunks(self, message: AIMessage) -> List[AIMessageChunk]:
+        if message.tool_calls:
+            return [AIMessageChunk(content="", usage_metadata=message.usage_metadata, tool_call_chunks=[
+                {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                for i, c in enumerate(message.tool_calls)
+            ])]
+        # An empty reply is still one (empty) chunk
+        tokens = re.findall(r"\S+\s*|\s+", message.content) or [""]
+        chunks = [AIMessageChunk(content=token) for token in tokens]
+        # Usage arrives with the last chunk, as with the real streaming APIs
+        chunks[-1].usage_metadata = message.usage_metadata
+        return chunks
+
+    def _first_token_delay(self, messages: List[BaseMessage]) -> float:
+        if not self.jitter:
+            return self.latency
+        digest = hashlib.sha256("\x00".join(str(m.content) for m in messages).encode("utf-8")).hexdigest()
+        return self.latency * random.Random(f"{self.seed}:{digest}").lognormvariate(0, self.jitter)
+
+    def _total_latency(self, messages: List[BaseMessage], message: AIMessage) -> float:
+        return self._first_token_delay(messages) + self.token_delay * max(len(self._chunks(message)) - 1, 0)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        message = self._reply(messages, kwargs.get("tools"))
+        time.sleep(self._total_latency(messages, message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        message = self._reply(messages, kwargs.get("tools"))
+        await asyncio.sleep(self._total_latency(messages, message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self._first_token_delay(messages))
+        for i, chunk in enumerate(self._chunks(self._reply(messages, kwargs.get("tools")))):
+            if i:
+                time.sleep(self.token_delay)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._first_token_delay(messages))
+        for i, chunk in enumerate(self._chunks(self._reply(messages, kwargs.get("tools")))):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
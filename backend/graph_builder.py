@@ -1,34 +1,93 @@
-import sqlite3
+from contextlib import asynccontextmanager
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.sqlite import SqliteSaver
 from langgraph.prebuilt import ToolNode
 from graph_nodes import State, generate_story, human_feedback, revise_story, title_generator, moral_extractor,grammar_check_node,apply_corrections
+from graph_nodes import fix_grammar_direct, route_grammar
+from graph_nodes import agenerate_story, arevise_story, atitle_generator, amoral_extractor, agrammar_check_node
 from tools import fix_grammar_locally
+from checkpointer import PooledSqliteSaver, postgres_saver
+from metrics import llm_usage
+from revision_store import DeltaSerializer
+from config import DB_PATH, CHECKPOINT_POOL_SIZE, CHECKPOINT_COMMIT_WINDOW_MS
+from config import CHECKPOINT_BACKEND, CHECKPOINT_URL, CHECKPOINT_TTL_HOURS
+from config import STORY_DELTA_ENCODING, STORY_DELTA_MIN_LENGTH
 
-def create_graph():
+def create_graph(checkpointer=None, use_async=False):
+    """Build the story graph.
+
+    With use_async=True the LLM nodes are the awaiting variants, for running
+    the graph with astream/ainvoke from the API; the checkpointer must then
+    support the async interface too.
+    """
     builder = StateGraph(State)
-    builder.add_node("generate_story", generate_story)
-    builder.add_node("grammar_check",grammar_check_node)
+    builder.add_node("generate_story", agenerate_story if use_async else generate_story)
+    builder.add_node("grammar_check", agrammar_check_node if use_async else grammar_check_node)
     builder.add_node("execute_tool", ToolNode([fix_grammar_locally]))
     builder.add_node("apply_fix", apply_corrections)
+    builder.add_node("fix_grammar", fix_grammar_direct)
     builder.add_node("human_feedback",human_feedback)
-    builder.add_node("revise_story", revise_story)
-    builder.add_node("title_generator", title_generator)
-    builder.add_node("moral_extractor", moral_extractor)
+    builder.add_node("revise_story", arevise_story if use_async else revise_story)
+    builder.add_node("title_generator", atitle_generator if use_async else title_generator)
+    builder.add_node("moral_extractor", amoral_extractor if use_async else moral_extractor)
 
     builder.add_edge(START, "generate_story")
-    builder.add_edge("generate_story", "grammar_check")
-    
+    # Local correction runs directly unless the grammar policy asks for the
+    # LLM tool-calling route (grammar_check -> execute_tool -> apply_fix)
+    builder.add_conditional_edges("generate_story", route_grammar, ["fix_grammar", "grammar_check"])
+    builder.add_edge("fix_grammar", "human_feedback")
+
     # Route to tool execution
     builder.add_edge("grammar_check", "execute_tool")
     builder.add_edge("execute_tool", "apply_fix")
     builder.add_edge("apply_fix", "human_feedback")
     builder.add_edge("revise_story", "human_feedback")
-    builder.add_edge("title_generator", "moral_extractor")
+    # human_feedback fans out to both finalization nodes; they join at END
+    builder.add_edge("title_generator", END)
     builder.add_edge("moral_extractor", END)
 
-    memory = SqliteSaver(sqlite3.connect("stories.db", check_same_thread=False))
-    return builder.compile(checkpointer=memory)
+    if checkpointer is None:
+        checkpointer = open_checkpointer()
+    # Every model call made inside the graph reports its token usage
+    return builder.compile(checkpointer=checkpointer).with_config(callbacks=[llm_usage])
+
+def open_checkpointer(db_path: str = DB_PATH, backend: str = CHECKPOINT_BACKEND, url: str = CHECKPOINT_URL):
+    """The configured checkpoint store (see CHECKPOINT_BACKEND). All of them
+    have sync and async interfaces and a close()."""
+    serde = DeltaSerializer(min_length=STORY_DELTA_MIN_LENGTH) if STORY_DELTA_ENCODING else None
+    if backend == "redis":
+        from redis_saver import RedisSaver
+        return RedisSaver.from_url(url, ttl=CHECKPOINT_TTL_HOURS * 3600, serde=serde)
+    if backend == "postgres":
+        return postgres_saver(url, pool_size=CHECKPOINT_POOL_SIZE, serde=serde)
+    if backend != "sqlite":
+        raise ValueError(f"Unknown CHECKPOINT_BACKEND: {backend}")
+    return PooledSqliteSaver(
+        db_path,
+        pool_size=CHECKPOINT_POOL_SIZE,
+        commit_window=CHECKPOINT_COMMIT_WINDOW_MS / 1000,
+        serde=serde,
+    )
+
+@asynccontextmanager
+async def open_async_graph(db_path: str = DB_PATH):
+    """Async graph backed by the pooled checkpointer, closed on exit."""
+    memory = open_checkpointer(db_path)
+    try:
+        yield create_graph(memory, use_async=True)
+    finally:
+        memory.close()
+
+# Global graph instance, compiled (and its checkpoint store opened) on first
+# use rather than at import: `graph_builder.graph` or get_graph()
+_graph = None
+
+def get_graph():
+    global _graph
+    if _graph is None:
+        _graph = create_graph()
+    return _graph
 
-# Global graph instance
-graph = create_graph()
+def __getattr__(name):
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
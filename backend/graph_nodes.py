@@ -1,57 +1,259 @@
 from typing import  List, Optional
 from typing_extensions import Annotated,TypedDict
-from langchain.chat_models import init_chat_model
-from langchain_core.messages import HumanMessage, SystemMessage,ToolMessage
-from langchain_core.tools import tool
-from langgraph.prebuilt import ToolNode
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage,ToolMessage
 from langgraph.types import interrupt, Command
-import time
 from state import State
 from tools import fix_grammar_locally
+from spellcheck import get_engine
+from langchain_core.runnables import RunnableConfig
 
-import os
-from dotenv import load_dotenv
-import language_tool_python
+import asyncio
+import threading
+import time
 
 from tracker import track_node
+from speculation import speculator
+from context import remove_tool_turn
+from metrics import registry
+import paragraphs
+from rate_limiter import limited, limiter_for
+from llm_clients import clients
+from model_router import router
+from llm_cache import ResponseCache, MemoryLRUCache, SqliteResponseCache
+from semantic_cache import SemanticCache
+from config import LLM_MODEL
+from config import LLM_CACHE_ENABLED, LLM_CACHE_DB, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_ROWS, LLM_CACHE_TTL, LLM_CACHE_NODES
+from config import GRAMMAR_MODE, GRAMMAR_LLM_THRESHOLD
+from config import REVISION_MODE, REVISION_MAX_FRACTION
+from config import SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_DB, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MODE
+from config import SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_TTL
 
 
-load_dotenv()
-
 # -----------------------------
 # LLM Initialization
 # -----------------------------
-llm = init_chat_model(
-    "google_genai:gemini-2.5-flash",
-    api_key=os.getenv("GOOGLE_API_KEY")
-)
+# The client and the response cache are built on first use (or by the API's
+# warm-up), not at import: importing the provider SDK alone takes about a
+# second, and scripts that only need the prompts or the graph shape should
+# not pay for it. Clients come from the shared registry (llm_clients.py);
+# benchmarks swap in stand-ins by assigning `llm` (every model) or entries of
+# `models` (one model name).
+llm = None
+models = {}
+response_cache = None
+_init_lock = threading.Lock()
+
+def get_llm(model: str = LLM_MODEL):
+    stand_in = models.get(model, llm)
+    return stand_in if stand_in is not None else clients.chat_model(model)
+
+# -----------------------------
+# Response cache
+# -----------------------------
+def get_response_cache():
+    """The response cache, or None when LLM_CACHE_ENABLED is off."""
+    global response_cache
+    if response_cache is None and LLM_CACHE_ENABLED:
+        with _init_lock:
+            if response_cache is None:
+                response_cache = ResponseCache(
+                    MemoryLRUCache(max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL),
+                    SqliteResponseCache(LLM_CACHE_DB, max_rows=LLM_CACHE_MAX_ROWS, ttl=LLM_CACHE_TTL),
+                )
+    return response_cache
+
+semantic_cache = None
 
+def get_semantic_cache():
+    """The semantic prompt cache, or None when SEMANTIC_CACHE_ENABLED is off."""
+    global semantic_cache
+    if semantic_cache is None and SEMANTIC_CACHE_ENABLED:
+        with _init_lock:
+            if semantic_cache is None:
+                semantic_cache = SemanticCache(
+                    SEMANTIC_CACHE_DB,
+                    threshold=SEMANTIC_CACHE_THRESHOLD,
+                    max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                    ttl=SEMANTIC_CACHE_TTL,
+                )
+    return semantic_cache
 
+# Rate limiter class of each node's calls: a user is waiting on drafts and
+# revisions, while title and moral can queue behind them
+NODE_PRIORITY = {"title_generator": "finalize", "moral_extractor": "finalize"}
 
+def model_for(node: str, tools=None):
+    """The node's route (model_router.py): each model behind its rate
+    limiter, with the response cache attached for cacheable nodes and
+    `tools` bound if given."""
+    cache = get_response_cache() if node in LLM_CACHE_NODES else None
 
+    def one(name: str, fallback: bool):
+        model = get_llm(name)
+        cached = model.model_copy(update={"cache": cache}) if cache is not None else model
+        return limited(cached, NODE_PRIORITY.get(node, "interactive"), tools=tools,
+                       limiter=limiter_for(name), fallback=fallback)
 
+    # Built once per node, tool set and models, not on every call
+    key = ("graph", id(router), node, tuple(t.name for t in tools or ()),
+           tuple(id(get_llm(name)) for name in router.chain(node)))
+    return clients.variant(key, lambda: router.runnable(node, one))
 
 
 # -----------------------------
-# Nodes
+# Prompts
 # -----------------------------
-@track_node("generate_story")
-def generate_story(state: State):
-    response = llm.invoke([
+# Shared by the sync nodes (used by scripts and the sync graph) and their
+# async twins (used by the FastAPI app), so both paths send the same prompts.
+def _generate_messages(state: State):
+    return [
         SystemMessage(content="You are a storyteller."),
         HumanMessage(content=state["prompt"])
-    ])
+    ]
+
+def _seeded_messages(state: State, draft: str):
+    return [
+        SystemMessage(content="You are a storyteller."),
+        HumanMessage(content=f"{state['prompt']}\n\nStart from this story, written for a similar request, "
+                             f"and change whatever this request needs:\n\n{draft}")
+    ]
+
+def _revise_messages(state: State):
+    return [
+        SystemMessage(content="You are an editor."),
+        HumanMessage(content=f"Feedback: {state['feedback']}\n\nStory: {state['story']}")
+    ]
+
+def _locate_messages(state: State, parts):
+    return [
+        SystemMessage(content="You locate the paragraphs of a story that feedback is about. "
+                              "Reply with their numbers, comma separated, or ALL if the feedback is about the whole story."),
+        HumanMessage(content=f"Feedback: {state['feedback']}\n\nStory:\n{paragraphs.numbered(parts)}")
+    ]
+
+def _paragraph_messages(state: State, parts, index: int):
+    return [
+        SystemMessage(content="You are an editor who rewrites one paragraph of a story. "
+                              "Reply with the new paragraph only, consistent with the rest of the story."),
+        HumanMessage(content=f"Feedback: {state['feedback']}\n\nStory:\n{paragraphs.numbered(parts)}"
+                             f"\n\nRewrite paragraph {index + 1}:\n{paragraphs.paragraphs(parts)[index]}")
+    ]
+
+def _title_messages(state: State):
+    return [
+        SystemMessage(content="You generate a creative title for a story."),
+        HumanMessage(content=state["story"])
+    ]
+
+def _moral_messages(state: State):
+    return [
+        SystemMessage(content="You extract the central moral or theme of a story."),
+        HumanMessage(content=state["story"])
+    ]
+
+def _grammar_messages(state: State):
+    return [
+        SystemMessage(content="You are a helpful editor. Use the fix_grammar_locally tool to clean up the story draft."),
+        HumanMessage(content=state["story"])
+    ]
+
+
+# -----------------------------
+# Drafts from similar prompts (SEMANTIC_CACHE_*)
+# -----------------------------
+def _similar_draft(state: State):
+    """(messages to send, cached draft to serve): the draft of a similar
+    earlier prompt is served as is, or used to seed the new one."""
+    cache = get_semantic_cache()
+    match = cache.lookup(state["prompt"]) if cache is not None else None
+    if match is None:
+        return _generate_messages(state), None
+    if SEMANTIC_CACHE_MODE == "serve":
+        return None, match
+    return _seeded_messages(state, match[1]), None
+
+def _draft(response, note: str = "Initial draft generated."):
     return {
         "story": getattr(response, "content", ""),
         "revision_count": 0,
-        "history": ["Initial draft generated."],
+        "history": [note],
         "messages": [response]
     }
 
+def _served_draft(match):
+    _, story, score = match
+    return _draft(AIMessage(content=story), f"Initial draft reused from a similar prompt (similarity {score:.2f}).")
+
+
+# -----------------------------
+# Revision plans (REVISION_MODE)
+# -----------------------------
+registry.describe("story_revisions_total", "Revisions by mode; incremental ones rewrite only some paragraphs.")
+registry.describe("story_revised_paragraphs_total", "Paragraphs rewritten by incremental revisions.")
+
+def _revision_parts(state: State):
+    """The story split into paragraphs if it should be revised incrementally."""
+    story = state["story"]
+    if REVISION_MODE != "incremental" or not isinstance(story, str):
+        return None
+    parts = paragraphs.split(story)
+    return parts if len(parts) > 1 else None
+
+# Lets the SSE stream tell the calls of an incremental revision apart
+LOCATE_CONFIG = {"metadata": {"revision_step": "locate"}}
+
+def _paragraph_configs(targets):
+    return [{"metadata": {"revision_step": "paragraph", "paragraph": i}} for i in targets]
+
+def _worth_rewriting(targets, parts) -> bool:
+    """Whether rewriting only `targets` beats rewriting the whole story."""
+    count = len(paragraphs.paragraphs(parts))
+    return bool(targets) and len(targets) <= REVISION_MAX_FRACTION * count
+
+def _full_revision(state: State, response):
+    registry.inc("story_revisions_total", (("mode", "full"),))
+    return {
+        "story": response.content,
+        "revision_count": state["revision_count"] + 1,
+        "changed_paragraphs": None,
+        "history": [f"Revision {state['revision_count'] + 1} applied."]
+    }
+
+def _spliced_revision(state: State, parts, targets, responses):
+    registry.inc("story_revisions_total", (("mode", "incremental"),))
+    registry.inc("story_revised_paragraphs_total", (), len(targets))
+    numbers = ", ".join(str(i + 1) for i in targets)
+    return {
+        "story": paragraphs.splice(parts, {i: r.content for i, r in zip(targets, responses)}),
+        "revision_count": state["revision_count"] + 1,
+        "changed_paragraphs": targets,
+        "history": [f"Revision {state['revision_count'] + 1} applied (paragraphs {numbers})."]
+    }
+
+
+# -----------------------------
+# Nodes
+# -----------------------------
+# Title and moral only read the final story, so they run as parallel branches
+FINALIZE_NODES = ["title_generator", "moral_extractor"]
+# Node and prompt behind each finalized field, also used by speculation.py
+FINALIZE_PROMPTS = {"title": ("title_generator", _title_messages), "moral": ("moral_extractor", _moral_messages)}
+
+@track_node("generate_story")
+def generate_story(state: State):
+    messages, match = _similar_draft(state)
+    if match is not None:
+        return _served_draft(match)
+    start = time.perf_counter()
+    response = model_for("generate_story").invoke(messages)
+    if semantic_cache is not None:
+        semantic_cache.add(state["prompt"], getattr(response, "content", ""), time.perf_counter() - start)
+    return _draft(response)
+
 @track_node("human_feedback")
 def human_feedback(state: State):
     if state["revision_count"] >= 3:
-        return Command(goto="title_generator")
+        return Command(goto=FINALIZE_NODES)
 
     user_input = interrupt({
         "current_story": state["story"],
@@ -60,57 +262,71 @@ def human_feedback(state: State):
     })
 
     if user_input.lower() == "done":
-        return Command(goto="title_generator")
+        return Command(goto=FINALIZE_NODES)
 
     return Command(update={"feedback": user_input}, goto="revise_story")
 
 @track_node("revise_story")
 def revise_story(state: State):
-    response = llm.invoke([
-        SystemMessage(content="You are an editor."),
-        HumanMessage(content=f"Feedback: {state['feedback']}\n\nStory: {state['story']}")
-    ])
-    return {
-        "story": response.content,
-        "revision_count": state["revision_count"] + 1,
-        "history": state["history"] + [f"Revision {state['revision_count'] + 1} applied."]
-    }
+    parts = _revision_parts(state)
+    if parts is not None:
+        count = len(paragraphs.paragraphs(parts))
+        targets = paragraphs.locate(state["feedback"], count)
+        if targets is None:
+            reply = model_for("locate_paragraphs").invoke(_locate_messages(state, parts), LOCATE_CONFIG)
+            targets = paragraphs.parse_located(reply.content, count)
+        if _worth_rewriting(targets, parts):
+            # One call per paragraph, run concurrently
+            responses = model_for("revise_story").batch([_paragraph_messages(state, parts, i) for i in targets], _paragraph_configs(targets))
+            return _spliced_revision(state, parts, targets, responses)
+    response = model_for("revise_story").invoke(_revise_messages(state))
+    return _full_revision(state, response)
 
 @track_node("title_generator")
 def title_generator(state: State):
-    response = llm.invoke([
-        SystemMessage(content="You generate a creative title for a story."),
-        HumanMessage(content=state["story"])
-    ])
+    response = model_for("title_generator").invoke(_title_messages(state))
     return {
-        "history": state["history"] + [f"Title: {response.content}"]
+        "title": response.content,
+        "history": [f"Title: {response.content}"]
     }
 
 @track_node("moral_extractor")
 def moral_extractor(state: State):
-    response = llm.invoke([
-        SystemMessage(content="You extract the central moral or theme of a story."),
-        HumanMessage(content=state["story"])
-    ])
+    response = model_for("moral_extractor").invoke(_moral_messages(state))
     return {
-        "history": state["history"] + [f"Moral: {response.content}"]
+        "moral": response.content,
+        "history": [f"Moral: {response.content}"]
     }
 @track_node("grammar_check_node")
 def grammar_check_node(state: State):
-    # Important: Small delay to stay under Gemini's Free Tier RPM limit
-    time.sleep(1) 
-    
     # Bind the tool so the LLM knows it can use it
-    llm_with_tools = llm.bind_tools([fix_grammar_locally])
+    llm_with_tools = model_for("grammar_check", tools=[fix_grammar_locally])
     
     # We ask the LLM to review the story. It will likely call the tool.
-    response = llm_with_tools.invoke([
-        SystemMessage(content="You are a helpful editor. Use the fix_grammar_locally tool to clean up the story draft."),
-        HumanMessage(content=state["story"])
-    ])
+    response = llm_with_tools.invoke(_grammar_messages(state))
     
     return {"messages": [response]}
 
+@track_node("fix_grammar")
+def fix_grammar_direct(state: State):
+    """Runs the local correction engine directly, without an LLM round trip."""
+    return {
+        "story": get_engine().correct(state["story"]),
+        "history": ["Grammar and spelling improved locally."]
+    }
+
+def route_grammar(state: State, config: RunnableConfig):
+    """Chooses the spelling pass for a new draft (see GRAMMAR_MODE).
+
+    The mode can be overridden per run with configurable["grammar_mode"].
+    """
+    mode = config.get("configurable", {}).get("grammar_mode", GRAMMAR_MODE)
+    if mode == "llm":
+        return "grammar_check"
+    if mode == "auto" and get_engine().correction_rate(state["story"]) > GRAMMAR_LLM_THRESHOLD:
+        return "grammar_check"
+    return "fix_grammar"
+
 @track_node("apply_corrections")
 def apply_corrections(state: State):
     """Takes the output from the tool and updates the 'story' field."""
@@ -120,6 +336,72 @@ def apply_corrections(state: State):
     if isinstance(last_message, ToolMessage):
         return {
             "story": last_message.content,
-            "history": state["history"] + ["Grammar and spelling improved locally."]
+            "history": ["Grammar and spelling improved locally."],
+            # The tool call and its result each hold a copy of the draft and
+            # nothing reads them again; without this every revision adds two
+            "messages": remove_tool_turn("apply_corrections", state["messages"])
         }
-    return {} # Do nothing if no tool was called
\ No newline at end of file
+    return {} # Do nothing if no tool was called
+
+
+# -----------------------------
+# Async Nodes
+# -----------------------------
+# Same behaviour as the nodes above, but awaiting the model so a slow Gemini
+# call does not block the event loop. human_feedback and apply_corrections do
+# no I/O and are shared by both graphs.
+@track_node("generate_story")
+async def agenerate_story(state: State):
+    # The lookup is in memory; only storing a new draft touches SQLite
+    messages, match = _similar_draft(state)
+    if match is not None:
+        return _served_draft(match)
+    start = time.perf_counter()
+    response = await model_for("generate_story").ainvoke(messages)
+    if semantic_cache is not None:
+        await asyncio.to_thread(semantic_cache.add, state["prompt"], getattr(response, "content", ""), time.perf_counter() - start)
+    return _draft(response)
+
+@track_node("revise_story")
+async def arevise_story(state: State):
+    parts = _revision_parts(state)
+    if parts is not None:
+        count = len(paragraphs.paragraphs(parts))
+        targets = paragraphs.locate(state["feedback"], count)
+        if targets is None:
+            reply = await model_for("locate_paragraphs").ainvoke(_locate_messages(state, parts), LOCATE_CONFIG)
+            targets = paragraphs.parse_located(reply.content, count)
+        if _worth_rewriting(targets, parts):
+            responses = await model_for("revise_story").abatch([_paragraph_messages(state, parts, i) for i in targets], _paragraph_configs(targets))
+            return _spliced_revision(state, parts, targets, responses)
+    response = await model_for("revise_story").ainvoke(_revise_messages(state))
+    return _full_revision(state, response)
+
+# Title and moral may already have been generated for this exact story while
+# it waited for feedback (SPECULATIVE_FINALIZE)
+@track_node("title_generator")
+async def atitle_generator(state: State):
+    title = await speculator.take(state.get("session_id"), state["story"], "title")
+    if title is None:
+        title = (await model_for("title_generator").ainvoke(_title_messages(state))).content
+    return {
+        "title": title,
+        "history": [f"Title: {title}"]
+    }
+
+@track_node("moral_extractor")
+async def amoral_extractor(state: State):
+    moral = await speculator.take(state.get("session_id"), state["story"], "moral")
+    if moral is None:
+        moral = (await model_for("moral_extractor").ainvoke(_moral_messages(state))).content
+    return {
+        "moral": moral,
+        "history": [f"Moral: {moral}"]
+    }
+
+@track_node("grammar_check_node")
+async def agrammar_check_node(state: State):
+    llm_with_tools = model_for("grammar_check", tools=[fix_grammar_locally])
+    response = await llm_with_tools.ainvoke(_grammar_messages(state))
+
+    return {"messages": [response]}
@@ -0,0 +1,170 @@
+import sys
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+from metrics import registry
+from config import HOT_SESSIONS_MAX_MB
+
+# -----------------------------
+# Hot session cache
+# -----------------------------
+# graph.aget_state reads and deserializes a session's latest checkpoint,
+# every LLM message included, and the API did that on each request: the
+# 404 check before feedback, the state after every run, GET /api/session.
+# Interactive sessions come back every few seconds, so their state is kept
+# in memory here, in least recently used order, up to HOT_SESSIONS_MAX_MB.
+#
+# The checkpointer stays the store of record. Runs write their checkpoints
+# as before and the state they end in is put here at the same time (taken
+# from the run's own stream, so no read follows the run). A cached state is
+# only used while the session index still has the version it was cached
+# at: the index sees every node update, on any worker, so a session changed
+# elsewhere is read again from the checkpoints.
+#
+# Sizes are estimates (sys.getsizeof over the values), good enough for a
+# ceiling, not an exact account.
+
+registry.describe("story_hot_sessions_lookups_total", "Hot session cache lookups by result.")
+registry.describe("story_hot_sessions_resident_bytes", "Estimated size of the session states held in memory.")
+registry.describe("story_hot_sessions_load_seconds", "Time to read a session state from the checkpoints on a miss.")
+
+# Containers nested deeper than this are counted shallowly
+MAX_SIZE_DEPTH = 8
+
+
+def _size(value, depth: int = 0) -> int:
+    size = sys.getsizeof(value)
+    if depth >= MAX_SIZE_DEPTH or isinstance(value, (str, bytes, int, float, bool, type(None))):
+        return size
+    if isinstance(value, dict):
+        return size + sum(_size(k, depth + 1) + _size(v, depth + 1) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(_size(v, depth + 1) for v in value)
+    # Messages and other objects: their attributes
+    attributes = getattr(value, "__dict__", None)
+    return size + (_size(attributes, depth + 1) if attributes else 0)
+
+
+class HotState:
+    """A session's state as the API reads it: `values` and `next` like
+    LangGraph's StateSnapshot. Shared between requests; do not mutate."""
+
+    __slots__ = ("values", "next", "version", "size")
+
+    def __init__(self, values: dict, next: Tuple[str, ...] = (), version: Optional[int] = None):
+        self.values = values
+        self.next = next
+        self.version = version
+        self.size = 0
+
+
+def follow(state: Optional[HotState], mode: str, chunk) -> Optional[HotState]:
+    """Folds one `values` or `tasks` stream chunk of a run into the state it
+    ends in; other modes pass through. Interrupted tasks are the `next`."""
+    if mode == "values":
+        values = {k: v for k, v in chunk.items() if k != "__interrupt__"}
+        return HotState(values, state.next if state else ())
+    if mode == "tasks" and chunk.get("interrupts"):
+        state = state or HotState({})
+        state.next += (chunk["name"],)
+    return state
+
+
+class HotSessions:
+    def __init__(self, graph, session_index, max_bytes: int = int(HOT_SESSIONS_MAX_MB * 1024 * 1024)):
+        self.graph = graph
+        self.session_index = session_index
+        self.max_bytes = max_bytes
+        self.resident = 0
+        self._states: "OrderedDict[str, HotState]" = OrderedDict()
+        self.counts = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0, "too_large": 0,
+                       "loads": 0, "load_seconds": 0.0}
+
+    async def get(self, session_id: str, summary: Optional[dict] = None) -> HotState:
+        """The session's state, from memory while the index has not moved
+        past it. `summary` is its index row if the caller has read it."""
+        summary = summary if summary is not None else await self.session_index.aget(session_id)
+        version = summary["version"] if summary is not None else None
+        state = self._states.get(session_id)
+        if state is not None and version is not None and state.version == version:
+            self._states.move_to_end(session_id)
+            self.counts["hits"] += 1
+            registry.inc("story_hot_sessions_lookups_total", (("result", "hit"),))
+            return state
+        self.counts["misses" if state is None else "stale"] += 1
+        registry.inc("story_hot_sessions_lookups_total", (("result", "miss" if state is None else "stale"),))
+        # The version is read first: a write landing in between leaves a
+        # newer state under an older version, which the next lookup reloads
+        return await self.load(session_id, version)
+
+    async def load(self, session_id: str, version: Optional[int] = None) -> HotState:
+        """Reads the session from the checkpoints and caches it."""
+        start = time.perf_counter()
+        snapshot = await self.graph.aget_state({"configurable": {"thread_id": session_id}})
+        elapsed = time.perf_counter() - start
+        self.counts["loads"] += 1
+        self.counts["load_seconds"] += elapsed
+        registry.observe("story_hot_sessions_load_seconds", (), elapsed)
+        state = HotState(snapshot.values, tuple(snapshot.next), version)
+        if state.values and version is not None:
+            self._keep(session_id, state)
+        else:
+            self.forget([session_id])
+        return state
+
+    def put(self, session_id: str, state: HotState, version: Optional[int]) -> HotState:
+        """Caches the state a run ended in (its checkpoints are already
+        written) under `version`, the index version that run wrote last.
+        Read back from the index instead, it could be a later write's."""
+        state.version = version
+        if version is None:
+            self.forget([session_id])
+        else:
+            self._keep(session_id, state)
+        return state
+
+    def forget(self, session_ids: Iterable[str]) -> None:
+        for session_id in session_ids:
+            state = self._states.pop(session_id, None)
+            if state is not None:
+                self._resize(-state.size)
+
+    def _keep(self, session_id: str, state: HotState) -> None:
+        self.forget([session_id])
+        state.size = _size(state.values) + sys.getsizeof(state)
+        if state.size > self.max_bytes:
+            self.counts["too_large"] += self.max_bytes > 0
+            return
+        self._states[session_id] = state
+        self._resize(state.size)
+        while self.resident > self.max_bytes:
+            _, evicted = self._states.popitem(last=False)
+            self._resize(-evicted.size)
+            self.counts["evictions"] += 1
+
+    def _resize(self, delta: int) -> None:
+        self.resident += delta
+        registry.add("story_hot_sessions_resident_bytes", (), delta)
+
+    def stats(self) -> dict:
+        lookups = self.counts["hits"] + self.counts["misses"] + self.counts["stale"]
+        loads = self.counts["loads"]
+        return {
+            "sessions": len(self._states),
+            "resident_bytes": self.resident,
+            "max_bytes": self.max_bytes,
+            "hits": self.counts["hits"],
+            "misses": self.counts["misses"],
+            # Cached, but changed since (by another worker, or outside a run)
+            "stale": self.counts["stale"],
+            "evictions": self.counts["evictions"],
+            "too_large": self.counts["too_large"],
+            # Reads from the checkpoints: misses, stale entries and enhancements
+            "loads": loads,
+            "hit_ratio": round(self.counts["hits"] / lookups, 4) if lookups else 0.0,
+            "mean_load_ms": round(self.counts["load_seconds"] / loads * 1000, 3) if loads else None,
+        }
+
+    def __len__(self) -> int:
+        return len(self._states)
@@ -0,0 +1,341 @@
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import socket
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional
+from urllib.parse import urlsplit
+
+from metrics import registry
+from config import JOB_CONCURRENCY, JOB_MAX_QUEUED, JOB_TTL_SECONDS, JOB_WEBHOOK_TIMEOUT, JOB_WEBHOOK_ATTEMPTS
+from config import JOB_WEBHOOK_SECRET, JOB_WEBHOOK_ALLOWED
+
+# -----------------------------
+# Background jobs
+# -----------------------------
+# /api/start and /api/feedback hold their HTTP request open for the whole
+# LLM chain, which runs into load balancer timeouts and ties a connection to
+# every session in flight. The /api/jobs endpoints queue the same graph run
+# instead and answer at once with a job id. A fixed pool of workers (the
+# JOB_CONCURRENCY bound on graph runs) takes jobs in order. Clients get the
+# result by long-polling the job, following its SSE stream, or from a
+# webhook.
+#
+# The queue lives in this process: a job is only known to the worker that
+# accepted it, and queued jobs are lost on shutdown. What a job produces is
+# checkpointed like any other run, so GET /api/session/{id} shows it from
+# any worker.
+#
+# Webhooks are requests the server makes on a client's behalf, signed with
+# our key. They only go to https URLs on JOB_WEBHOOK_ALLOWED, and never to
+# an address inside the network (checked when the job is submitted and
+# again before every delivery, which then connects to the checked address).
+
+registry.describe("story_job_queue_depth", "Jobs waiting for a worker.")
+registry.describe("story_job_wait_seconds", "Time jobs waited in the queue before a worker took them.")
+registry.describe("story_job_run_seconds", "Time workers spent running jobs.")
+registry.describe("story_jobs_total", "Finished jobs by kind and status.")
+registry.describe("story_job_webhooks_total", "Webhook deliveries by result.")
+
+FINISHED = ("done", "failed")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class WebhookRejected(Exception):
+    pass
+
+
+def _allowed(parts, host: str, allowed: List[str]) -> bool:
+    """Whether the split URL matches an entry: a host, a `*.` domain, or a
+    URL prefix (same scheme, host and port; path up to a `/`)."""
+    port = parts.port or 443
+    for entry in allowed:
+        if "://" in entry:
+            try:
+                prefix = urlsplit(entry)
+                prefix_port = prefix.port or 443
+            except ValueError:
+                continue
+            path = prefix.path.rstrip("/")
+            if (prefix.scheme == parts.scheme and (prefix.hostname or "") == host and prefix_port == port
+                    and (not path or parts.path == path or parts.path.startswith(path + "/"))):
+                return True
+        elif entry.startswith("*."):
+            if host.endswith(entry[1:].lower()):
+                return True
+        elif host == entry.lower():
+            return True
+    return False
+
+
+async def _resolve(host: str, port: int) -> List[str]:
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return [info[4][0] for info in infos]
+
+
+async def check_webhook(url: str, allowed: Optional[List[str]] = None) -> str:
+    """Raises WebhookRejected unless `url` is an https URL on the allowlist
+    whose host resolves only to public addresses. Returns the address to
+    connect to: resolving the name again could give another one."""
+    allowed = JOB_WEBHOOK_ALLOWED if allowed is None else allowed
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+        port = parts.port or 443
+    except ValueError:
+        raise WebhookRejected("webhook_url is not a valid URL")
+    if parts.scheme != "https" or not host:
+        raise WebhookRejected("webhook_url must be an https URL")
+    if parts.username or parts.password:
+        raise WebhookRejected("webhook_url must not carry credentials")
+    if not _allowed(parts, host, allowed):
+        raise WebhookRejected(f"webhooks to {host} are not allowed")
+    try:
+        addresses = await _resolve(host, port)
+    except socket.gaierror:
+        raise WebhookRejected(f"{host} does not resolve")
+    if not addresses:
+        raise WebhookRejected(f"{host} does not resolve")
+    for resolved in addresses:
+        address = ipaddress.ip_address(resolved.split("%")[0])
+        address = getattr(address, "ipv4_mapped", None) or address
+        if not address.is_global or address.is_multicast:
+            raise WebhookRejected(f"{host} resolves to a non-public address")
+    return addresses[0]
+
+
+def _pinned(url: str, address: str):
+    """The URL with its host replaced by `address`, and the Host header and
+    TLS server name (SNI, certificate check) of the original name."""
+    parts = urlsplit(url)
+    port = f":{parts.port}" if parts.port else ""
+    netloc = f"[{address}]{port}" if ":" in address else f"{address}{port}"
+    return parts._replace(netloc=netloc).geturl(), parts.netloc, {"sni_hostname": parts.hostname}
+
+
+class Job:
+    __slots__ = ("job_id", "kind", "session_id", "webhook_url", "run", "status", "result", "error",
+                 "created_at", "started_at", "finished_at", "finished", "listeners")
+
+    def __init__(self, kind: str, session_id: str, run: Callable[[], Awaitable[dict]], webhook_url: Optional[str]):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.session_id = session_id
+        self.webhook_url = webhook_url
+        self.run = run
+        self.status = "queued"
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.finished = asyncio.Event()
+        # Queues of the SSE streams following this job
+        self.listeners: List[asyncio.Queue] = []
+
+    def view(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "session_id": self.session_id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    def __init__(self, concurrency: int = JOB_CONCURRENCY, max_queued: int = JOB_MAX_QUEUED,
+                 ttl: float = JOB_TTL_SECONDS):
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._deliveries = set()
+        self._http = None
+        self.running = 0
+        self.counts = {"submitted": 0, "done": 0, "failed": 0, "rejected": 0}
+
+    def start(self) -> None:
+        """Starts the workers; must be called on the event loop."""
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def close(self) -> None:
+        for task in self._workers + list(self._deliveries):
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._deliveries, return_exceptions=True)
+        self._workers = []
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    # -----------------------------
+    # Submitting and following jobs
+    # -----------------------------
+    def submit(self, kind: str, session_id: str, run: Callable[[], Awaitable[dict]],
+               webhook_url: Optional[str] = None) -> Job:
+        """Queues `run` (a coroutine function returning the job's result).
+        Raises QueueFull when JOB_MAX_QUEUED jobs are already waiting."""
+        if self._queue.qsize() >= self.max_queued:
+            self.counts["rejected"] += 1
+            raise QueueFull(f"{self._queue.qsize()} jobs queued")
+        self._expire()
+        job = Job(kind, session_id, run, webhook_url)
+        self._jobs[job.job_id] = job
+        self.counts["submitted"] += 1
+        registry.add("story_job_queue_depth", (), 1)
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def position(self, job: Job) -> Optional[int]:
+        """Jobs ahead of a queued job, counting from 0."""
+        if job.status != "queued":
+            return None
+        ahead = 0
+        for other in self._jobs.values():
+            if other is job:
+                return ahead
+            ahead += other.status == "queued"
+        return None
+
+    async def wait(self, job: Job, timeout: float) -> Job:
+        """Returns once the job has finished or `timeout` seconds have passed."""
+        if job.status not in FINISHED:
+            try:
+                await asyncio.wait_for(job.finished.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    async def follow(self, job: Job):
+        """The job's view now and after every status change, until it finishes."""
+        updates: asyncio.Queue = asyncio.Queue()
+        job.listeners.append(updates)
+        try:
+            view = job.view()
+            while True:
+                yield view
+                if view["status"] in FINISHED:
+                    return
+                view = await updates.get()
+        finally:
+            job.listeners.remove(updates)
+
+    # -----------------------------
+    # Workers
+    # -----------------------------
+    def _set(self, job: Job, status: str) -> None:
+        job.status = status
+        view = job.view()
+        for updates in job.listeners:
+            updates.put_nowait(view)
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            registry.add("story_job_queue_depth", (), -1)
+            job.started_at = time.time()
+            registry.observe("story_job_wait_seconds", (("kind", job.kind),), job.started_at - job.created_at)
+            self.running += 1
+            self._set(job, "running")
+            try:
+                job.result = await job.run()
+                status = "done"
+            except asyncio.CancelledError:
+                job.error = "shutting down"
+                self._set(job, "failed")
+                raise
+            except Exception as e:
+                print(f"Error in job {job.job_id} ({job.kind} {job.session_id}): {e}")
+                job.error = getattr(e, "detail", None) or str(e)
+                status = "failed"
+            finally:
+                self.running -= 1
+                job.run = None
+            job.finished_at = time.time()
+            registry.observe("story_job_run_seconds", (("kind", job.kind),), job.finished_at - job.started_at)
+            registry.inc("story_jobs_total", (("kind", job.kind), ("status", status)))
+            self.counts[status] += 1
+            self._set(job, status)
+            job.finished.set()
+            if job.webhook_url:
+                delivery = asyncio.create_task(self._deliver(job))
+                self._deliveries.add(delivery)
+                delivery.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, job: Job) -> None:
+        """POSTs the finished job to its webhook, retrying with backoff. With
+        JOB_WEBHOOK_SECRET set the body is signed (X-Signature: sha256=...)."""
+        import httpx
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=JOB_WEBHOOK_TIMEOUT)
+        try:
+            # The name may point somewhere else by now; the request goes to
+            # the address checked here, not to whatever it resolves to next
+            address = await check_webhook(job.webhook_url)
+        except WebhookRejected as e:
+            print(f"Webhook for job {job.job_id} not sent: {e}")
+            registry.inc("story_job_webhooks_total", (("result", "rejected"),))
+            return
+        url, host, extensions = _pinned(job.webhook_url, address)
+        body = json.dumps(job.view()).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Host": host}
+        if JOB_WEBHOOK_SECRET:
+            signature = hmac.new(JOB_WEBHOOK_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+            headers["X-Signature"] = f"sha256={signature}"
+        for attempt in range(JOB_WEBHOOK_ATTEMPTS):
+            try:
+                response = await self._http.post(url, content=body, headers=headers, extensions=extensions)
+                if response.status_code < 400:
+                    registry.inc("story_job_webhooks_total", (("result", "delivered"),))
+                    return
+                error = f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                error = str(e) or type(e).__name__
+            if attempt < JOB_WEBHOOK_ATTEMPTS - 1:
+                await asyncio.sleep(2 ** attempt)
+        print(f"Webhook for job {job.job_id} failed: {error}")
+        registry.inc("story_job_webhooks_total", (("result", "failed"),))
+
+    def _expire(self) -> None:
+        """Forgets finished jobs older than the TTL (oldest first)."""
+        cutoff = time.time() - self.ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.created_at >= cutoff:
+                break
+            if job.status in FINISHED:
+                del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        queued = self._queue.qsize() if self._queue is not None else 0
+        waiting = [time.time() - job.created_at for job in self._jobs.values() if job.status == "queued"]
+        return {
+            "workers": len(self._workers),
+            "queued": queued,
+            "running": self.running,
+            "max_queued": self.max_queued,
+            "oldest_queued_seconds": round(max(waiting), 3) if waiting else None,
+            "jobs_kept": len(self._jobs),
+            **self.counts,
+            "wait_seconds": registry.summary("story_job_wait_seconds"),
+            "run_seconds": registry.summary("story_job_run_seconds"),
+        }
+
+
+jobs = JobQueue()
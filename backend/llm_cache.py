@@ -0,0 +1,206 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+
+# -----------------------------
+# LLM response cache
+# -----------------------------
+# Plugs into LangChain's per-model cache hook (`model.cache`), which hands us
+# the serialized messages (`prompt`) and the model name + parameters
+# (`llm_string`). Entries are content addressed by a hash of both, so any
+# change to the model, its settings or the conversation is a different key.
+def cache_key(prompt: str, llm_string: str) -> str:
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+class MemoryLRUCache:
+    """In-process tier: bounded LRU with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 512, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value) -> None:
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteResponseCache:
+    """Persistent tier: survives restarts and is shared by worker processes."""
+
+    def __init__(self, path: str, max_rows: int = 10000, ttl: Optional[float] = None):
+        self.path = path
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        self.evictions = 0
+        self._conn().executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at);
+            """
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; lookups run in executor threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        conn = self._conn()
+        row = conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, created_at = row
+        now = time.time()
+        if self.ttl and created_at + self.ttl < now:
+            with conn:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            return None
+        with conn:
+            conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+        # Amortize eviction instead of counting rows on every write
+        self._writes += 1
+        if self._writes % 50 == 0:
+            self.evict()
+
+    def evict(self) -> int:
+        conn = self._conn()
+        removed = 0
+        with conn:
+            if self.ttl:
+                removed += conn.execute(
+                    "DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,)
+                ).rowcount
+            (count,) = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+            if count > self.max_rows:
+                removed += conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN "
+                    "(SELECT key FROM llm_cache ORDER BY accessed_at ASC LIMIT ?)",
+                    (count - self.max_rows,),
+                ).rowcount
+        self.evictions += removed
+        return removed
+
+    def clear(self) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM llm_cache")
+
+    def __len__(self) -> int:
+        (count,) = self._conn().execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        return count
+
+
+class ResponseCache(BaseCache):
+    """Two-tier (memory, then SQLite) cache for chat model generations."""
+
+    def __init__(self, memory: MemoryLRUCache, persistent: Optional[SqliteResponseCache] = None):
+        self.memory = memory
+        self.persistent = persistent
+        self.hits = {"memory": 0, "sqlite": 0}
+        self.misses = 0
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        key = cache_key(prompt, llm_string)
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits["memory"] += 1
+            return value
+        if self.persistent is not None:
+            stored = self.persistent.get(key)
+            if stored is not None:
+                value = loads(stored, allowed_objects="core")
+                self.memory.set(key, value)
+                self.hits["sqlite"] += 1
+                return value
+        self.misses += 1
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        key = cache_key(prompt, llm_string)
+        self.memory.set(key, return_val)
+        if self.persistent is not None:
+            self.persistent.set(key, dumps(return_val))
+
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        # Memory hits are answered inline; only the SQLite tier needs a thread
+        key = cache_key(prompt, llm_string)
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits["memory"] += 1
+            return value
+        return await super().alookup(prompt, llm_string)
+
+    def clear(self, **kwargs) -> None:
+        self.memory.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
+
+    def stats(self) -> dict:
+        hits = sum(self.hits.values())
+        total = hits + self.misses
+        return {
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "hit_ratio": round(hits / total, 4) if total else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_evictions": self.memory.evictions,
+            "sqlite_entries": len(self.persistent) if self.persistent is not None else 0,
+            "sqlite_evictions": self.persistent.evictions if self.persistent is not None else 0,
+        }
@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional
+
+import httpx
+
+from metrics import registry
+from config import LLM_MODEL, LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE, LLM_KEEPALIVE_SECONDS, LLM_HTTP2
+
+# -----------------------------
+# LLM clients
+# -----------------------------
+# One place that builds the chat models and owns their HTTP connections.
+# Every model built here talks through the same transport, so concurrent
+# sessions share one pool of keep-alive connections (and HTTP/2 streams with
+# LLM_HTTP2) instead of each client module opening its own. A new TLS
+# connection to the API costs a round trip or two on top of the call itself.
+#
+# Runnables derived from a model (tools bound, behind the rate limiter) are
+# cached too, so a node does not redo that work on every invocation.
+#
+# The transport traces connection setup, so /api/admin/clients and /metrics
+# show how many requests reused a connection and what a new one cost.
+
+registry.describe("story_llm_http_requests_total", "HTTP requests to the LLM provider by whether they opened a new connection.")
+registry.describe("story_llm_connect_seconds_total", "Time spent opening LLM provider connections (TCP and TLS).")
+
+SETUP_EVENTS = ("connection.connect_tcp.", "connection.start_tls.", "http2.send_connection_init.")
+
+
+class _ConnectProbe:
+    """httpcore trace callback for one request: did it open a connection,
+    and how long did that take."""
+
+    __slots__ = ("started", "finished", "parent")
+
+    def __init__(self, parent=None):
+        self.started = None
+        self.finished = None
+        self.parent = parent
+
+    def _record(self, name: str) -> None:
+        if name.startswith(SETUP_EVENTS):
+            now = time.perf_counter()
+            if self.started is None:
+                self.started = now
+            self.finished = now
+
+    def trace(self, name: str, info: dict) -> None:
+        self._record(name)
+        if self.parent:
+            self.parent(name, info)
+
+    async def atrace(self, name: str, info: dict) -> None:
+        self._record(name)
+        if self.parent:
+            await self.parent(name, info)
+
+
+class PooledTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """A sync and an async connection pool behind one object, so it can be
+    handed to clients that build both from the same arguments."""
+
+    def __init__(self, limits: httpx.Limits, http2: bool = False):
+        self.stats = {"requests": 0, "new": 0, "reused": 0, "connect_seconds": 0.0}
+        self._lock = threading.Lock()
+        self._sync = httpx.HTTPTransport(limits=limits, http2=http2)
+        self._async = httpx.AsyncHTTPTransport(limits=limits, http2=http2)
+
+    def _account(self, probe: _ConnectProbe) -> None:
+        new = probe.started is not None
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["new" if new else "reused"] += 1
+            if new:
+                self.stats["connect_seconds"] += probe.finished - probe.started
+        registry.inc("story_llm_http_requests_total", (("connection", "new" if new else "reused"),))
+        if new:
+            registry.inc("story_llm_connect_seconds_total", (), probe.finished - probe.started)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        probe = _ConnectProbe(request.extensions.get("trace"))
+        request.extensions = {**request.extensions, "trace": probe.trace}
+        response = self._sync.handle_request(request)
+        self._account(probe)
+        return response
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        probe = _ConnectProbe(request.extensions.get("trace"))
+        request.extensions = {**request.extensions, "trace": probe.atrace}
+        response = await self._async.handle_async_request(request)
+        self._account(probe)
+        return response
+
+    def close(self) -> None:
+        self._sync.close()
+
+    async def aclose(self) -> None:
+        await self._async.aclose()
+
+
+class ClientRegistry:
+    def __init__(self, max_connections: int = LLM_MAX_CONNECTIONS, max_keepalive: int = LLM_MAX_KEEPALIVE,
+                 keepalive_expiry: float = LLM_KEEPALIVE_SECONDS, http2: bool = LLM_HTTP2):
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.http2 = http2
+        self.transport: Optional[PooledTransport] = None
+        self._models: Dict[Hashable, object] = {}
+        self._variants: Dict[Hashable, object] = {}
+        self._lock = threading.RLock()
+
+    def _transport(self) -> PooledTransport:
+        if self.transport is None:
+            http2 = self.http2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    print("LLM_HTTP2 needs the h2 package (pip install 'httpx[http2]'); using HTTP/1.1")
+                    http2 = False
+            self.transport = PooledTransport(self.limits, http2=http2)
+        return self.transport
+
+    def chat_model(self, model: str = LLM_MODEL, api_key: Optional[str] = None, **kwargs):
+        """The Gemini chat model with these settings, built once and shared."""
+        api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        key = (model, api_key, tuple(sorted(kwargs.items())))
+        with self._lock:
+            if key not in self._models:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+                self._models[key] = ChatGoogleGenerativeAI(
+                    model=model,
+                    google_api_key=api_key,
+                    client_args={"transport": self._transport()},
+                    **kwargs,
+                )
+            return self._models[key]
+
+    def variant(self, key: Hashable, build: Callable[[], object]):
+        """The runnable cached under `key`, built by `build()` the first time."""
+        runnable = self._variants.get(key)
+        if runnable is None:
+            with self._lock:
+                runnable = self._variants.get(key)
+                if runnable is None:
+                    runnable = self._variants[key] = build()
+        return runnable
+
+    def stats(self) -> dict:
+        stats = dict(self.transport.stats) if self.transport else {"requests": 0, "new": 0, "reused": 0, "connect_seconds": 0.0}
+        mean = stats["connect_seconds"] / stats["new"] if stats["new"] else None
+        return {
+            "models": len(self._models),
+            "variants": len(self._variants),
+            **stats,
+            "mean_connect_seconds": mean,
+            # What the reused requests would have paid to connect
+            "saved_seconds": mean * stats["reused"] if mean is not None else None,
+        }
+
+    async def aclose(self) -> None:
+        with self._lock:
+            transport, self.transport = self.transport, None
+            self._models.clear()
+            self._variants.clear()
+        if transport is not None:
+            await transport.aclose()
+            transport.close()
+
+
+clients = ClientRegistry()
@@ -0,0 +1,245 @@
+import bisect
+import functools
+import os
+import threading
+import uuid
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from config import LLM_INPUT_COST_PER_MTOK, LLM_OUTPUT_COST_PER_MTOK, LLM_MODEL_COSTS, TRACE_BUFFER_SIZE
+
+# -----------------------------
+# Metrics and spans
+# -----------------------------
+# A small in-process registry rendered in the Prometheus text format on
+# /metrics, plus a ring buffer of finished spans. Recording is a dict lookup
+# and an increment under a lock, so instrumenting a node costs microseconds;
+# nothing is written to stdout on the hot path.
+
+# Seconds; LLM nodes take 0.5-10s, local ones well under 10ms
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1.0) -> None:
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0.0) + value
+
+    def add(self, name: str, labels: Labels = (), value: float = 1.0) -> None:
+        """Moves a gauge up (or down, with a negative value)."""
+        with self._lock:
+            series = self._gauges.setdefault(name, {})
+            series[labels] = series.get(labels, 0.0) + value
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram()
+            histogram.observe(value)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for kind, metrics in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(metrics.items()):
+                    self._header(lines, name, kind)
+                    for labels, value in sorted(series.items()):
+                        lines.append(f"{name}{_format_labels(labels)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                self._header(lines, name, "histogram")
+                for labels, h in sorted(series.items()):
+                    cumulative = 0
+                    for bound, n in zip(h.buckets + (float("inf"),), h.counts):
+                        cumulative += n
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {h.total:.6f}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, name: str) -> Dict[str, dict]:
+        """p50/p95/p99 per series of a histogram, for JSON views."""
+        with self._lock:
+            return {
+                ",".join(f"{k}={v}" for k, v in labels): {
+                    "count": h.count,
+                    "mean": round(h.total / h.count, 6) if h.count else None,
+                    "p50": h.quantile(0.5),
+                    "p95": h.quantile(0.95),
+                    "p99": h.quantile(0.99),
+                }
+                for labels, h in self._histograms.get(name, {}).items()
+            }
+
+    def _header(self, lines, name: str, kind: str) -> None:
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+registry = Registry()
+registry.describe("story_node_duration_seconds", "Time spent inside a graph node.")
+registry.describe("story_node_queue_seconds", "Time between the previous node of a thread finishing and this one starting.")
+registry.describe("story_node_errors_total", "Graph node failures by exception type.")
+registry.describe("story_node_in_flight", "Graph nodes currently running.")
+registry.describe("story_llm_calls_total", "LLM calls by node; cached=true calls were answered by the response cache.")
+registry.describe("story_llm_tokens_total", "LLM tokens by node and direction.")
+registry.describe("story_llm_cost_usd_total", "Estimated LLM spend by node.")
+
+
+# -----------------------------
+# Spans
+# -----------------------------
+# Shaped like OpenTelemetry spans. The trace id is derived from the thread id,
+# so every node of a session, across requests, lands in the same trace.
+_TRACE_NAMESPACE = uuid.UUID("6f1c3a52-5d0e-4f3b-9a47-1f0f3c6f0b7e")
+spans: deque = deque(maxlen=TRACE_BUFFER_SIZE)
+
+
+@functools.lru_cache(maxsize=4096)
+def _thread_trace_id(thread_id: str) -> str:
+    return uuid.uuid5(_TRACE_NAMESPACE, thread_id).hex
+
+
+def trace_id(thread_id: Optional[str]) -> str:
+    return _thread_trace_id(thread_id) if thread_id else os.urandom(16).hex()
+
+
+def record_span(name: str, thread_id: Optional[str], start_ns: int, end_ns: int, status: str, attributes: dict) -> None:
+    spans.append({
+        "trace_id": trace_id(thread_id),
+        "span_id": os.urandom(8).hex(),
+        "name": name,
+        "start_time_unix_nano": start_ns,
+        "end_time_unix_nano": end_ns,
+        "status": status,
+        "attributes": {"thread_id": thread_id, **attributes},
+    })
+
+
+def spans_for(thread_id: str) -> list:
+    wanted = trace_id(thread_id)
+    return [span for span in list(spans) if span["trace_id"] == wanted]
+
+
+# -----------------------------
+# LLM usage
+# -----------------------------
+def _parse_costs(spec: str) -> Dict[str, Tuple[float, float]]:
+    """"model=input/output,..." in USD per million tokens."""
+    costs = {}
+    for item in spec.split(","):
+        model, _, prices = item.partition("=")
+        if "/" in prices:
+            input_price, output_price = prices.split("/", 1)
+            costs[model.strip()] = (float(input_price), float(output_price))
+    return costs
+
+
+MODEL_COSTS = _parse_costs(LLM_MODEL_COSTS)
+
+
+def cost_usd(model: Optional[str], input_tokens: float, output_tokens: float) -> float:
+    input_price, output_price = MODEL_COSTS.get(model, (LLM_INPUT_COST_PER_MTOK, LLM_OUTPUT_COST_PER_MTOK))
+    return (input_tokens * input_price + output_tokens * output_price) / 1e6
+
+
+class LLMUsageHandler(BaseCallbackHandler):
+    """Counts calls, tokens and estimated cost per graph node.
+
+    Attached to the compiled graph's config, so it sees every model call a
+    node makes; the node comes from the run metadata LangGraph adds.
+    """
+
+    # Called on the event loop directly instead of in an executor
+    run_inline = True
+
+    def __init__(self, registry: Registry):
+        self.registry = registry
+        # Node and model of each call in flight
+        self._nodes: Dict[uuid.UUID, Tuple[str, Optional[str]]] = {}
+
+    def _start(self, run_id, metadata) -> None:
+        metadata = metadata or {}
+        self._nodes[run_id] = (metadata.get("langgraph_node", "unknown"), metadata.get("ls_model_name"))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, metadata)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        node, _ = self._nodes.pop(run_id, ("unknown", None))
+        self.registry.inc("story_node_errors_total", (("node", node), ("error", f"llm:{type(error).__name__}")))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        node, model = self._nodes.pop(run_id, ("unknown", None))
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                # LangChain zeroes total_cost on responses replayed from the cache
+                cached = usage.get("total_cost") == 0
+                self.registry.inc("story_llm_calls_total", (("node", node), ("cached", str(cached).lower())))
+                if cached:
+                    continue
+                input_tokens = usage.get("input_tokens", 0)
+                output_tokens = usage.get("output_tokens", 0)
+                self.registry.inc("story_llm_tokens_total", (("node", node), ("kind", "input")), input_tokens)
+                self.registry.inc("story_llm_tokens_total", (("node", node), ("kind", "output")), output_tokens)
+                self.registry.inc("story_llm_cost_usd_total", (("node", node),), cost_usd(model, input_tokens, output_tokens))
+
+
+llm_usage = LLMUsageHandler(registry)
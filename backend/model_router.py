@@ -0,0 +1,264 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.runnables import Runnable
+
+from metrics import registry, cost_usd
+from config import LLM_MODEL, LLM_ROUTES, LLM_HEDGE_NODES, LLM_HEDGE_DELAY_MS
+
+# -----------------------------
+# Model routing
+# -----------------------------
+# Which model serves which node. A route is a fallback chain: a call goes to
+# the first model, and to the next one when it fails (rate limited, server
+# error, budget spent). Title, moral and the other short auxiliary calls go
+# to a smaller, faster model by default; drafts stay on LLM_MODEL.
+#
+# Hedged nodes race the first two models of their route: the second model is
+# called when the first has not answered within the hedge delay, the first
+# answer wins and the other call is cancelled. That cuts the slow tail at the
+# cost of the calls that are sent twice. The sync path (scripts) only falls
+# back; hedging needs cancellation, so it is async only.
+#
+# Latency, failures, fallbacks, hedges and cost are recorded per node and
+# model for /api/admin/routes and /metrics.
+
+registry.describe("story_llm_route_seconds", "LLM call latency by node, model and outcome.")
+registry.describe("story_llm_fallbacks_total", "LLM calls passed on to the next model of their route.")
+registry.describe("story_llm_hedges_total", "Hedged LLM calls by node and the model that answered first.")
+
+# Hedge delay until a route has this many latency samples, and how many it keeps
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY = 2.0
+LATENCY_WINDOW = 256
+
+
+def parse_routes(spec: str) -> Dict[str, Tuple[str, ...]]:
+    """"a,b=model>fallback;c=model" -> {"a": ("model", "fallback"), ...}."""
+    routes = {}
+    for part in spec.split(";"):
+        nodes, _, chain = part.partition("=")
+        models = tuple(m.strip() for m in chain.split(">") if m.strip())
+        for node in nodes.split(","):
+            if node.strip() and models:
+                routes[node.strip()] = models
+    return routes
+
+
+class _RouteStats:
+    __slots__ = ("calls", "errors", "cancelled", "fallbacks", "hedges", "wins",
+                 "seconds", "recent", "input_tokens", "output_tokens", "cost")
+
+    def __init__(self):
+        self.calls = self.errors = self.cancelled = self.fallbacks = self.hedges = self.wins = 0
+        self.seconds = 0.0
+        self.recent = deque(maxlen=LATENCY_WINDOW)
+        self.input_tokens = self.output_tokens = 0
+        self.cost = 0.0
+
+
+class ModelRouter:
+    def __init__(self, routes: Optional[Dict[str, Tuple[str, ...]]] = None, hedge_nodes=None,
+                 hedge_delay: float = LLM_HEDGE_DELAY_MS / 1000):
+        self.routes = parse_routes(LLM_ROUTES) if routes is None else routes
+        self.hedge_nodes = set(LLM_HEDGE_NODES if hedge_nodes is None else hedge_nodes)
+        # 0: the first model's p95 for the node
+        self.hedge_delay = hedge_delay
+        self._stats: Dict[Tuple[str, str], _RouteStats] = {}
+        self._lock = threading.Lock()
+
+    def chain(self, node: str) -> Tuple[str, ...]:
+        return self.routes.get(node) or self.routes.get("*") or (LLM_MODEL,)
+
+    def runnable(self, node: str, build: Callable[[str, bool], Runnable]) -> "RoutedModel":
+        """The route of `node`; `build(model, fallback)` makes the runnable for
+        one model, `fallback` telling it whether another model follows."""
+        chain = self.chain(node)
+        steps = [(model, build(model, i < len(chain) - 1)) for i, model in enumerate(chain)]
+        return RoutedModel(self, node, steps, hedged=node in self.hedge_nodes and len(steps) > 1)
+
+    # -----------------------------
+    # Accounting
+    # -----------------------------
+    def _entry(self, node: str, model: str) -> _RouteStats:
+        entry = self._stats.get((node, model))
+        if entry is None:
+            entry = self._stats[(node, model)] = _RouteStats()
+        return entry
+
+    def record(self, node: str, model: str, seconds: float, outcome: str, message=None) -> None:
+        usage = getattr(message, "usage_metadata", None) or {}
+        # Replayed from the response cache: nothing was spent
+        paid = usage and usage.get("total_cost") != 0
+        input_tokens = usage.get("input_tokens", 0) if paid else 0
+        output_tokens = usage.get("output_tokens", 0) if paid else 0
+        with self._lock:
+            entry = self._entry(node, model)
+            entry.calls += 1
+            entry.seconds += seconds
+            if outcome == "ok":
+                entry.recent.append(seconds)
+                entry.input_tokens += input_tokens
+                entry.output_tokens += output_tokens
+                entry.cost += cost_usd(model, input_tokens, output_tokens)
+            elif outcome == "cancelled":
+                entry.cancelled += 1
+            else:
+                entry.errors += 1
+        registry.observe("story_llm_route_seconds", (("node", node), ("model", model), ("outcome", outcome)), seconds)
+
+    def fell_back(self, node: str, model: str, error: BaseException) -> None:
+        with self._lock:
+            self._entry(node, model).fallbacks += 1
+        registry.inc("story_llm_fallbacks_total", (("node", node), ("model", model), ("error", type(error).__name__)))
+
+    def hedged(self, node: str, model: str) -> None:
+        with self._lock:
+            self._entry(node, model).hedges += 1
+
+    def won(self, node: str, model: str) -> None:
+        with self._lock:
+            self._entry(node, model).wins += 1
+        registry.inc("story_llm_hedges_total", (("node", node), ("winner", model)))
+
+    def hedge_delay_for(self, node: str, model: str) -> float:
+        if self.hedge_delay > 0:
+            return self.hedge_delay
+        with self._lock:
+            entry = self._stats.get((node, model))
+            recent = sorted(entry.recent) if entry else []
+        if len(recent) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return recent[int(0.95 * (len(recent) - 1))]
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = {key: (entry.calls, entry.errors, entry.cancelled, entry.fallbacks, entry.hedges, entry.wins,
+                          entry.seconds, sorted(entry.recent), entry.input_tokens, entry.output_tokens, entry.cost)
+                    for key, entry in self._stats.items()}
+        nodes: Dict[str, dict] = {}
+        for (node, model), (calls, errors, cancelled, fallbacks, hedges, wins, seconds, recent,
+                            input_tokens, output_tokens, cost) in sorted(rows.items()):
+            view = nodes.setdefault(node, {"route": list(self.chain(node)), "hedged": node in self.hedge_nodes,
+                                           "models": {}})
+            answered = calls - errors - cancelled
+            view["models"][model] = {
+                "calls": calls,
+                "errors": errors,
+                "cancelled": cancelled,
+                "fallbacks": fallbacks,
+                "hedges": hedges,
+                "hedge_wins": wins,
+                "p50_seconds": round(recent[len(recent) // 2], 4) if recent else None,
+                "p95_seconds": round(recent[int(0.95 * (len(recent) - 1))], 4) if recent else None,
+                "mean_seconds": round(seconds / calls, 4) if calls else None,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "cost_usd": round(cost, 6),
+                "cost_per_call_usd": round(cost / answered, 8) if answered else None,
+            }
+        return {"routes": {node: list(chain) for node, chain in self.routes.items()}, "nodes": nodes}
+
+
+# -----------------------------
+# Routed runnable
+# -----------------------------
+class RoutedModel(Runnable):
+    """One node's route as a runnable: fallbacks, optional hedging, timings.
+    Calls pass the caller's config straight to the model, so callbacks and
+    token streaming see the model that answered."""
+
+    def __init__(self, router: ModelRouter, node: str, steps: List[Tuple[str, Runnable]], hedged: bool = False):
+        self.router = router
+        self.node = node
+        self.steps = steps
+        self.hedged = hedged
+
+    def _call(self, model: str, runnable: Runnable, input, config, kwargs):
+        start = time.perf_counter()
+        try:
+            result = runnable.invoke(input, config, **kwargs)
+        except Exception:
+            self.router.record(self.node, model, time.perf_counter() - start, "error")
+            raise
+        self.router.record(self.node, model, time.perf_counter() - start, "ok", result)
+        return result
+
+    async def _acall(self, model: str, runnable: Runnable, input, config, kwargs):
+        start = time.perf_counter()
+        try:
+            result = await runnable.ainvoke(input, config, **kwargs)
+        except asyncio.CancelledError:
+            self.router.record(self.node, model, time.perf_counter() - start, "cancelled")
+            raise
+        except Exception:
+            self.router.record(self.node, model, time.perf_counter() - start, "error")
+            raise
+        self.router.record(self.node, model, time.perf_counter() - start, "ok", result)
+        return result
+
+    def invoke(self, input, config=None, **kwargs):
+        for i, (model, runnable) in enumerate(self.steps):
+            try:
+                return self._call(model, runnable, input, config, kwargs)
+            except Exception as error:
+                if i == len(self.steps) - 1:
+                    raise
+                self.router.fell_back(self.node, model, error)
+
+    async def _ahedged(self, input, config, kwargs):
+        """Races the first two models; raises if both fail."""
+        (first_model, first), (second_model, second) = self.steps[:2]
+        primary = asyncio.ensure_future(self._acall(first_model, first, input, config, kwargs))
+        # Whatever is still pending is cancelled on the way out, the caller
+        # being cancelled during the hedge delay included
+        pending = {primary}
+        error = None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.router.hedge_delay_for(self.node, first_model))
+            if done:
+                pending = set()
+                if primary.exception() is None:
+                    return primary.result()
+                # Failed before the hedge was due: a plain fallback
+                self.router.fell_back(self.node, first_model, primary.exception())
+                return await self._acall(second_model, second, input, config, kwargs)
+
+            self.router.hedged(self.node, first_model)
+            backup = asyncio.ensure_future(self._acall(second_model, second, input, config, kwargs))
+            pending = {primary, backup}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.router.won(self.node, first_model if task is primary else second_model)
+                        return task.result()
+                    error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        steps = self.steps
+        if self.hedged:
+            try:
+                return await self._ahedged(input, config, kwargs)
+            except Exception as error:
+                if len(steps) == 2:
+                    raise
+                self.router.fell_back(self.node, steps[1][0], error)
+                steps = steps[2:]
+        for i, (model, runnable) in enumerate(steps):
+            try:
+                return await self._acall(model, runnable, input, config, kwargs)
+            except Exception as error:
+                if i == len(steps) - 1:
+                    raise
+                self.router.fell_back(self.node, model, error)
+
+
+router = ModelRouter()
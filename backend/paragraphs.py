@@ -0,0 +1,74 @@
+import re
+from typing import Dict, List, Optional
+
+from spellcheck import PARAGRAPH_SPLIT_RE
+
+# -----------------------------
+# Paragraph-level revision helpers
+# -----------------------------
+# Most feedback ("change the ending", "make the second paragraph scarier")
+# is about a small part of the story, yet a full revision makes the model
+# write the whole story out again, and output tokens are what a revision
+# waits on. These helpers split a story into paragraphs, work out which of
+# them a piece of feedback is about, and splice rewritten paragraphs back in
+# with the original separators.
+
+ORDINALS = {
+    "first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5,
+    "sixth": 6, "seventh": 7, "eighth": 8, "ninth": 9, "tenth": 10,
+}
+ENDING_RE = re.compile(r"\b(ending|conclusion|(last|final|closing) (paragraph|part|scene|line|sentence)s?)\b", re.I)
+OPENING_RE = re.compile(r"\b(beginning|opening|introduction|intro|(first|opening) (line|sentence|scene))\b", re.I)
+NUMBERED_RE = re.compile(r"\bparagraphs?\s+((?:\d+(?:\s*(?:,|and|&)\s*)?)+)", re.I)
+ORDINAL_RE = re.compile(r"\b(" + "|".join(ORDINALS) + r"|last)\s+paragraph", re.I)
+# Feedback about the story as a whole: every paragraph may change
+WHOLE_RE = re.compile(r"\b(whole|entire|overall|throughout|everywhere|tone|style|tense|shorter|longer|simpler|rewrite)\b", re.I)
+
+
+def split(story: str) -> List[str]:
+    """Paragraphs at even indices, the separators between them at odd ones."""
+    return PARAGRAPH_SPLIT_RE.split(story)
+
+
+def paragraphs(parts: List[str]) -> List[str]:
+    return parts[0::2]
+
+
+def splice(parts: List[str], replacements: Dict[int, str]) -> str:
+    """The story with paragraph i replaced by replacements[i]."""
+    parts = list(parts)
+    for index, text in replacements.items():
+        parts[2 * index] = text.strip()
+    return "".join(parts)
+
+
+def locate(feedback: str, count: int) -> Optional[List[int]]:
+    """0-based indices of the paragraphs `feedback` asks to change, every
+    index for feedback about the whole story, or None when the wording does
+    not say (the model is asked instead)."""
+    if WHOLE_RE.search(feedback):
+        return list(range(count))
+    found = set()
+    for match in NUMBERED_RE.finditer(feedback):
+        found.update(int(n) - 1 for n in re.findall(r"\d+", match.group(1)))
+    for match in ORDINAL_RE.finditer(feedback):
+        word = match.group(1).lower()
+        found.add(count - 1 if word == "last" else ORDINALS[word] - 1)
+    if ENDING_RE.search(feedback):
+        found.add(count - 1)
+    if OPENING_RE.search(feedback):
+        found.add(0)
+    found = sorted(i for i in found if 0 <= i < count)
+    return found or None
+
+
+def parse_located(reply: str, count: int) -> List[int]:
+    """Indices from the model's answer to the locating prompt: 1-based
+    paragraph numbers, or ALL."""
+    if "ALL" in reply.upper():
+        return list(range(count))
+    return sorted({int(n) - 1 for n in re.findall(r"\d+", reply) if 0 < int(n) <= count})
+
+
+def numbered(parts: List[str]) -> str:
+    return "\n\n".join(f"[{i + 1}] {text}" for i, text in enumerate(paragraphs(parts)))
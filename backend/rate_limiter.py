@@ -0,0 +1,378 @@
+import asyncio
+import contextvars
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.rate_limiters import BaseRateLimiter
+from langchain_core.runnables.retry import RunnableRetry
+
+from metrics import registry
+from config import LLM_RPM, LLM_TPM, LLM_BURST_SECONDS, LLM_TOKENS_PER_CALL
+from config import LLM_MAX_ATTEMPTS, LLM_BACKOFF_INITIAL, LLM_BACKOFF_MAX, LLM_FALLBACK_ATTEMPTS, LLM_MODEL
+
+# -----------------------------
+# Rate limiting
+# -----------------------------
+# One limiter per process for every Gemini call, with a requests-per-minute
+# and a tokens-per-minute bucket. Callers wait exactly as long as the buckets
+# need to refill, and only when they are empty, instead of sleeping a fixed
+# amount before every call. Waiting callers are served by priority class:
+# a user waiting on a revision goes before title/moral finalization, which
+# goes before batch jobs, which go before speculative work nobody waits on yet.
+#
+# It plugs into LangChain's `rate_limiter` hook, so responses answered by the
+# response cache never touch the quota. Token usage is only known after the
+# call: each call reserves the recent average and is settled against the
+# real usage_metadata when it returns.
+#
+# Gemini quotas are per model, so each model the router (model_router.py)
+# sends calls to gets its own limiter, configured like the default one.
+
+PRIORITIES = {"interactive": 0, "finalize": 1, "batch": 2, "speculative": 3}
+
+# Lowers the priority of every call made in this context, e.g. by the batch
+# runner; a call never runs above the class of the model it goes through
+llm_priority: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("llm_priority", default=None)
+# Called when a call made in this context gets its slot, i.e. is about to be
+# sent (and billed); speculation.py uses it to price calls it cancels
+llm_dispatched: contextvars.ContextVar[Optional[Callable[[], None]]] = contextvars.ContextVar("llm_dispatched", default=None)
+# Tokens reserved by the call in flight, for settling it when it returns
+_reserved: contextvars.ContextVar[float] = contextvars.ContextVar("llm_reserved_tokens", default=0.0)
+
+# Status codes worth another attempt
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+STATUS_RE = re.compile(r"\b(408|429|500|502|503|504)\b|RESOURCE_EXHAUSTED|UNAVAILABLE")
+# Gemini's 429 message says when the quota frees up: "Please retry in 12.3s"
+RETRY_AFTER_RE = re.compile(r"retry in ([\d.]+)s", re.IGNORECASE)
+
+registry.describe("story_llm_queue_seconds", "Time an LLM call waited for the rate limiter, by priority.")
+registry.describe("story_llm_retries_total", "LLM calls retried after a rate limit or server error.")
+
+
+class RateLimited(Exception):
+    """A model's budget is spent and another model can take the call."""
+
+
+class TokenBucket:
+    """Refills so that no `period`-long window can see more than the budget:
+    a full bucket plus a period of refill adds up to exactly `budget`."""
+
+    __slots__ = ("capacity", "rate", "level", "updated")
+
+    def __init__(self, budget: float, burst_seconds: float, period: float = 60.0):
+        burst = min(max(burst_seconds, period / 1000), period / 2)
+        self.capacity = budget * burst / period
+        self.rate = (budget - self.capacity) / period
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float, ahead: float = 0.0) -> float:
+        """Seconds until there is room for `amount` after `ahead` is served.
+        A single amount larger than the bucket waits for a full bucket and
+        then overdraws it."""
+        missing = min(amount, self.capacity) + ahead - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+
+class RateLimiter:
+    """Shared RPM/TPM budget; rpm or tpm of 0 turns that budget off."""
+
+    def __init__(self, rpm: float = LLM_RPM, tpm: float = LLM_TPM, burst_seconds: float = LLM_BURST_SECONDS,
+                 tokens_per_call: float = LLM_TOKENS_PER_CALL):
+        self._lock = threading.Lock()
+        # Demand of the callers waiting in each class: [calls, tokens]
+        self._waiting: Dict[int, list] = {}
+        self._paused_until = 0.0
+        self.configure(rpm, tpm, burst_seconds, tokens_per_call)
+
+    def configure(self, rpm: float, tpm: float, burst_seconds: float = LLM_BURST_SECONDS,
+                  tokens_per_call: Optional[float] = None, period: float = 60.0) -> None:
+        """`period` is the provider's quota window; only the benchmark
+        shortens it."""
+        with self._lock:
+            self.rpm, self.tpm, self.burst_seconds = rpm, tpm, burst_seconds
+            self._requests = TokenBucket(rpm, burst_seconds, period) if rpm > 0 else None
+            self._tokens = TokenBucket(tpm, burst_seconds, period) if tpm > 0 else None
+            if tokens_per_call is not None:
+                self.tokens_per_call = tokens_per_call
+
+    # -----------------------------
+    # Acquiring
+    # -----------------------------
+    def _try(self, rank: int) -> float:
+        """Takes a slot for a caller of class `rank`, returning 0, or returns
+        how long to wait before trying again."""
+        cost = self.tokens_per_call if self._tokens else 0.0
+        with self._lock:
+            now = time.monotonic()
+            # Callers of a more urgent class go first: their demand has to fit
+            # in the buckets before ours does
+            ahead_calls = ahead_tokens = 0.0
+            for other, (calls, tokens) in self._waiting.items():
+                if other < rank:
+                    ahead_calls += calls
+                    ahead_tokens += tokens
+            wait = self._paused_until - now
+            if self._requests:
+                self._requests.refill(now)
+                wait = max(wait, self._requests.time_until(1, ahead_calls))
+            if self._tokens:
+                self._tokens.refill(now)
+                wait = max(wait, self._tokens.time_until(cost, ahead_tokens))
+            if wait > 0:
+                return wait
+            if ahead_calls:
+                # Enough for everyone: let the more urgent callers wake first
+                return 0.005
+            if self._requests:
+                self._requests.level -= 1
+            if self._tokens:
+                self._tokens.level -= cost
+            _reserved.set(cost)
+            return 0.0
+
+    def _enqueue(self, rank: int, delta: int) -> None:
+        with self._lock:
+            demand = self._waiting.setdefault(rank, [0, 0.0])
+            demand[0] += delta
+            demand[1] += delta * self.tokens_per_call
+            if demand[0] <= 0:
+                del self._waiting[rank]
+
+    def acquire(self, priority: str = "interactive", blocking: bool = True) -> bool:
+        rank = PRIORITIES[priority]
+        if self._requests is None and self._tokens is None:
+            return True
+        start = time.perf_counter()
+        wait = self._try(rank)
+        if wait and not blocking:
+            return False
+        if wait:
+            self._enqueue(rank, 1)
+            try:
+                while wait:
+                    time.sleep(wait)
+                    wait = self._try(rank)
+            finally:
+                self._enqueue(rank, -1)
+        registry.observe("story_llm_queue_seconds", (("priority", priority),), time.perf_counter() - start)
+        return True
+
+    async def aacquire(self, priority: str = "interactive", blocking: bool = True) -> bool:
+        rank = PRIORITIES[priority]
+        if self._requests is None and self._tokens is None:
+            return True
+        start = time.perf_counter()
+        wait = self._try(rank)
+        if wait and not blocking:
+            return False
+        if wait:
+            self._enqueue(rank, 1)
+            try:
+                while wait:
+                    await asyncio.sleep(wait)
+                    wait = self._try(rank)
+            finally:
+                self._enqueue(rank, -1)
+        registry.observe("story_llm_queue_seconds", (("priority", priority),), time.perf_counter() - start)
+        return True
+
+    # -----------------------------
+    # Accounting
+    # -----------------------------
+    def settle(self, used: Optional[float]) -> None:
+        """Charges a finished call's real token usage against its reservation;
+        None (a failed call) gives the reservation back."""
+        reserved = _reserved.get()
+        _reserved.set(0.0)
+        with self._lock:
+            if self._tokens:
+                self._tokens.level -= (used or 0.0) - reserved
+            if used:
+                # Moving average, so reservations follow the real call sizes
+                self.tokens_per_call += 0.2 * (used - self.tokens_per_call)
+
+    def pause(self, seconds: float) -> None:
+        """Holds every caller back, after the provider said the quota is spent."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            if self._requests:
+                self._requests.level = min(self._requests.level, 0.0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            for bucket in (self._requests, self._tokens):
+                if bucket:
+                    bucket.refill(now)
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "requests_available": round(self._requests.level, 2) if self._requests else None,
+                "tokens_available": round(self._tokens.level) if self._tokens else None,
+                "tokens_per_call": round(self.tokens_per_call),
+                "waiting": {name: self._waiting.get(rank, [0])[0] for name, rank in PRIORITIES.items()},
+                "paused_for": round(max(0.0, self._paused_until - now), 3),
+            }
+
+
+limiter = RateLimiter()
+limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(model: Optional[str]) -> RateLimiter:
+    """The budget of one model: `limiter` for LLM_MODEL, a limiter with the
+    same settings for any other."""
+    if model is None or model == LLM_MODEL:
+        return limiter
+    with _limiters_lock:
+        if model not in limiters:
+            limiters[model] = RateLimiter(limiter.rpm, limiter.tpm, limiter.burst_seconds, limiter.tokens_per_call)
+        return limiters[model]
+
+
+# -----------------------------
+# LangChain hooks
+# -----------------------------
+class _PriorityLimiter(BaseRateLimiter):
+    """The shared limiter as seen by the models of one priority class."""
+
+    def __init__(self, limiter: RateLimiter, priority: str, wait: bool = True):
+        self.limiter = limiter
+        self.priority = priority
+        # False when another model can take the call: raise instead of queueing
+        self.wait = wait
+
+    def _effective(self) -> str:
+        scoped = llm_priority.get()
+        if scoped and PRIORITIES[scoped] > PRIORITIES[self.priority]:
+            return scoped
+        return self.priority
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        if not self.limiter.acquire(self._effective(), blocking and self.wait):
+            raise RateLimited("rate limit budget spent")
+        _dispatched()
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        if not await self.limiter.aacquire(self._effective(), blocking and self.wait):
+            raise RateLimited("rate limit budget spent")
+        _dispatched()
+        return True
+
+
+def _dispatched() -> None:
+    callback = llm_dispatched.get()
+    if callback is not None:
+        callback()
+
+
+class _TokenMeter(BaseCallbackHandler):
+    """Settles each call's token reservation from its usage_metadata."""
+
+    run_inline = True
+
+    def __init__(self, limiter: RateLimiter):
+        self.limiter = limiter
+
+    def on_llm_end(self, response, **kwargs):
+        used = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                if usage.get("total_cost") == 0:
+                    # Replayed from the response cache: never reserved anything
+                    return
+                used += usage.get("total_tokens", 0)
+        self.limiter.settle(used or None)
+
+    def on_llm_error(self, error, **kwargs):
+        self.limiter.settle(None)
+
+
+def status_of(error: BaseException) -> Optional[int]:
+    """HTTP status behind a provider error, looking through wrapped causes."""
+    seen = 0
+    while error is not None and seen < 5:
+        for attr in ("code", "status_code"):
+            value = getattr(error, attr, None)
+            if isinstance(value, int):
+                return value
+        match = STATUS_RE.search(str(error))
+        if match:
+            return int(match.group(1)) if match.group(1) else (429 if "EXHAUSTED" in match.group(0) else 503)
+        error = error.__cause__ or error.__context__
+        seen += 1
+    return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    return status_of(error) in RETRY_STATUSES
+
+
+class _Backoff:
+    """Tenacity wait: full-jitter exponential backoff, never shorter than the
+    delay the provider asked for. A 429 pauses the whole limiter, so other
+    callers do not spend their attempts on a quota that is already gone."""
+
+    def __init__(self, limiter: RateLimiter, initial: float, maximum: float):
+        self.limiter = limiter
+        self.initial = initial
+        self.maximum = maximum
+
+    def __call__(self, retry_state) -> float:
+        error = retry_state.outcome.exception()
+        status = status_of(error)
+        delay = random.uniform(0, min(self.maximum, self.initial * 2 ** (retry_state.attempt_number - 1)))
+        match = RETRY_AFTER_RE.search(str(error))
+        if match:
+            delay = max(delay, float(match.group(1)))
+        if status == 429:
+            self.limiter.pause(delay)
+        registry.inc("story_llm_retries_total", (("status", str(status or type(error).__name__)),))
+        return delay
+
+
+class LimitedRetry(RunnableRetry):
+    """RunnableRetry with status-aware retries and limiter-aware backoff."""
+
+    backoff: _Backoff
+
+    @property
+    def _kwargs_retrying(self) -> dict:
+        kwargs = super()._kwargs_retrying
+        kwargs["wait"] = self.backoff
+        return kwargs
+
+
+def limited(model, priority: str = "interactive", tools=None, limiter: RateLimiter = limiter, fallback: bool = False):
+    """`model` (optionally with `tools` bound) behind the shared limiter,
+    retried with backoff on rate limits and server errors. With `fallback`
+    another model can take the call: it is not queued for when the budget is
+    spent, and only gets LLM_FALLBACK_ATTEMPTS attempts."""
+    update = {"rate_limiter": _PriorityLimiter(limiter, priority, wait=not fallback), "callbacks": [_TokenMeter(limiter)]}
+    if "max_retries" in type(model).model_fields:
+        # Retries happen here, where they are throttled and counted, instead
+        # of inside the client
+        update["max_retries"] = 1
+    runnable = model.model_copy(update=update)
+    if tools:
+        runnable = runnable.bind_tools(tools)
+    return LimitedRetry(
+        bound=runnable,
+        retry_exception_types=is_retryable,
+        max_attempt_number=LLM_FALLBACK_ATTEMPTS if fallback else LLM_MAX_ATTEMPTS,
+        backoff=_Backoff(limiter, LLM_BACKOFF_INITIAL, LLM_BACKOFF_MAX),
+    )
@@ -0,0 +1,187 @@
+import json
+from typing import Any, Iterator, Optional, Sequence
+
+import ormsgpack
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+
+from checkpointer import ThreadedAsyncSaver
+
+# -----------------------------
+# Redis checkpointer
+# -----------------------------
+# Checkpoints in Redis, so any API worker on any host can pick up any
+# session. Only plain commands are used (hashes, sorted sets, sets), so it
+# runs against stock Redis, Valkey, managed offerings and fakeredis alike.
+#
+#   {prefix}cp:{thread}:{ns}:{id}     hash: type, checkpoint, metadata, parent
+#   {prefix}cps:{thread}:{ns}         sorted set of checkpoint ids (all score
+#                                     0, so ordered by id, i.e. by time)
+#   {prefix}wr:{thread}:{ns}:{id}     hash: "{task_id}|{idx}" -> packed write
+#   {prefix}ns:{thread}               set of the thread's checkpoint namespaces
+#
+# With a ttl every key of a session is given the same expiry on each write,
+# so idle sessions age out on their own (the SQLite store needs compaction.py
+# for that). Older checkpoints of a live session can expire before the index
+# entries pointing at them; readers skip those.
+
+
+class RedisSaver(ThreadedAsyncSaver, BaseCheckpointSaver):
+    def __init__(self, client, *, prefix: str = "story:", ttl: Optional[float] = None, serde=None):
+        super().__init__(serde=serde)
+        self.client = client
+        self.prefix = prefix
+        self.ttl = int(ttl) if ttl else None
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisSaver":
+        import redis
+
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def close(self) -> None:
+        self.client.close()
+
+    # -----------------------------
+    # Keys
+    # -----------------------------
+    def _checkpoint_key(self, thread_id, ns: str, checkpoint_id: str) -> str:
+        return f"{self.prefix}cp:{thread_id}:{ns}:{checkpoint_id}"
+
+    def _writes_key(self, thread_id, ns: str, checkpoint_id: str) -> str:
+        return f"{self.prefix}wr:{thread_id}:{ns}:{checkpoint_id}"
+
+    def _index_key(self, thread_id, ns: str) -> str:
+        return f"{self.prefix}cps:{thread_id}:{ns}"
+
+    def _namespaces_key(self, thread_id) -> str:
+        return f"{self.prefix}ns:{thread_id}"
+
+    def _expire(self, pipe, *keys: str) -> None:
+        if self.ttl:
+            for key in keys:
+                pipe.expire(key, self.ttl)
+
+    # -----------------------------
+    # Reads
+    # -----------------------------
+    def _latest_id(self, thread_id, ns: str) -> Optional[str]:
+        ids = self.client.zrevrangebylex(self._index_key(thread_id, ns), "+", "-", start=0, num=1)
+        return ids[0].decode() if ids else None
+
+    def _load(self, thread_id, ns: str, checkpoint_id: str) -> Optional[CheckpointTuple]:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hgetall(self._checkpoint_key(thread_id, ns, checkpoint_id))
+        pipe.hvals(self._writes_key(thread_id, ns, checkpoint_id))
+        row, writes = pipe.execute()
+        if not row:
+            return None
+        parent = row.get(b"parent", b"").decode()
+        pending = sorted((ormsgpack.unpackb(w) for w in writes), key=lambda w: writes_sort_key(w[4], w[0], w[5]))
+        return CheckpointTuple(
+            {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint_id}},
+            self.serde.loads_typed((row[b"type"].decode(), row[b"checkpoint"])),
+            json.loads(row[b"metadata"]) if row.get(b"metadata") else {},
+            {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": parent}} if parent else None,
+            [(task_id, channel, self.serde.loads_typed((type_, value))) for task_id, channel, type_, value, _, _ in pending],
+        )
+
+    def get_tuple(self, config) -> Optional[CheckpointTuple]:
+        thread_id = str(config["configurable"]["thread_id"])
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config) or self._latest_id(thread_id, ns)
+        if checkpoint_id is None:
+            return None
+        return self._load(thread_id, ns, checkpoint_id)
+
+    def list(self, config, *, filter: Optional[dict] = None, before=None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        if config is None:
+            # Every thread: walk the indexes (admin and maintenance use only)
+            keys = [key.decode() for key in self.client.scan_iter(match=f"{self.prefix}cps:*")]
+            threads = [key[len(self.prefix) + 4:].rsplit(":", 1) for key in keys]
+        else:
+            thread_id = str(config["configurable"]["thread_id"])
+            ns = config["configurable"].get("checkpoint_ns")
+            if ns is None:
+                namespaces = sorted(n.decode() for n in self.client.smembers(self._namespaces_key(thread_id)))
+            else:
+                namespaces = [ns]
+            threads = [[thread_id, n] for n in namespaces]
+
+        wanted_id = get_checkpoint_id(config) if config else None
+        before_id = get_checkpoint_id(before) if before else None
+        found = 0
+        for thread_id, ns in threads:
+            if wanted_id:
+                ids = [wanted_id]
+            else:
+                upper = f"({before_id}" if before_id else "+"
+                ids = [i.decode() for i in self.client.zrevrangebylex(self._index_key(thread_id, ns), upper, "-")]
+            for checkpoint_id in ids:
+                item = self._load(thread_id, ns, checkpoint_id)
+                if item is None:
+                    continue
+                if filter and any(item.metadata.get(k) != v for k, v in filter.items()):
+                    continue
+                yield item
+                found += 1
+                if limit is not None and found >= limit:
+                    return
+
+    # -----------------------------
+    # Writes
+    # -----------------------------
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = str(config["configurable"]["thread_id"])
+        ns = config["configurable"]["checkpoint_ns"]
+        type_, serialized = self.serde.dumps_typed(checkpoint)
+        serialized_metadata = json.dumps(get_checkpoint_metadata(config, metadata), ensure_ascii=False)
+        key = self._checkpoint_key(thread_id, ns, checkpoint["id"])
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(key, mapping={
+            "type": type_,
+            "checkpoint": serialized,
+            "metadata": serialized_metadata,
+            "parent": config["configurable"].get("checkpoint_id") or "",
+        })
+        pipe.zadd(self._index_key(thread_id, ns), {checkpoint["id"]: 0})
+        pipe.sadd(self._namespaces_key(thread_id), ns)
+        self._expire(pipe, key, self._index_key(thread_id, ns), self._namespaces_key(thread_id))
+        pipe.execute()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes: Sequence[tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        thread_id = str(config["configurable"]["thread_id"])
+        ns = str(config["configurable"]["checkpoint_ns"])
+        key = self._writes_key(thread_id, ns, str(config["configurable"]["checkpoint_id"]))
+        # Same rule as SqliteSaver: special channels replace, others keep the
+        # first write for a (task, idx)
+        replace = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        pipe = self.client.pipeline(transaction=True)
+        for idx, (channel, value) in enumerate(writes):
+            idx = WRITES_IDX_MAP.get(channel, idx)
+            packed = ormsgpack.packb([task_id, channel, *self.serde.dumps_typed(value), task_path, idx])
+            if replace:
+                pipe.hset(key, f"{task_id}|{idx}", packed)
+            else:
+                pipe.hsetnx(key, f"{task_id}|{idx}", packed)
+        self._expire(pipe, key)
+        pipe.execute()
+
+    def delete_thread(self, thread_id: str) -> None:
+        thread_id = str(thread_id)
+        keys = [self._namespaces_key(thread_id)]
+        for ns in self.client.smembers(self._namespaces_key(thread_id)):
+            ns = ns.decode()
+            keys.append(self._index_key(thread_id, ns))
+            for checkpoint_id in self.client.zrange(self._index_key(thread_id, ns), 0, -1):
+                checkpoint_id = checkpoint_id.decode()
+                keys.append(self._checkpoint_key(thread_id, ns, checkpoint_id))
+                keys.append(self._writes_key(thread_id, ns, checkpoint_id))
+        self.client.delete(*keys)
@@ -0,0 +1,244 @@
+import re
+import threading
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import ormsgpack
+from langchain_core.messages import BaseMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+# -----------------------------
+# Delta-encoded story storage
+# -----------------------------
+# A checkpoint holds the same story many times over: `story` itself, the AI
+# message that produced it, the tool call that corrected it, the tool result,
+# and every earlier draft and revision still in `messages`. DeltaSerializer
+# pulls every long string out of the object being saved into a StoryRevisions
+# store, which keeps the first version of each text whole and every later one
+# as a word-level diff against the version before it. Loading reverses this,
+# rebuilding each text only once however many places refer to it.
+
+# Tokens are words plus the whitespace after them, so joining them gives the
+# exact original text back
+TOKEN_RE = re.compile(r"\S+\s*|\s+")
+# Stands in for a stored string inside the serialized object
+PLACEHOLDER = "\x00rev:{}\x00"
+PLACEHOLDER_RE = re.compile(r"\x00rev:(\d+)\x00")
+
+# Values that never hold text worth storing, skipped without a call
+_SCALARS = {int, float, bool, type(None), bytes}
+
+# A copy op is a [start, end) token range of the base; an insert is a string
+Op = Union[List[int], str]
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text)
+
+
+class StoryRevisions:
+    """Texts stored as one whole base plus diffs for each later revision."""
+
+    def __init__(self, entries: Optional[List[Any]] = None, diff_cache: Optional["DiffCache"] = None):
+        # Each entry is either a full text (str) or [base_index, ops]
+        self.entries: List[Any] = entries or []
+        self.diff_cache = diff_cache
+        self._index: Dict[str, int] = {}
+        self._texts: Dict[int, str] = {}
+        self._tokens: Dict[int, List[str]] = {}
+
+    def add(self, text: str) -> int:
+        """Stores `text` and returns its index; exact repeats share one entry."""
+        existing = self._index.get(text)
+        if existing is not None:
+            return existing
+        i = len(self.entries)
+        entry: Any = text
+        if self.entries:
+            base = self.text(i - 1)
+            if self.diff_cache is not None:
+                ops = self.diff_cache.get(base, text, lambda: self._diff(i - 1, text))
+            else:
+                ops = self._diff(i - 1, text)
+            if ops is not None:
+                entry = [i - 1, ops]
+        self.entries.append(entry)
+        self._index[text] = i
+        self._texts[i] = text
+        return i
+
+    def text(self, i: int) -> str:
+        """Rebuilds entry `i`, memoizing it (and the bases it depends on)."""
+        cached = self._texts.get(i)
+        if cached is not None:
+            return cached
+        entry = self.entries[i]
+        if isinstance(entry, str):
+            text = entry
+        else:
+            base, ops = entry
+            base_tokens = self.tokens(base)
+            text = "".join(op if isinstance(op, str) else "".join(base_tokens[op[0]:op[1]]) for op in ops)
+        self._texts[i] = text
+        return text
+
+    def tokens(self, i: int) -> List[str]:
+        tokens = self._tokens.get(i)
+        if tokens is None:
+            tokens = self._tokens[i] = tokenize(self.text(i))
+        return tokens
+
+    def _diff(self, base: int, text: str) -> Optional[List[Op]]:
+        """Ops rebuilding `text` from entry `base`, or None if storing the
+        text whole is no bigger."""
+        base_tokens = self.tokens(base)
+        tokens = tokenize(text)
+        # Edits are usually local (one paragraph rewritten, a few words
+        # corrected), so the unchanged head and tail are matched directly and
+        # only the middle goes through SequenceMatcher
+        limit = min(len(base_tokens), len(tokens))
+        head = 0
+        while head < limit and base_tokens[head] == tokens[head]:
+            head += 1
+        tail = 0
+        while tail < limit - head and base_tokens[-1 - tail] == tokens[-1 - tail]:
+            tail += 1
+        matcher = SequenceMatcher(
+            None, base_tokens[head:len(base_tokens) - tail], tokens[head:len(tokens) - tail], autojunk=False
+        )
+        if head + tail < limit // 2 and matcher.real_quick_ratio() < 0.5:
+            return None
+
+        ops: List[Op] = []
+        size = 0
+
+        def insert(inserted: str):
+            # Merge with a preceding insert so replace + insert stay one op
+            if ops and isinstance(ops[-1], str):
+                ops[-1] += inserted
+            else:
+                ops.append(inserted)
+
+        if head:
+            ops.append([0, head])
+            size += 8
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                ops.append([head + i1, head + i2])
+                size += 8
+            elif j2 > j1:
+                inserted = "".join(tokens[head + j1:head + j2])
+                insert(inserted)
+                size += len(inserted) + 2
+            if size >= len(text):
+                return None
+        if tail:
+            ops.append([len(base_tokens) - tail, len(base_tokens)])
+            size += 8
+        return ops if size < len(text) else None
+
+
+class DiffCache:
+    """Recently computed diffs, keyed by (base, text).
+
+    Consecutive checkpoints of a session carry mostly the same strings in the
+    same order, so the same pairs are diffed again on every put.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Optional[List[Op]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, base: str, text: str, compute) -> Optional[List[Op]]:
+        key = (base, text)
+        with self._lock:
+            ops = self._entries.get(key, self._MISSING)
+            if ops is not self._MISSING:
+                self._entries.move_to_end(key)
+                return ops
+        ops = compute()
+        with self._lock:
+            self._entries[key] = ops
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return ops
+
+
+class DeltaSerializer(JsonPlusSerializer):
+    """Checkpoint serializer that delta-encodes long strings.
+
+    The object is serialized as usual after long strings are swapped for
+    placeholders, and the revision store is saved next to it. Blobs written
+    without delta encoding still load.
+    """
+
+    PREFIX = "delta+"
+
+    def __init__(self, min_length: int = 256, **kwargs):
+        super().__init__(**kwargs)
+        self.min_length = min_length
+        self.diff_cache = DiffCache()
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        store = StoryRevisions(diff_cache=self.diff_cache)
+        stripped = self._strip(obj, store)
+        type_, data = super().dumps_typed(stripped)
+        if not store.entries:
+            return type_, data
+        return self.PREFIX + type_, ormsgpack.packb([store.entries, data])
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, blob = data
+        if not type_.startswith(self.PREFIX):
+            return super().loads_typed(data)
+        entries, inner = ormsgpack.unpackb(blob)
+        obj = super().loads_typed((type_[len(self.PREFIX):], inner))
+        return self._restore(obj, StoryRevisions(entries))
+
+    # -----------------------------
+    # Walking the object
+    # -----------------------------
+    def _strip(self, obj: Any, store: StoryRevisions) -> Any:
+        kind = type(obj)
+        if kind is str:
+            # Short strings that happen to look like a placeholder are
+            # stored too, so they cannot be confused with one on load
+            if len(obj) >= self.min_length or obj.startswith("\x00rev:"):
+                return PLACEHOLDER.format(store.add(obj))
+            return obj
+        if kind in _SCALARS:
+            return obj
+        if kind is dict:
+            return {k: v if type(v) in _SCALARS else self._strip(v, store) for k, v in obj.items()}
+        if kind is list:
+            return [self._strip(v, store) for v in obj]
+        if kind is tuple:
+            return tuple(self._strip(v, store) for v in obj)
+        if isinstance(obj, BaseMessage):
+            return self._map_message(obj, lambda v: self._strip(v, store))
+        return obj
+
+    def _restore(self, obj: Any, store: StoryRevisions) -> Any:
+        if isinstance(obj, str):
+            match = PLACEHOLDER_RE.fullmatch(obj)
+            return store.text(int(match.group(1))) if match else obj
+        if isinstance(obj, dict):
+            return {k: self._restore(v, store) for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [self._restore(v, store) for v in obj]
+        if isinstance(obj, tuple) and type(obj) is tuple:
+            return tuple(self._restore(v, store) for v in obj)
+        if isinstance(obj, BaseMessage):
+            return self._map_message(obj, lambda v: self._restore(v, store))
+        return obj
+
+    @staticmethod
+    def _map_message(message: BaseMessage, fn) -> BaseMessage:
+        update = {"content": fn(message.content), "additional_kwargs": fn(message.additional_kwargs)}
+        if getattr(message, "tool_calls", None):
+            update["tool_calls"] = fn(message.tool_calls)
+        return message.model_copy(update=update)
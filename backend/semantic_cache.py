@@ -0,0 +1,242 @@
+import math
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from metrics import registry
+
+# -----------------------------
+# Semantic prompt cache
+# -----------------------------
+# Many story prompts are rewordings of each other ("a story about a brave
+# cat", "write me a story about brave cats"), and the exact response cache
+# (llm_cache.py) only catches identical ones. This cache sits in front of
+# generate_story: prompts become sparse hashed feature vectors (words, word
+# pairs and character n-grams, no model to load), and a new prompt whose
+# cosine similarity to a cached one reaches the threshold is answered with
+# (or seeded from) that prompt's draft.
+#
+# Vectors live in an in-memory inverted index, so a lookup only scores the
+# cached prompts sharing a feature with the new one. Prompts and drafts are
+# persisted in SQLite and re-vectorized on load.
+#
+# Hashing catches rewording, word order, plurals and filler words, not
+# synonyms: "brave" and "courageous" share no features. The vectorizer can
+# be swapped for anything with the same embed() method.
+
+registry.describe("story_semantic_cache_lookups_total", "Semantic prompt cache lookups by result.")
+registry.describe("story_semantic_cache_lookup_seconds", "Time to search the semantic prompt cache.")
+
+STOPWORDS = frozenset("""
+a an the and or but of to in on at for with about from by into over under as is are was were be been
+it its this that these those who whom which what when where how me my i you your we our us they them their
+please write tell make create give generate story stories tale tales short some one very
+""".split())
+WORD_RE = re.compile(r"[a-z0-9']+")
+
+Vector = Dict[int, float]
+
+
+def _stem(word: str) -> str:
+    for suffix, replacement in (("ies", "y"), ("ing", ""), ("ed", ""), ("es", ""), ("s", "")):
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            return word[: -len(suffix)] + replacement
+    return word
+
+
+class HashingVectorizer:
+    """Words (weight 1), adjacent word pairs (0.5) and character 4-grams
+    (0.25), hashed into `2**bits` dimensions and L2-normalized."""
+
+    def __init__(self, bits: int = 20):
+        self.mask = (1 << bits) - 1
+
+    def _add(self, vector: Vector, feature: str, weight: float) -> None:
+        index = zlib.crc32(feature.encode("utf-8")) & self.mask
+        vector[index] = vector.get(index, 0.0) + weight
+
+    def embed(self, text: str) -> Vector:
+        words = [_stem(w) for w in WORD_RE.findall(text.lower()) if w not in STOPWORDS]
+        vector: Vector = {}
+        for i, word in enumerate(words):
+            self._add(vector, f"w:{word}", 1.0)
+            if i:
+                self._add(vector, f"b:{words[i - 1]} {word}", 0.5)
+            padded = f"<{word}>"
+            for j in range(len(padded) - 3):
+                self._add(vector, f"c:{padded[j:j + 4]}", 0.25)
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        return {k: v / norm for k, v in vector.items()} if norm else {}
+
+
+class _Entry:
+    __slots__ = ("prompt", "story", "vector", "created_at")
+
+    def __init__(self, prompt: str, story: str, vector: Vector, created_at: float):
+        self.prompt = prompt
+        self.story = story
+        self.vector = vector
+        self.created_at = created_at
+
+
+class SemanticCache:
+    def __init__(self, path: Optional[str], threshold: float = 0.8, max_entries: int = 5000,
+                 ttl: Optional[float] = None, vectorizer=None):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.vectorizer = vectorizer or HashingVectorizer()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._postings: Dict[int, set] = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        self.stats_ = {"hits": 0, "misses": 0, "evictions": 0, "lookup_seconds": 0.0,
+                       "generations": 0, "generation_seconds": 0.0}
+        # Best similarity of each lookup, in tenths, for tuning the threshold
+        self.similarity = [0] * 11
+        if path:
+            self._open()
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+    def _open(self) -> None:
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS semantic_cache (
+                prompt TEXT PRIMARY KEY,
+                story TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            """
+        )
+        cutoff = time.time() - self.ttl if self.ttl else 0
+        rows = self._conn.execute(
+            "SELECT prompt, story, created_at FROM semantic_cache WHERE created_at >= ? ORDER BY created_at DESC LIMIT ?",
+            (cutoff, self.max_entries),
+        ).fetchall()
+        # Oldest first, so the newest end up most recently used
+        for prompt, story, created_at in reversed(rows):
+            self._insert(prompt, story, created_at)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # -----------------------------
+    # Index
+    # -----------------------------
+    def _insert(self, prompt: str, story: str, created_at: float) -> list:
+        """Adds to the index; returns the prompts evicted to make room."""
+        if prompt in self._entries:
+            self._remove(prompt)
+        entry = self._entries[prompt] = _Entry(prompt, story, self.vectorizer.embed(prompt), created_at)
+        for feature in entry.vector:
+            self._postings.setdefault(feature, set()).add(prompt)
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            evicted.append(self._remove(next(iter(self._entries))))
+        return evicted
+
+    def _remove(self, prompt: str) -> str:
+        entry = self._entries.pop(prompt)
+        for feature in entry.vector:
+            posting = self._postings.get(feature)
+            if posting is not None:
+                posting.discard(prompt)
+                if not posting:
+                    del self._postings[feature]
+        return prompt
+
+    def _nearest(self, vector: Vector) -> Tuple[Optional[_Entry], float]:
+        scores: Dict[str, float] = {}
+        for feature, weight in vector.items():
+            for prompt in self._postings.get(feature, ()):
+                scores[prompt] = scores.get(prompt, 0.0) + weight * self._entries[prompt].vector[feature]
+        if not scores:
+            return None, 0.0
+        prompt = max(scores, key=scores.get)
+        return self._entries[prompt], scores[prompt]
+
+    # -----------------------------
+    # API
+    # -----------------------------
+    def lookup(self, prompt: str) -> Optional[Tuple[str, str, float]]:
+        """(cached prompt, its draft, similarity) for the closest cached
+        prompt at or above the threshold, or None. Memory only."""
+        start = time.perf_counter()
+        vector = self.vectorizer.embed(prompt)
+        with self._lock:
+            entry, score = self._nearest(vector)
+            if entry is not None and self.ttl and entry.created_at + self.ttl < time.time():
+                self._remove(entry.prompt)
+                entry, score = None, 0.0
+            # Rounding leaves identical prompts a hair under 1.0
+            hit = entry is not None and score >= self.threshold - 1e-9
+            if hit:
+                self._entries.move_to_end(entry.prompt)
+            elapsed = time.perf_counter() - start
+            self.stats_["hits" if hit else "misses"] += 1
+            self.stats_["lookup_seconds"] += elapsed
+            self.similarity[min(int(score * 10 + 1e-9), 10)] += 1
+        registry.inc("story_semantic_cache_lookups_total", (("result", "hit" if hit else "miss"),))
+        registry.observe("story_semantic_cache_lookup_seconds", (), elapsed)
+        return (entry.prompt, entry.story, score) if hit else None
+
+    def add(self, prompt: str, story: str, generation_seconds: Optional[float] = None) -> None:
+        """Caches a generated draft; `generation_seconds` is what generating
+        it took, for estimating what hits save."""
+        if not isinstance(story, str) or not story:
+            return
+        now = time.time()
+        with self._lock:
+            evicted = self._insert(prompt, story, now)
+            self.stats_["evictions"] += len(evicted)
+            if generation_seconds is not None:
+                self.stats_["generations"] += 1
+                self.stats_["generation_seconds"] += generation_seconds
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("INSERT OR REPLACE INTO semantic_cache VALUES (?, ?, ?)", (prompt, story, now))
+                    self._conn.executemany("DELETE FROM semantic_cache WHERE prompt = ?", [(p,) for p in evicted])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM semantic_cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self.stats_)
+            entries = len(self._entries)
+            similarity = list(self.similarity)
+        lookups = s["hits"] + s["misses"]
+        mean_generation = s["generation_seconds"] / s["generations"] if s["generations"] else None
+        return {
+            "threshold": self.threshold,
+            "entries": entries,
+            "evictions": s["evictions"],
+            "hits": s["hits"],
+            "misses": s["misses"],
+            "hit_ratio": round(s["hits"] / lookups, 4) if lookups else 0.0,
+            "mean_lookup_ms": round(s["lookup_seconds"] / lookups * 1000, 3) if lookups else None,
+            "mean_generation_seconds": round(mean_generation, 3) if mean_generation is not None else None,
+            # Generation time the hits did not spend
+            "saved_seconds": round(s["hits"] * mean_generation, 3) if mean_generation is not None else None,
+            # Lookups by best similarity found: "0.8" counts scores in [0.8, 0.9)
+            "best_similarity": {f"{i / 10:.1f}": n for i, n in enumerate(similarity) if n},
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,313 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+# -----------------------------
+# Session summary index
+# -----------------------------
+# Reading a session through the graph deserializes its whole checkpoint,
+# every LLM message included. Pollers only need to know whether anything
+# changed, so the API keeps a small denormalized row per session (status,
+# revision count, title, moral, a hash of the story) that is updated from
+# the graph's node updates as they happen. Each change bumps `version`, which
+# doubles as the ETag: an unchanged session is answered with 304 from memory.
+#
+# With several API workers the rows live next to the checkpoints (Redis or
+# Postgres; SQLite on a single host) and the in-memory cache is off, since
+# any worker may have changed a session since this one last saw it. The
+# store bumps the version itself, so two workers writing one session still
+# hand out different ETags.
+#
+# Writes (and reads the memory cache cannot answer) block on the store, so
+# the API uses the async methods, which run them in a worker thread.
+
+FIELDS = ("session_id", "status", "revision_count", "title", "moral", "story_hash", "version", "updated_at")
+
+
+def story_hash(story) -> Optional[str]:
+    if not story:
+        return None
+    # Gemini can return content blocks instead of a string
+    text = story if isinstance(story, str) else repr(story)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def title_and_moral(values: dict):
+    """Title and moral of a session, falling back to the history entries
+    written by sessions saved before they had their own fields."""
+    title, moral = values.get("title"), values.get("moral")
+    for item in values.get("history", []):
+        if not title and item.startswith("Title: "):
+            title = item[len("Title: "):]
+        elif not moral and item.startswith("Moral: "):
+            moral = item[len("Moral: "):]
+    return title, moral
+
+
+def etag(summary: dict) -> str:
+    return f'"{summary["version"]}-{summary["story_hash"] or "0"}"'
+
+
+class SessionIndex:
+    def __init__(self, path: str, max_cached: int = 10000):
+        self.path = path
+        self.max_cached = max_cached
+        self._cache: "OrderedDict[str, dict]" = OrderedDict()
+        # Reentrant: update() reads through get() while holding it
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS session_summaries (
+                session_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                revision_count INTEGER NOT NULL,
+                title TEXT,
+                moral TEXT,
+                story_hash TEXT,
+                version INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            """
+        )
+
+    def get(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            summary = self._cache.get(session_id)
+            if summary is not None:
+                self._cache.move_to_end(session_id)
+                return summary
+            summary = self._load(session_id)
+            if summary is not None:
+                self._remember(summary)
+            return summary
+
+    def update(self, session_id: str, force: bool = False, **changes) -> dict:
+        """Applies `changes`, bumping the version only if something changed
+        (or `force`, for node exits that only touched history or messages)."""
+        with self._lock:
+            current = self.get(session_id)
+            if current is None:
+                summary = {"session_id": session_id, "status": "running", "revision_count": 0,
+                           "title": None, "moral": None, "story_hash": None, "version": 0}
+            elif not force and all(current.get(k) == v for k, v in changes.items()):
+                return current
+            else:
+                summary = dict(current)
+            summary.update(changes)
+            summary["version"] += 1
+            summary["updated_at"] = time.time()
+            self._save(summary)
+            self._remember(summary)
+            return summary
+
+    def observe(self, session_id: str, chunk: dict) -> None:
+        """Records one `stream_mode="updates"` chunk ({node: update})."""
+        for node, update in chunk.items():
+            if node == "__interrupt__":
+                self.update(session_id, status="awaiting_feedback")
+                continue
+            changes = {"status": "running"}
+            for key, value in (update or {}).items():
+                if key == "story":
+                    changes["story_hash"] = story_hash(value)
+                elif key in ("revision_count", "title", "moral"):
+                    changes[key] = value
+            self.update(session_id, force=True, **changes)
+
+    def finish(self, session_id: str, paused: bool) -> dict:
+        """Sets the status once a run stops, from the graph's `next`. Always
+        writes, so the version returned is this run's own."""
+        return self.update(session_id, force=True, status="awaiting_feedback" if paused else "completed")
+
+    def rebuild(self, session_id: str, values: dict, paused: bool) -> dict:
+        """Backfills a session from its full state (e.g. one started before
+        the index existed)."""
+        title, moral = title_and_moral(values)
+        return self.update(
+            session_id,
+            status="awaiting_feedback" if paused else "completed",
+            revision_count=values.get("revision_count", 0),
+            title=title,
+            moral=moral,
+            story_hash=story_hash(values.get("story")),
+        )
+
+    # -----------------------------
+    # Async interface
+    # -----------------------------
+    async def aget(self, session_id: str) -> Optional[dict]:
+        summary = self._cache.get(session_id)
+        if summary is not None:
+            return summary
+        return await asyncio.to_thread(self.get, session_id)
+
+    async def aobserve(self, session_id: str, chunk: dict) -> None:
+        await asyncio.to_thread(self.observe, session_id, chunk)
+
+    async def afinish(self, session_id: str, paused: bool) -> dict:
+        return await asyncio.to_thread(self.finish, session_id, paused)
+
+    async def arebuild(self, session_id: str, values: dict, paused: bool) -> dict:
+        return await asyncio.to_thread(self.rebuild, session_id, values, paused)
+
+    def forget(self, session_ids: Iterable[str]) -> None:
+        session_ids = list(session_ids)
+        with self._lock:
+            for session_id in session_ids:
+                self._cache.pop(session_id, None)
+            if session_ids:
+                self._delete(session_ids)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    # -----------------------------
+    # Storage
+    # -----------------------------
+    def _load(self, session_id: str) -> Optional[dict]:
+        row = self._conn.execute(
+            f"SELECT {', '.join(FIELDS)} FROM session_summaries WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return dict(zip(FIELDS, row)) if row else None
+
+    def _save(self, summary: dict) -> None:
+        # One upsert bumps the stored version, so workers sharing the file
+        # cannot both write the same one
+        columns = [k for k in FIELDS if k != "version"]
+        updates = ", ".join(f"{k} = excluded.{k}" for k in columns if k != "session_id")
+        with self._conn:
+            row = self._conn.execute(
+                f"INSERT INTO session_summaries ({', '.join(columns)}, version) "
+                f"VALUES ({', '.join('?' * len(columns))}, 1) "
+                f"ON CONFLICT (session_id) DO UPDATE SET {updates}, "
+                f"version = session_summaries.version + 1 RETURNING version",
+                tuple(summary[k] for k in columns),
+            ).fetchone()
+        summary["version"] = row[0]
+
+    def _delete(self, session_ids: list) -> None:
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM session_summaries WHERE session_id = ?", [(s,) for s in session_ids]
+            )
+
+    def _remember(self, summary: dict) -> None:
+        self._cache[summary["session_id"]] = summary
+        self._cache.move_to_end(summary["session_id"])
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+
+class RedisSessionIndex(SessionIndex):
+    """Summaries in Redis, next to RedisSaver's checkpoints; the version is
+    bumped with HINCRBY."""
+
+    def __init__(self, client, prefix: str = "story:", ttl: Optional[float] = None):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = int(ttl) if ttl else None
+        self.max_cached = 0
+        self._cache = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}summary:{session_id}"
+
+    def _load(self, session_id: str) -> Optional[dict]:
+        row = self.client.hgetall(self._key(session_id))
+        if not row:
+            return None
+        summary = json.loads(row[b"data"])
+        summary["version"] = int(row[b"version"])
+        return summary
+
+    def _save(self, summary: dict) -> None:
+        key = self._key(summary["session_id"])
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hincrby(key, "version", 1)
+        pipe.hset(key, "data", json.dumps({k: summary[k] for k in FIELDS if k != "version"}))
+        if self.ttl:
+            pipe.expire(key, self.ttl)
+        summary["version"] = pipe.execute()[0]
+
+    def _delete(self, session_ids: list) -> None:
+        self.client.delete(*(self._key(s) for s in session_ids))
+
+    def close(self) -> None:
+        # The client belongs to the checkpointer
+        pass
+
+
+class PostgresSessionIndex(SessionIndex):
+    """Summaries in Postgres, next to PostgresSaver's checkpoints; the
+    version is bumped by the upsert itself."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.max_cached = 0
+        self._cache = OrderedDict()
+        self._lock = threading.RLock()
+        with self.pool.connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS session_summaries (
+                    session_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    revision_count INTEGER NOT NULL,
+                    title TEXT,
+                    moral TEXT,
+                    story_hash TEXT,
+                    version INTEGER NOT NULL,
+                    updated_at DOUBLE PRECISION NOT NULL
+                )
+                """
+            )
+
+    def _load(self, session_id: str) -> Optional[dict]:
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(FIELDS)} FROM session_summaries WHERE session_id = %s", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(row) if isinstance(row, dict) else dict(zip(FIELDS, row))
+
+    def _save(self, summary: dict) -> None:
+        columns = [k for k in FIELDS if k != "version"]
+        updates = ", ".join(f"{k} = EXCLUDED.{k}" for k in columns if k != "session_id")
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                f"INSERT INTO session_summaries ({', '.join(columns)}, version) "
+                f"VALUES ({', '.join(['%s'] * len(columns))}, 1) "
+                f"ON CONFLICT (session_id) DO UPDATE SET {updates}, "
+                f"version = session_summaries.version + 1 RETURNING version",
+                tuple(summary[k] for k in columns),
+            ).fetchone()
+        summary["version"] = row["version"] if isinstance(row, dict) else row[0]
+
+    def _delete(self, session_ids: list) -> None:
+        with self.pool.connection() as conn:
+            conn.execute("DELETE FROM session_summaries WHERE session_id = ANY(%s)", (session_ids,))
+
+    def close(self) -> None:
+        # The pool belongs to the checkpointer
+        pass
+
+
+def open_session_index(checkpointer, backend: str, path: str, workers: int = 1) -> SessionIndex:
+    """The index kept next to the checkpoints (see CHECKPOINT_BACKEND),
+    sharing the checkpointer's client. SQLite rows are cached in memory only
+    when a single worker serves the API."""
+    if backend == "redis":
+        return RedisSessionIndex(checkpointer.client, checkpointer.prefix, checkpointer.ttl)
+    if backend == "postgres":
+        return PostgresSessionIndex(checkpointer.conn)
+    return SessionIndex(path, max_cached=10000 if workers <= 1 else 0)
@@ -0,0 +1,376 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from metrics import registry
+from config import SESSION_LOCK_WAIT_SECONDS, SESSION_LEASE_SECONDS, IDEMPOTENCY_TTL_SECONDS
+
+# -----------------------------
+# Session locks and idempotency
+# -----------------------------
+# Two overlapping runs on one thread (a double click, a client retry) both
+# resume the same interrupt: the model is paid twice and the second run
+# writes its checkpoints over the first's. Runs on a session therefore hold
+# its lock: an asyncio lock in this process and, with several API workers, a
+# lease row next to the checkpoints. The lease expires on its own if its
+# worker dies, and is renewed while the run goes on.
+#
+# Waiting alone would still run the feedback twice, one revision after the
+# other. So finished runs are remembered by idempotency key: the client's
+# Idempotency-Key header, or else the feedback together with the story it
+# was given for. A request with a key that already has a result gets that
+# result back, without touching the graph.
+#
+# Every store call is a round trip (SQLite, Redis or Postgres) and runs in a
+# thread, off the event loop. A run whose lease could not be renewed is
+# cancelled: another worker may hold the session by then.
+
+registry.describe("story_session_lock_wait_seconds", "Time requests waited for a session's lock, by scope.")
+registry.describe("story_session_lock_contended_total", "Session lock acquisitions that had to wait, by scope.")
+registry.describe("story_session_lock_timeouts_total", "Requests refused because their session stayed locked.")
+registry.describe("story_idempotent_replays_total", "Requests answered with a stored result, by key source.")
+registry.describe("story_session_leases_lost_total", "Runs cancelled because their session lease could not be renewed.")
+
+# Seconds between attempts at a lease another worker holds
+LEASE_POLL_SECONDS = 0.05
+
+
+class SessionBusy(Exception):
+    pass
+
+
+def fingerprint(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()[:32]
+
+
+class SessionLocks:
+    """Leases and stored results in SQLite (DB_PATH). Leases are only taken
+    when `shared`, i.e. when other processes serve the same sessions."""
+
+    def __init__(self, path: str, shared: bool = False, lease_seconds: float = SESSION_LEASE_SECONDS,
+                 wait_seconds: float = SESSION_LOCK_WAIT_SECONDS, ttl: float = IDEMPOTENCY_TTL_SECONDS):
+        self._init(shared, lease_seconds, wait_seconds, ttl)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS session_leases (
+                session_id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idempotency_keys_created ON idempotency_keys (created_at);
+            """
+        )
+
+    def _init(self, shared: bool, lease_seconds: float = SESSION_LEASE_SECONDS,
+              wait_seconds: float = SESSION_LOCK_WAIT_SECONDS, ttl: float = IDEMPOTENCY_TTL_SECONDS) -> None:
+        self.shared = shared
+        self.lease_seconds = lease_seconds
+        self.wait_seconds = wait_seconds
+        self.ttl = ttl
+        # session_id -> [lock, holders and waiters]
+        self._locks: Dict[str, list] = {}
+        self._owner_prefix = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    # -----------------------------
+    # Locking
+    # -----------------------------
+    @asynccontextmanager
+    async def hold(self, session_id: str):
+        """Holds the session for a run; raises SessionBusy after waiting
+        `wait_seconds`, or if the run loses its lease (the run is cancelled
+        at that point). Must be used on the event loop."""
+        deadline = time.monotonic() + self.wait_seconds
+        entry = self._locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            await self._wait("local", entry[0].acquire(), deadline, contended=entry[0].locked())
+            try:
+                owner = None
+                if self.shared:
+                    owner = f"{self._owner_prefix}:{uuid.uuid4().hex[:8]}"
+                    if not await asyncio.to_thread(self._try_lease, session_id, owner, time.time()):
+                        try:
+                            await self._wait("shared", self._lease(session_id, owner), deadline, contended=True)
+                        except SessionBusy:
+                            # A poll cut short may still have taken the lease
+                            await asyncio.shield(asyncio.to_thread(self._release, session_id, owner))
+                            raise
+                holder = asyncio.current_task()
+                lost = []
+                renewing = asyncio.create_task(self._renew_loop(session_id, owner, holder, lost)) if owner else None
+                try:
+                    yield
+                except asyncio.CancelledError:
+                    # Only the renewal's own cancellation becomes SessionBusy
+                    if not lost or holder.uncancel():
+                        raise
+                finally:
+                    if renewing:
+                        renewing.cancel()
+                    if owner:
+                        await asyncio.shield(asyncio.to_thread(self._release, session_id, owner))
+                if lost:
+                    raise SessionBusy("The session's lease was lost to another request")
+            finally:
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self._locks.pop(session_id, None)
+
+    async def _wait(self, scope: str, acquiring, deadline: float, contended: bool) -> None:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(acquiring, max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            registry.inc("story_session_lock_timeouts_total", (("scope", scope),))
+            raise SessionBusy("Another request is running on this session")
+        if contended:
+            registry.inc("story_session_lock_contended_total", (("scope", scope),))
+            registry.observe("story_session_lock_wait_seconds", (("scope", scope),), time.perf_counter() - start)
+
+    async def _lease(self, session_id: str, owner: str) -> None:
+        """Polls for a lease another worker holds."""
+        while not await asyncio.to_thread(self._try_lease, session_id, owner, time.time()):
+            await asyncio.sleep(LEASE_POLL_SECONDS)
+
+    async def _renew_loop(self, session_id: str, owner: str, holder: asyncio.Task, lost: list) -> None:
+        """Renews the lease until cancelled. Once it is gone (taken over, or
+        not renewed for a whole lease) the holder is cancelled."""
+        renewed = time.monotonic()
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if not await asyncio.to_thread(self._renew, session_id, owner, time.time()):
+                    break
+                renewed = time.monotonic()
+            except Exception:
+                # The store may be back before the lease runs out
+                if time.monotonic() - renewed >= self.lease_seconds:
+                    break
+        registry.inc("story_session_leases_lost_total", ())
+        lost.append(session_id)
+        holder.cancel()
+
+    # -----------------------------
+    # Idempotency
+    # -----------------------------
+    def recall(self, key: str, expected: str) -> Optional[dict]:
+        """The response stored under `key`, or None. Raises ValueError if the
+        key was used for a different request (`expected` fingerprint)."""
+        record = self._load(key)
+        if record is None or record["created_at"] < time.time() - self.ttl:
+            return None
+        if record["fingerprint"] != expected:
+            raise ValueError("Idempotency-Key was already used for a different request")
+        return record["response"]
+
+    def remember(self, key: str, expected: str, response: dict) -> None:
+        self._save(key, expected, response, time.time())
+
+    async def arecall(self, key: str, expected: str) -> Optional[dict]:
+        return await asyncio.to_thread(self.recall, key, expected)
+
+    async def aremember(self, key: str, expected: str, response: dict) -> None:
+        await asyncio.to_thread(self.remember, key, expected, response)
+
+    def stats(self) -> dict:
+        return {
+            "shared": self.shared,
+            "sessions_locked": len(self._locks),
+            # Requests queued behind another run of their session
+            "waiting": sum(count - 1 for _, count in self._locks.values()),
+            "wait_seconds": registry.summary("story_session_lock_wait_seconds"),
+        }
+
+    def close(self) -> None:
+        self._conn.close()
+
+    # -----------------------------
+    # Storage
+    # -----------------------------
+    def _try_lease(self, session_id: str, owner: str, now: float) -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO session_leases VALUES (?, ?, ?) ON CONFLICT (session_id) DO UPDATE SET "
+                "owner = excluded.owner, expires_at = excluded.expires_at WHERE session_leases.expires_at < ?",
+                (session_id, owner, now + self.lease_seconds, now),
+            )
+        return cursor.rowcount == 1
+
+    def _renew(self, session_id: str, owner: str, now: float) -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE session_leases SET expires_at = ? WHERE session_id = ? AND owner = ?",
+                (now + self.lease_seconds, session_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def _release(self, session_id: str, owner: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM session_leases WHERE session_id = ? AND owner = ?", (session_id, owner))
+
+    def _load(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, response, created_at FROM idempotency_keys WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"fingerprint": row[0], "response": json.loads(row[1]), "created_at": row[2]}
+
+    def _save(self, key: str, expected: str, response: dict, now: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO idempotency_keys VALUES (?, ?, ?, ?)",
+                               (key, expected, json.dumps(response), now))
+            self._conn.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (now - self.ttl,))
+
+
+class RedisSessionLocks(SessionLocks):
+    """Leases as SET NX keys with an expiry, checked and released under
+    WATCH; results as keys expiring after the TTL."""
+
+    def __init__(self, client, prefix: str = "story:", **kwargs):
+        self._init(shared=True, **kwargs)
+        self.client = client
+        self.prefix = prefix
+
+    def _if_owner(self, key: str, owner: str, action) -> bool:
+        from redis.exceptions import WatchError
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.get(key) != owner.encode("utf-8"):
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                action(pipe)
+                pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    def _try_lease(self, session_id: str, owner: str, now: float) -> bool:
+        return bool(self.client.set(f"{self.prefix}lease:{session_id}", owner, nx=True,
+                                    px=int(self.lease_seconds * 1000)))
+
+    def _renew(self, session_id: str, owner: str, now: float) -> bool:
+        key = f"{self.prefix}lease:{session_id}"
+        return self._if_owner(key, owner, lambda pipe: pipe.pexpire(key, int(self.lease_seconds * 1000)))
+
+    def _release(self, session_id: str, owner: str) -> None:
+        key = f"{self.prefix}lease:{session_id}"
+        self._if_owner(key, owner, lambda pipe: pipe.delete(key))
+
+    def _load(self, key: str) -> Optional[dict]:
+        raw = self.client.get(f"{self.prefix}idem:{key}")
+        return json.loads(raw) if raw else None
+
+    def _save(self, key: str, expected: str, response: dict, now: float) -> None:
+        record = {"fingerprint": expected, "response": response, "created_at": now}
+        self.client.set(f"{self.prefix}idem:{key}", json.dumps(record), ex=max(int(self.ttl), 1))
+
+    def close(self) -> None:
+        # The client belongs to the checkpointer
+        pass
+
+
+class PostgresSessionLocks(SessionLocks):
+    """The SQLite tables, in the checkpoint database."""
+
+    def __init__(self, pool, **kwargs):
+        self._init(shared=True, **kwargs)
+        self.pool = pool
+        with self.pool.connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS session_leases (
+                    session_id TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at DOUBLE PRECISION NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS idempotency_keys (
+                    key TEXT PRIMARY KEY,
+                    fingerprint TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at DOUBLE PRECISION NOT NULL
+                )
+                """
+            )
+
+    def _try_lease(self, session_id: str, owner: str, now: float) -> bool:
+        with self.pool.connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO session_leases VALUES (%s, %s, %s) ON CONFLICT (session_id) DO UPDATE SET "
+                "owner = EXCLUDED.owner, expires_at = EXCLUDED.expires_at WHERE session_leases.expires_at < %s",
+                (session_id, owner, now + self.lease_seconds, now),
+            )
+            return cursor.rowcount == 1
+
+    def _renew(self, session_id: str, owner: str, now: float) -> bool:
+        with self.pool.connection() as conn:
+            cursor = conn.execute(
+                "UPDATE session_leases SET expires_at = %s WHERE session_id = %s AND owner = %s",
+                (now + self.lease_seconds, session_id, owner),
+            )
+            return cursor.rowcount == 1
+
+    def _release(self, session_id: str, owner: str) -> None:
+        with self.pool.connection() as conn:
+            conn.execute("DELETE FROM session_leases WHERE session_id = %s AND owner = %s", (session_id, owner))
+
+    def _load(self, key: str) -> Optional[dict]:
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT fingerprint, response, created_at FROM idempotency_keys WHERE key = %s", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        if isinstance(row, dict):
+            row = (row["fingerprint"], row["response"], row["created_at"])
+        return {"fingerprint": row[0], "response": json.loads(row[1]), "created_at": row[2]}
+
+    def _save(self, key: str, expected: str, response: dict, now: float) -> None:
+        with self.pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO idempotency_keys VALUES (%s, %s, %s, %s) ON CONFLICT (key) DO UPDATE SET "
+                "fingerprint = EXCLUDED.fingerprint, response = EXCLUDED.response, created_at = EXCLUDED.created_at",
+                (key, expected, json.dumps(response), now),
+            )
+            conn.execute("DELETE FROM idempotency_keys WHERE created_at < %s", (now - self.ttl,))
+
+    def close(self) -> None:
+        # The pool belongs to the checkpointer
+        pass
+
+
+def open_session_locks(checkpointer, backend: str, path: str, workers: int = 1) -> SessionLocks:
+    """Locks kept next to the checkpoints (see CHECKPOINT_BACKEND), sharing
+    the checkpointer's client. SQLite leases are only taken when several
+    workers serve the API."""
+    if backend == "redis":
+        return RedisSessionLocks(checkpointer.client, checkpointer.prefix)
+    if backend == "postgres":
+        return PostgresSessionLocks(checkpointer.conn)
+    return SessionLocks(path, shared=workers > 1)
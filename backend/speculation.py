@@ -0,0 +1,188 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from context import count_tokens
+from metrics import registry, llm_usage
+from rate_limiter import llm_priority, llm_dispatched
+from session_index import story_hash
+from config import SPECULATIVE_FINALIZE, SPECULATION_MAX_SESSIONS, SPECULATION_TTL_SECONDS
+
+# -----------------------------
+# Speculative finalization
+# -----------------------------
+# While a session waits at human_feedback nothing runs, and when the user
+# answers "done" they then wait for the title and moral calls. With
+# SPECULATIVE_FINALIZE on, both start in the background as soon as a draft
+# reaches the interrupt, at the rate limiter's lowest priority. The results
+# are kept against the hash of the story they were made for. The finalize
+# nodes use them only if the story is still the same, and await them if
+# they are still running. New feedback cancels them.
+#
+# Tokens spent on results nobody used are counted as wasted, so the trade
+# (finalization latency for extra spend) stays visible on /metrics. A call
+# cancelled after it was sent is billed for its prompt all the same: those
+# are counted as cancelled_in_flight, their prompt tokens (estimated) wasted.
+
+FIELDS = ("title", "moral")
+
+registry.describe("story_speculation_total",
+                  "Speculative title/moral results by outcome (used, wasted, cancelled, cancelled_in_flight).")
+registry.describe("story_speculative_tokens_total", "Tokens spent on speculative title/moral calls, used or wasted.")
+
+
+class _TokenCounter(BaseCallbackHandler):
+    run_inline = True
+
+    def __init__(self):
+        self.tokens = 0
+        self.prompt_tokens = 0
+        # Calls sent and not answered yet
+        self.in_flight = 0
+
+    def dispatched(self) -> None:
+        self.in_flight += 1
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.prompt_tokens = count_tokens(messages[0])
+
+    def on_llm_error(self, error, **kwargs):
+        self.in_flight = max(self.in_flight - 1, 0)
+
+    def on_llm_end(self, response, **kwargs):
+        self.in_flight = max(self.in_flight - 1, 0)
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                # Answered by the response cache: nothing was spent
+                if usage.get("total_cost") != 0:
+                    self.tokens += usage.get("total_tokens", 0)
+
+
+class _Speculation:
+    __slots__ = ("story_hash", "tasks", "counters", "taken", "created")
+
+    def __init__(self, story_hash: str):
+        self.story_hash = story_hash
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.counters: Dict[str, _TokenCounter] = {}
+        self.taken = set()
+        self.created = time.monotonic()
+
+
+class Speculator:
+    def __init__(self, enabled: bool = SPECULATIVE_FINALIZE, max_sessions: int = SPECULATION_MAX_SESSIONS,
+                 ttl: float = SPECULATION_TTL_SECONDS):
+        self.enabled = enabled
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _Speculation]" = OrderedDict()
+        self.tokens = {"used": 0, "wasted": 0}
+        self.cancelled_in_flight = 0
+
+    def start(self, session_id: str, story) -> None:
+        """Starts title and moral for `story`, unless already running for it.
+        Must be called on the event loop."""
+        if not self.enabled or not story:
+            return
+        key = story_hash(story)
+        current = self._entries.get(session_id)
+        if current is not None:
+            if current.story_hash == key:
+                return
+            self._discard(session_id)
+        self._expire()
+        entry = self._entries[session_id] = _Speculation(key)
+        for field in FIELDS:
+            entry.counters[field] = _TokenCounter()
+            entry.tasks[field] = asyncio.create_task(self._generate(field, story, entry.counters[field]))
+
+    def cancel(self, session_id: str) -> None:
+        """The story is about to change: drop whatever was speculated."""
+        if session_id in self._entries:
+            self._discard(session_id)
+
+    async def take(self, session_id: Optional[str], story, field: str) -> Optional[str]:
+        """The speculative `field` for this exact story, waiting for it if it
+        is still running, or None."""
+        entry = self._entries.get(session_id) if session_id else None
+        if entry is None:
+            return None
+        if entry.story_hash != story_hash(story):
+            self._discard(session_id)
+            return None
+        try:
+            result = await asyncio.shield(entry.tasks[field])
+        except asyncio.CancelledError:
+            # Our own cancellation goes on; speculation cancelled under us
+            # (the story is changing) just means the node generates it
+            current = asyncio.current_task()
+            if current is not None and current.cancelling():
+                raise
+            return None
+        except Exception:
+            # Failed in the background: the node generates it itself
+            return None
+        entry.taken.add(field)
+        self._account(field, "used", entry.counters[field].tokens)
+        if entry.taken.issuperset(FIELDS):
+            self._entries.pop(session_id, None)
+        return result
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "sessions": len(self._entries), "tokens": dict(self.tokens),
+                "cancelled_in_flight": self.cancelled_in_flight}
+
+    def close(self) -> None:
+        while self._entries:
+            self._discard(next(iter(self._entries)))
+
+    async def _generate(self, field: str, story, counter: _TokenCounter) -> str:
+        from graph_nodes import FINALIZE_PROMPTS, model_for
+
+        # This task's own context: only its calls drop to the lowest class
+        llm_priority.set("speculative")
+        llm_dispatched.set(counter.dispatched)
+        node, messages = FINALIZE_PROMPTS[field]
+        config = {"callbacks": [llm_usage, counter], "metadata": {"langgraph_node": f"{node}:speculative"}}
+        response = await model_for(node).ainvoke(messages({"story": story}), config)
+        return response.content
+
+    def _discard(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id)
+        for field, task in entry.tasks.items():
+            if field in entry.taken:
+                continue
+            if task.done():
+                self._account(field, "wasted", entry.counters[field].tokens)
+            else:
+                task.cancel()
+                counter = entry.counters[field]
+                if counter.in_flight:
+                    # Sent already: the prompt is paid for
+                    self.cancelled_in_flight += 1
+                    self._account(field, "cancelled_in_flight", counter.tokens + counter.in_flight * counter.prompt_tokens)
+                else:
+                    self._account(field, "cancelled", counter.tokens)
+
+    def _expire(self) -> None:
+        """Drops sessions left at the interrupt for longer than the ttl, and
+        the oldest ones beyond max_sessions."""
+        now = time.monotonic()
+        while self._entries:
+            session_id, entry = next(iter(self._entries.items()))
+            if len(self._entries) < self.max_sessions and now - entry.created < self.ttl:
+                break
+            self._discard(session_id)
+
+    def _account(self, field: str, outcome: str, tokens: int) -> None:
+        spent = "used" if outcome == "used" else "wasted"
+        self.tokens[spent] += tokens
+        registry.inc("story_speculation_total", (("field", field), ("outcome", outcome)))
+        registry.inc("story_speculative_tokens_total", (("outcome", spent),), tokens)
+
+
+speculator = Speculator()
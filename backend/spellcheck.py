@@ -0,0 +1,214 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# -----------------------------
+# Spelling correction engine
+# -----------------------------
+# Symmetric-delete (SymSpell-style) corrector. Instead of generating every
+# edit of every input word at request time like TextBlob's Norvig corrector,
+# the dictionary's deletes are indexed once; a lookup only generates deletes
+# of the input and verifies the few indexed matches with an edit distance.
+# Word choice follows TextBlob: smallest edit distance, then highest corpus
+# frequency, so results are comparable on the same dictionary.
+
+WORD_RE = re.compile(r"[A-Za-z]+")
+# Paragraphs are separated by blank lines; the separators are kept so the
+# corrected text has exactly the original layout
+PARAGRAPH_SPLIT_RE = re.compile(r"(\n\s*\n)")
+
+
+def damerau_levenshtein(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance, or max_distance + 1 if larger."""
+    if a == b:
+        return 0
+    la, lb = len(a), len(b)
+    if abs(la - lb) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(lb + 1))
+    for i in range(1, la + 1):
+        current = [i] + [0] * lb
+        row_min = i
+        ca = a[i - 1]
+        for j in range(1, lb + 1):
+            cost = 0 if ca == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and j > 1 and ca == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[lb]
+
+
+def _deletes(word: str, max_distance: int) -> set:
+    result = set()
+    frontier = {word}
+    for _ in range(max_distance):
+        next_frontier = set()
+        for w in frontier:
+            if len(w) <= 1:
+                continue
+            for i in range(len(w)):
+                next_frontier.add(w[:i] + w[i + 1:])
+        next_frontier -= result
+        result |= next_frontier
+        frontier = next_frontier
+    return result
+
+
+class SpellingEngine:
+    def __init__(
+        self,
+        frequencies: Dict[str, int],
+        max_distance: int = 2,
+        prefix_length: int = 7,
+        token_cache_size: int = 50000,
+        paragraph_cache_size: int = 2048,
+    ):
+        self.frequencies = frequencies
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self._index: Dict[str, List[str]] = {}
+        for word in frequencies:
+            # Indexing deletes of the prefix only keeps the index small;
+            # candidates are verified on the full word afterwards
+            prefix = word[:prefix_length]
+            for delete in _deletes(prefix, max_distance) | {prefix}:
+                self._index.setdefault(delete, []).append(word)
+
+        self._token_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._token_cache_size = token_cache_size
+        self._paragraph_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._paragraph_cache_size = paragraph_cache_size
+        self._lock = threading.Lock()
+        self.stats = {"tokens": 0, "token_hits": 0, "paragraphs": 0, "paragraph_hits": 0}
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "SpellingEngine":
+        """Loads a `word count` per line frequency list (TextBlob's format)."""
+        frequencies = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.startswith(";;;"):
+                    continue
+                parts = line.split()
+                if len(parts) == 2:
+                    frequencies[parts[0]] = int(parts[1])
+        return cls(frequencies, **kwargs)
+
+    # -----------------------------
+    # Words
+    # -----------------------------
+    def suggest(self, word: str) -> str:
+        """Best correction for a lowercase word (the word itself if known)."""
+        if word in self.frequencies:
+            return word
+        length = len(word)
+        prefix = word[:self.prefix_length]
+        best, best_distance, best_count = word, self.max_distance + 1, 0
+        seen = set()
+        for key in _deletes(prefix, self.max_distance) | {prefix}:
+            for candidate in self._index.get(key, ()):
+                if candidate in seen or abs(len(candidate) - length) > self.max_distance:
+                    continue
+                seen.add(candidate)
+                distance = damerau_levenshtein(word, candidate, min(best_distance, self.max_distance))
+                if distance > self.max_distance:
+                    continue
+                count = self.frequencies[candidate]
+                if distance < best_distance or (distance == best_distance and count > best_count):
+                    best, best_distance, best_count = candidate, distance, count
+        return best
+
+    def correct_word(self, token: str) -> str:
+        self.stats["tokens"] += 1
+        cached = self._token_cache.get(token)
+        if cached is not None:
+            self.stats["token_hits"] += 1
+            return cached
+
+        if token.islower():
+            corrected = self.suggest(token) if len(token) > 1 else token
+        elif token.istitle() and len(token) > 1:
+            corrected = self.suggest(token.lower()).title()
+        else:
+            # Single letters, acronyms and mixed-case names are left alone
+            corrected = token
+
+        with self._lock:
+            self._token_cache[token] = corrected
+            if len(self._token_cache) > self._token_cache_size:
+                self._token_cache.popitem(last=False)
+        return corrected
+
+    # -----------------------------
+    # Text
+    # -----------------------------
+    def correct_paragraph(self, paragraph: str) -> str:
+        self.stats["paragraphs"] += 1
+        with self._lock:
+            cached = self._paragraph_cache.get(paragraph)
+            if cached is not None:
+                self._paragraph_cache.move_to_end(paragraph)
+                self.stats["paragraph_hits"] += 1
+                return cached
+
+        corrected = WORD_RE.sub(lambda m: self.correct_word(m.group(0)), paragraph)
+
+        with self._lock:
+            self._paragraph_cache[paragraph] = corrected
+            if len(self._paragraph_cache) > self._paragraph_cache_size:
+                self._paragraph_cache.popitem(last=False)
+        return corrected
+
+    def correct(self, text: str) -> str:
+        """Corrects a story, reusing results for paragraphs seen before.
+
+        Revisions usually touch a few paragraphs, so unchanged ones are served
+        from the paragraph cache instead of being corrected again.
+        """
+        parts = PARAGRAPH_SPLIT_RE.split(text)
+        return "".join(
+            part if i % 2 else self.correct_paragraph(part)
+            for i, part in enumerate(parts)
+        )
+
+    def correction_rate(self, text: str) -> float:
+        """Fraction of words the engine would change in `text`."""
+        original = WORD_RE.findall(text)
+        if not original:
+            return 0.0
+        corrected = WORD_RE.findall(self.correct(text))
+        return sum(a != b for a, b in zip(original, corrected)) / len(original)
+
+
+# -----------------------------
+# Shared engine
+# -----------------------------
+_engine: Optional[SpellingEngine] = None
+_engine_lock = threading.Lock()
+
+
+def default_dictionary_path() -> str:
+    """The frequency list TextBlob's corrector uses, unless overridden."""
+    path = os.getenv("SPELLING_DICTIONARY")
+    if path:
+        return path
+    import textblob
+    return os.path.join(os.path.dirname(textblob.__file__), "en", "en-spelling.txt")
+
+
+def get_engine() -> SpellingEngine:
+    """Process-wide engine; the index is built once, on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = SpellingEngine.from_file(default_dictionary_path())
+    return _engine
@@ -1,3 +1,4 @@
+import operator
 from typing_extensions import TypedDict,Optional,List,Annotated
 from langgraph.graph.message import add_messages
 # -----------------------------
@@ -8,6 +9,13 @@ class State(TypedDict):
     story: str
     feedback: Optional[str]
     revision_count: int
-    history: List[str]
+    # 0-based paragraphs the last revision rewrote; None when it rewrote the
+    # whole story (REVISION_MODE)
+    changed_paragraphs: Optional[List[int]]
+    # Nodes return only their new entries; parallel branches (title_generator
+    # and moral_extractor) are joined by concatenation
+    history: Annotated[List[str], operator.add]
+    title: Optional[str]
+    moral: Optional[str]
     session_id: str
     messages: Annotated[List, add_messages]
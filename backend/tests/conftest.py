@@ -0,0 +1,47 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The backend modules import each other by name, and config reads the
+# environment once: point every store at a scratch directory before any of
+# them is imported
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+ROOT = tempfile.mkdtemp(prefix="story-tests-")
+os.environ["STORIES_DB"] = os.path.join(ROOT, "stories.db")
+os.environ["LLM_CACHE_DB"] = os.path.join(ROOT, "llm_cache.db")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ["SEMANTIC_CACHE_ENABLED"] = "false"
+os.environ["SPECULATIVE_FINALIZE"] = "false"
+os.environ["WARMUP"] = "false"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def fake_llm():
+    """The offline stand-in for Gemini behind every node (see fake_llm.py)."""
+    import graph_nodes
+    import static_workflow
+    from fake_llm import FakeStoryLLM
+    from llm_clients import clients
+    from rate_limiter import limiter
+
+    fake = FakeStoryLLM(latency=0.0)
+    graph_nodes.llm = static_workflow.llm = fake
+    # Models are built from the stand-in on first use, keyed by its id
+    clients._variants.clear()
+    limiter.configure(rpm=0, tpm=0)
+    yield fake
+    graph_nodes.llm = static_workflow.llm = None
+
+
+@pytest.fixture
+def tmp_db(tmp_path):
+    return str(tmp_path / "test.db")
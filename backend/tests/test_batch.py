@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+import pytest
+
+from batch import BatchStore, batch_id_for, run_batch
+from conftest import run
+
+PROMPTS = [f"a fox who finds key {i}" for i in range(5)]
+
+
+@pytest.fixture
+def store(tmp_db):
+    store = BatchStore(tmp_db)
+    yield store
+    store.close()
+
+
+def test_resubmitting_the_same_batch_resumes_it(store):
+    batch_id = store.open(PROMPTS, {"mode": "static"})
+    assert batch_id == batch_id_for(PROMPTS, {"mode": "static"})
+    assert store.open(PROMPTS, {"mode": "static"}) == batch_id
+    assert store.progress(batch_id)["pending"] == len(PROMPTS)
+    with pytest.raises(KeyError):
+        store.open([], {}, batch_id="unknown")
+
+
+def test_claims_by_two_runs_are_disjoint(store):
+    batch_id = store.open(PROMPTS, {})
+    first = store.claim(batch_id, "a", limit=3)
+    second = store.claim(batch_id, "b", limit=3)
+    assert [i["index"] for i in first] == [0, 1, 2]
+    assert [i["index"] for i in second] == [3, 4]
+    assert store.claim(batch_id, "c") == []
+    assert store.progress(batch_id)["running"] == len(PROMPTS)
+
+
+def test_released_items_are_claimed_again_without_using_an_attempt(store):
+    batch_id = store.open(PROMPTS, {})
+    store.claim(batch_id, "a", limit=2)
+    store.release(batch_id, "a")
+    assert store.progress(batch_id)["pending"] == len(PROMPTS)
+    assert store.claim(batch_id, "b")[0] == {"index": 0, "prompt": PROMPTS[0], "attempts": 1}
+
+
+def test_a_crashed_run_s_items_are_recovered_once_stale(store):
+    batch_id = store.open(PROMPTS, {})
+    store.claim(batch_id, "crashed", limit=2)
+    store.recover(batch_id, stale_after=60)
+    assert store.progress(batch_id)["running"] == 2
+
+    time.sleep(0.01)
+    store.touch(batch_id, "other")
+    store.recover(batch_id, stale_after=0.005)
+    assert store.progress(batch_id)["running"] == 0
+    assert [i["index"] for i in store.claim(batch_id, "next", limit=2)] == [0, 1]
+
+
+def test_items_out_of_attempts_are_failed(store):
+    batch_id = store.open(PROMPTS[:2], {})
+    for owner in ("a", "b"):
+        store.claim(batch_id, owner, max_attempts=2)
+        store.mark(batch_id, 0, "failed", error="boom")
+    # A run does not retry an item it failed itself
+    assert [i["index"] for i in store.claim(batch_id, "b", max_attempts=2)] == [1]
+    assert store.claim(batch_id, "c", max_attempts=2) == []
+
+    # Item 1 crashes its run twice
+    for owner in ("c", "d"):
+        time.sleep(0.01)
+        store.recover(batch_id, max_attempts=2, stale_after=0.005)
+        store.claim(batch_id, owner, max_attempts=2)
+    time.sleep(0.01)
+    store.recover(batch_id, max_attempts=2, stale_after=0.005)
+    failed, crashed = store.items(batch_id)
+    assert (failed["status"], failed["attempts"], failed["error"]) == ("failed", 2, "boom")
+    assert (crashed["status"], crashed["attempts"]) == ("failed", 2)
+    assert crashed["error"] == "gave up after 2 attempts"
+
+
+def test_a_stopped_batch_resumes_where_it_left_off(store, fake_llm):
+    batch_id = store.open(PROMPTS, {"mode": "static", "feedback": ["make it shorter"]})
+
+    async def first_record():
+        records = run_batch(store, batch_id, concurrency=2)
+        record = await records.__anext__()
+        await records.aclose()
+        return record
+
+    async def the_rest():
+        return [record async for record in run_batch(store, batch_id, concurrency=2)]
+
+    first = run(first_record())
+    assert first["status"] == "done" and first["result"]["story"]
+    # The rest of its chunk went back to pending
+    progress = store.progress(batch_id)
+    assert (progress["done"], progress["running"], progress["pending"]) == (1, 0, 4)
+
+    rest = run(the_rest())
+    assert sorted(r["index"] for r in rest) == [1, 2, 3, 4]
+    assert all(r["status"] == "done" for r in rest)
+    assert store.progress(batch_id)["done"] == len(PROMPTS)
+    assert {i["attempts"] for i in store.items(batch_id)} == {1}
+
+
+def test_store_writes_do_not_block_the_event_loop(store, fake_llm, monkeypatch):
+    batch_id = store.open(PROMPTS[:2], {"mode": "static"})
+    mark = store.mark
+
+    def slow_mark(*args, **kwargs):
+        # Another process holding BATCH_DB's write lock
+        time.sleep(0.2)
+        mark(*args, **kwargs)
+
+    monkeypatch.setattr(store, "mark", slow_mark)
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        ticking = asyncio.create_task(ticker())
+        records = [record async for record in run_batch(store, batch_id, concurrency=2)]
+        ticking.cancel()
+        return records
+
+    assert len(run(scenario())) == 2
+    assert len(ticks) > 20
+    assert store.progress(batch_id)["done"] == 2
@@ -0,0 +1,78 @@
+import sqlite3
+import threading
+
+from langgraph.checkpoint.base import empty_checkpoint
+
+from checkpointer import GroupCommitter, PooledSqliteSaver
+
+
+def config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+
+def put(saver, thread_id: str, story: str) -> dict:
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"story": story}
+    return saver.put(config(thread_id), checkpoint, {"source": "input", "step": 0}, {})
+
+
+def test_concurrent_puts_share_commits(tmp_db):
+    saver = PooledSqliteSaver(tmp_db, pool_size=4, commit_window=0.05)
+    try:
+        threads = [threading.Thread(target=put, args=(saver, f"t{i}", f"story {i}")) for i in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = saver.stats()
+        assert stats["writes"] == 16
+        assert stats["write_batches"] < 16
+        for i in range(16):
+            assert saver.get_tuple(config(f"t{i}")).checkpoint["channel_values"]["story"] == f"story {i}"
+    finally:
+        saver.close()
+
+
+def test_put_is_durable_when_it_returns(tmp_db):
+    saver = PooledSqliteSaver(tmp_db, pool_size=2)
+    try:
+        put(saver, "durable", "once upon a time")
+        # Another connection, as after a crash: the row is already committed
+        with sqlite3.connect(tmp_db) as conn:
+            rows = conn.execute("SELECT COUNT(*) FROM checkpoints WHERE thread_id = 'durable'").fetchone()[0]
+        assert rows == 1
+    finally:
+        saver.close()
+    reopened = PooledSqliteSaver(tmp_db, pool_size=2)
+    try:
+        assert reopened.get_tuple(config("durable")).checkpoint["channel_values"]["story"] == "once upon a time"
+    finally:
+        reopened.close()
+
+
+def test_a_failing_write_only_fails_its_own_caller(tmp_db):
+    with sqlite3.connect(tmp_db) as conn:
+        conn.execute("CREATE TABLE notes (id INTEGER PRIMARY KEY, text TEXT NOT NULL)")
+    committer = GroupCommitter(tmp_db, window=0.05)
+    errors = []
+
+    def write(statements):
+        try:
+            committer.submit(statements)
+        except sqlite3.Error as e:
+            errors.append(e)
+
+    good = [[("INSERT INTO notes (id, text) VALUES (?, ?)", (i, f"note {i}"), False)] for i in range(5)]
+    bad = [("INSERT INTO notes (id, text) VALUES (?, ?)", (99, None), False)]
+    threads = [threading.Thread(target=write, args=(statements,)) for statements in good + [bad]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    committer.close()
+
+    assert len(errors) == 1 and isinstance(errors[0], sqlite3.IntegrityError)
+    with sqlite3.connect(tmp_db) as conn:
+        ids = [row[0] for row in conn.execute("SELECT id FROM notes ORDER BY id")]
+    assert ids == [0, 1, 2, 3, 4]
+
@@ -0,0 +1,83 @@
+import sqlite3
+import time
+
+import pytest
+from langgraph.checkpoint.base.id import uuid6
+from langgraph.types import Command
+
+from checkpointer import PooledSqliteSaver
+from compaction import Compactor, checkpoint_time
+from graph_builder import create_graph
+
+
+class FakeIndex:
+    def __init__(self):
+        self.forgotten = []
+
+    def forget(self, session_ids):
+        self.forgotten.extend(session_ids)
+
+
+@pytest.fixture
+def graph(tmp_db, fake_llm):
+    saver = PooledSqliteSaver(tmp_db)
+    yield create_graph(saver)
+    saver.close()
+
+
+def config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def session(graph, thread_id: str, feedback=("shorter", "funnier", "done")):
+    graph.invoke({"prompt": f"a heron #{thread_id}", "story": "", "feedback": None, "revision_count": 0,
+                  "history": [], "session_id": thread_id, "messages": []}, config(thread_id))
+    for text in feedback:
+        graph.invoke(Command(resume=text), config(thread_id))
+
+
+def checkpoints(path: str) -> dict:
+    with sqlite3.connect(path) as conn:
+        return dict(conn.execute("SELECT thread_id, COUNT(*) FROM checkpoints GROUP BY thread_id").fetchall())
+
+
+def test_checkpoint_ids_carry_their_time():
+    assert abs(checkpoint_time(str(uuid6())) - time.time()) < 5
+
+
+def test_pruning_keeps_the_latest_checkpoints_and_the_state(graph, tmp_db):
+    session(graph, "done")
+    session(graph, "paused", feedback=("shorter",))
+    before = {t: graph.get_state(config(t)) for t in ("done", "paused")}
+    assert min(checkpoints(tmp_db).values()) > 3
+
+    result = Compactor(tmp_db, graph, keep_last=2, finished_ttl=None, abandoned_ttl=None).run()
+    assert result["checkpoints_removed"] > 0 and result["sessions_expired"] == 0
+    assert checkpoints(tmp_db) == {"done": 2, "paused": 2}
+    for thread_id, state in before.items():
+        after = graph.get_state(config(thread_id))
+        assert after.values == state.values and after.next == state.next
+
+    # The paused session still resumes from its interrupt
+    graph.invoke(Command(resume="done"), config("paused"))
+    assert graph.get_state(config("paused")).values["title"]
+
+
+def test_finished_sessions_expire_before_paused_ones(graph, tmp_db):
+    session(graph, "done")
+    session(graph, "paused", feedback=())
+    index = FakeIndex()
+    time.sleep(0.01)
+
+    result = Compactor(tmp_db, graph, finished_ttl=0.001, abandoned_ttl=None, session_index=index).run()
+    assert result["sessions_expired"] == 1
+    assert list(checkpoints(tmp_db)) == ["paused"]
+    assert index.forgotten == ["done"]
+    assert not graph.get_state(config("done")).values
+
+    result = Compactor(tmp_db, graph, finished_ttl=None, abandoned_ttl=0.001, session_index=index).run()
+    assert result["sessions_expired"] == 1 and checkpoints(tmp_db) == {}
+
+
+def test_an_empty_database_is_left_alone(tmp_db):
+    assert Compactor(tmp_db).run()["checkpoints_removed"] == 0
@@ -0,0 +1,85 @@
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+
+from context import count_tokens, fit, forget, remove_tool_turn, split, stub_tool_results
+
+
+def _conversation(turns: int, words: int = 40):
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"request {i} " + "word " * words, id=f"h{i}"))
+        messages.append(AIMessage(content=f"reply {i} " + "word " * words, id=f"a{i}"))
+    return messages
+
+
+def _tool_turn(i: int, result: str):
+    call = {"name": "lookup", "args": {"q": str(i)}, "id": f"call{i}"}
+    return [
+        HumanMessage(content=f"question {i}", id=f"q{i}"),
+        AIMessage(content="", tool_calls=[call], id=f"t{i}"),
+        ToolMessage(content=result, tool_call_id=f"call{i}", name="lookup", id=f"r{i}"),
+        AIMessage(content=f"answer {i}", id=f"ans{i}"),
+    ]
+
+
+def test_split_keeps_the_most_recent_whole_turns():
+    messages = _conversation(6)
+    per_turn = count_tokens(messages[:2])
+    older, recent = split(messages, per_turn * 2 + 1)
+    assert older + recent == messages
+    assert [m.id for m in recent] == ["h4", "a4", "h5", "a5"]
+    assert isinstance(recent[0], HumanMessage)
+
+
+def test_split_never_separates_tool_calls_from_their_results():
+    messages = _tool_turn(0, "x" * 40) + _tool_turn(1, "y" * 40)
+    # Enough for the last turn's answer and result, not for its question
+    older, recent = split(messages, count_tokens(messages[5:]))
+    assert recent == messages[4:]
+    assert older == messages[:4]
+
+
+def test_split_keeps_an_oversized_last_turn():
+    messages = _conversation(3, words=400)
+    older, recent = split(messages, 10)
+    assert [m.id for m in recent] == ["h2", "a2"]
+    assert len(older) == 4
+
+
+def test_fit_stays_within_the_budget():
+    system = SystemMessage(content="You are a storyteller.")
+    messages = _conversation(20)
+    budget = count_tokens([system]) + count_tokens(messages[:2]) * 3 + 40
+    prompt = fit("revise", system, messages, summary="The fox met a crow.", budget=budget)
+    assert prompt[0] is system
+    assert "The fox met a crow." in prompt[1].content
+    assert count_tokens(prompt) <= budget
+    assert prompt[-1] is messages[-1]
+    assert prompt[2].id.startswith("h")
+
+    # Small histories are sent whole
+    assert fit("revise", system, messages[:4], budget=10000) == [system] + messages[:4]
+
+
+def test_forget_removes_what_no_longer_fits():
+    messages = _conversation(5)
+    removals, older = forget("revise", messages, count_tokens(messages[:2]) * 2 + 1)
+    assert [m.id for m in older] == ["h0", "a0", "h1", "a1", "h2", "a2"]
+    assert all(isinstance(r, RemoveMessage) for r in removals)
+    assert [r.id for r in removals] == [m.id for m in older]
+    assert forget("revise", messages, 100000) == ([], [])
+
+
+def test_long_tool_results_are_stubbed():
+    messages = _tool_turn(0, "z" * 500) + _tool_turn(1, "short")
+    stubs = stub_tool_results("revise", messages, max_chars=100)
+    assert len(stubs) == 1
+    assert stubs[0].id == "r0"
+    assert stubs[0].tool_call_id == "call0"
+    assert "500 characters" in stubs[0].content
+
+
+def test_remove_tool_turn_drops_the_last_call_and_its_results():
+    messages = _tool_turn(0, "first") + _tool_turn(1, "second")
+    removals = remove_tool_turn("revise", messages)
+    assert [r.id for r in removals] == ["t1", "r1"]
+    assert remove_tool_turn("revise", _conversation(2)) == []
@@ -0,0 +1,29 @@
+from functools import reduce
+from operator import add
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from conftest import run
+from fake_llm import FakeStoryLLM
+
+
+def test_replies_stream_word_by_word_with_usage():
+    llm = FakeStoryLLM(latency=0.0)
+    messages = [SystemMessage(content="Write a moral."), HumanMessage(content="A story.")]
+    chunks = list(llm.stream(messages))
+    assert len([c for c in chunks if c.content]) > 1
+    message = reduce(add, chunks)
+    assert message.content == llm.invoke(messages).content
+    assert message.usage_metadata["output_tokens"] > 0
+
+
+def test_an_empty_reply_streams_an_empty_message():
+    llm = FakeStoryLLM(latency=0.0)
+    messages = [SystemMessage(content="Echo."), HumanMessage(content="")]
+
+    async def collect():
+        return [c async for c in llm.astream(messages)]
+
+    for chunks in (list(llm.stream(messages)), run(collect())):
+        message = reduce(add, chunks)
+        assert message.content == "" and message.usage_metadata["input_tokens"] > 0
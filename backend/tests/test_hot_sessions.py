@@ -0,0 +1,129 @@
+from types import SimpleNamespace
+
+from conftest import run
+from hot_sessions import HotSessions, HotState, follow
+
+
+class FakeGraph:
+    def __init__(self):
+        self.states = {}
+        self.reads = 0
+
+    async def aget_state(self, config):
+        self.reads += 1
+        values, next_ = self.states.get(config["configurable"]["thread_id"], ({}, ()))
+        return SimpleNamespace(values=values, next=next_)
+
+
+class FakeIndex:
+    def __init__(self):
+        self.versions = {}
+
+    async def aget(self, session_id):
+        version = self.versions.get(session_id)
+        return {"session_id": session_id, "version": version} if version is not None else None
+
+
+def cache(max_bytes: int = 1 << 20):
+    graph, index = FakeGraph(), FakeIndex()
+    return HotSessions(graph, index, max_bytes), graph, index
+
+
+def story(n: int) -> dict:
+    return {"story": f"draft {n} " * 40, "history": [], "revision_count": n}
+
+
+def test_hits_are_served_from_memory():
+    hot, graph, index = cache()
+    graph.states["s1"] = (story(1), ("human_feedback",))
+    index.versions["s1"] = 1
+
+    async def scenario():
+        first = await hot.get("s1")
+        second = await hot.get("s1")
+        return first, second
+
+    first, second = run(scenario())
+    assert first is second
+    assert first.next == ("human_feedback",)
+    assert graph.reads == 1
+    stats = hot.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
+
+
+def test_a_newer_index_version_reloads_the_state():
+    hot, graph, index = cache()
+    graph.states["s1"] = (story(1), ())
+    index.versions["s1"] = 1
+    hot.put("s1", HotState(story(1)), 1)
+
+    # Another worker revised the session
+    graph.states["s1"] = (story(2), ())
+    index.versions["s1"] = 2
+    state = run(hot.get("s1"))
+    assert state.values["revision_count"] == 2
+    assert hot.stats()["stale"] == 1
+    assert run(hot.get("s1")) is state
+
+
+def test_a_run_is_cached_under_the_version_it_wrote():
+    hot, graph, index = cache()
+    graph.states["s1"] = (story(2), ())
+    # Written after the run's own version 3
+    index.versions["s1"] = 4
+    hot.put("s1", HotState(story(1)), 3)
+    assert run(hot.get("s1")).values["revision_count"] == 2
+    assert graph.reads == 1
+
+
+def test_least_recently_used_sessions_are_evicted_under_the_ceiling():
+    sizes = HotSessions(FakeGraph(), FakeIndex())
+    sizes.put("probe", HotState(story(1)), 1)
+    one = sizes.resident
+    hot, graph, index = cache(max_bytes=int(one * 2.5))
+    for i in range(3):
+        index.versions[f"s{i}"] = 1
+        graph.states[f"s{i}"] = (story(1), ())
+    hot.put("s0", HotState(story(1)), 1)
+    hot.put("s1", HotState(story(1)), 1)
+    run(hot.get("s0"))
+    hot.put("s2", HotState(story(1)), 1)
+
+    assert hot.resident <= hot.max_bytes
+    assert set(hot._states) == {"s0", "s2"}
+    assert hot.stats()["evictions"] == 1
+    run(hot.get("s1"))
+    assert graph.reads == 1
+
+
+def test_states_larger_than_the_ceiling_are_not_kept():
+    hot, _, _ = cache(max_bytes=100)
+    hot.put("s1", HotState(story(1)), 1)
+    assert len(hot) == 0 and hot.resident == 0
+    assert hot.stats()["too_large"] == 1
+
+
+def test_unknown_or_deleted_sessions_are_not_cached():
+    hot, graph, index = cache()
+    assert run(hot.get("missing")).values == {}
+    index.versions["s1"] = 1
+    graph.states["s1"] = (story(1), ())
+    run(hot.get("s1"))
+    del index.versions["s1"]
+    del graph.states["s1"]
+    assert run(hot.get("s1")).values == {}
+    assert len(hot) == 0
+
+
+def test_follow_builds_the_final_state_from_a_stream():
+    state = None
+    for mode, chunk in [
+        ("values", {"story": "a", "revision_count": 0}),
+        ("tasks", {"name": "revise_story", "interrupts": []}),
+        ("values", {"story": "b", "revision_count": 1}),
+        ("tasks", {"name": "human_feedback", "interrupts": [{"value": "?"}]}),
+        ("values", {"story": "b", "revision_count": 1, "__interrupt__": ()}),
+    ]:
+        state = follow(state, mode, chunk)
+    assert state.values == {"story": "b", "revision_count": 1}
+    assert state.next == ("human_feedback",)
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import jobs
+from conftest import run
+from jobs import JobQueue, WebhookRejected, _allowed, check_webhook
+from urllib.parse import urlsplit
+
+PUBLIC = "93.184.215.14"
+
+
+@pytest.fixture
+def resolve(monkeypatch):
+    """Names resolve to whatever the test puts here, offline."""
+    names = {}
+
+    async def fake(host, port):
+        return list(names.get(host, [host]))
+
+    monkeypatch.setattr(jobs, "_resolve", fake)
+    return names
+
+
+def allowed(url, entries):
+    parts = urlsplit(url)
+    return _allowed(parts, parts.hostname, entries)
+
+
+def test_allowlist_prefixes_match_whole_hosts_and_path_segments():
+    entries = ["https://hooks.example.com/hooks/"]
+    assert allowed("https://hooks.example.com/hooks/job", entries)
+    assert allowed("https://hooks.example.com:443/hooks", entries)
+    assert not allowed("https://hooks.example.com.evil.net/hooks/job", entries)
+    assert not allowed("https://hooks.example.com/hooks-evil/job", entries)
+    assert not allowed("https://hooks.example.com:8443/hooks/job", entries)
+    assert not allowed("https://hooks.example.com@evil.net/hooks/job", entries)
+    assert allowed("https://hooks.example.com.evil.net/", ["https://hooks.example.com.evil.net"])
+    assert not allowed("https://hooks.example.com.evil.net/", ["https://hooks.example.com"])
+
+
+def test_allowlist_hosts_and_domains():
+    assert allowed("https://HOOKS.example.com/x", ["hooks.example.com"])
+    assert allowed("https://a.b.example.com/x", ["*.example.com"])
+    assert not allowed("https://example.com.evil.net/x", ["*.example.com"])
+    assert not allowed("https://notexample.com/x", ["*.example.com"])
+    assert not allowed("https://hooks.example.com/x", [])
+
+
+@pytest.mark.parametrize("url, address, reason", [
+    ("http://hooks.example.com/x", PUBLIC, "https"),
+    ("https://user:pw@hooks.example.com/x", PUBLIC, "credentials"),
+    ("https://other.example.org/x", PUBLIC, "not allowed"),
+    ("https://hooks.example.com/x", "127.0.0.1", "non-public"),
+    ("https://hooks.example.com/x", "169.254.169.254", "non-public"),
+    ("https://hooks.example.com/x", "10.0.0.7", "non-public"),
+    ("https://hooks.example.com/x", "::ffff:192.168.1.1", "non-public"),
+    ("https://hooks.example.com/x", "fe80::1%eth0", "non-public"),
+])
+def test_webhooks_outside_the_public_allowlist_are_rejected(resolve, url, address, reason):
+    resolve["hooks.example.com"] = [PUBLIC, address]
+    with pytest.raises(WebhookRejected, match=reason):
+        run(check_webhook(url, ["hooks.example.com"]))
+
+
+def test_an_allowed_public_webhook_returns_the_checked_address(resolve):
+    resolve["hooks.example.com"] = [PUBLIC]
+    assert run(check_webhook("https://hooks.example.com/x", ["hooks.example.com"])) == PUBLIC
+
+
+def test_delivery_connects_to_the_checked_address(resolve, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_WEBHOOK_ALLOWED", ["hooks.example.com"])
+    resolve["hooks.example.com"] = [PUBLIC]
+    sent = []
+
+    def receive(request: httpx.Request):
+        sent.append(request)
+        # Rebinds the name to loopback once it has been checked
+        resolve["hooks.example.com"] = ["127.0.0.1"]
+        return httpx.Response(200)
+
+    async def scenario():
+        queue = JobQueue(concurrency=1)
+        queue._http = httpx.AsyncClient(transport=httpx.MockTransport(receive))
+        queue.start()
+
+        async def finish():
+            return {"story": "ok"}
+
+        job = queue.submit("start", "s1", finish, webhook_url="https://hooks.example.com:8443/x?y=1")
+        await queue.wait(job, 5)
+        await asyncio.gather(*queue._deliveries)
+        second = queue.submit("feedback", "s1", finish, webhook_url="https://hooks.example.com:8443/x?y=1")
+        await queue.wait(second, 5)
+        await asyncio.gather(*queue._deliveries)
+        await queue.close()
+        return job
+
+    job = run(scenario())
+    [request] = sent
+    assert str(request.url) == f"https://{PUBLIC}:8443/x?y=1"
+    assert request.headers["Host"] == "hooks.example.com:8443"
+    assert request.extensions["sni_hostname"] == "hooks.example.com"
+    assert json.loads(request.content)["job_id"] == job.job_id
@@ -0,0 +1,70 @@
+import time
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from conftest import run
+from fake_llm import FakeStoryLLM
+from llm_cache import MemoryLRUCache, ResponseCache, SqliteResponseCache, cache_key
+
+MESSAGES = [SystemMessage(content="Write a title."), HumanMessage(content="A heron counts stars.")]
+
+
+def cached_model(cache):
+    return FakeStoryLLM(latency=0.0).model_copy(update={"cache": cache})
+
+
+def test_keys_depend_on_the_prompt_and_the_model():
+    assert cache_key("p", "m") == cache_key("p", "m")
+    assert len({cache_key("p", "m"), cache_key("p", "m2"), cache_key("p2", "m")}) == 3
+
+
+def test_memory_tier_evicts_the_least_recently_used():
+    memory = MemoryLRUCache(max_entries=2)
+    memory.set("a", 1)
+    memory.set("b", 2)
+    memory.get("a")
+    memory.set("c", 3)
+    assert (memory.get("a"), memory.get("b"), memory.get("c")) == (1, None, 3)
+    assert memory.evictions == 1
+
+
+def test_entries_expire_after_the_ttl(tmp_db):
+    memory = MemoryLRUCache(ttl=0.05)
+    sqlite = SqliteResponseCache(tmp_db, ttl=0.05)
+    memory.set("a", 1)
+    sqlite.set("a", "1")
+    assert memory.get("a") == 1 and sqlite.get("a") == "1"
+    time.sleep(0.1)
+    assert memory.get("a") is None and sqlite.get("a") is None
+    assert len(memory) == 0 and len(sqlite) == 0
+
+
+def test_sqlite_tier_keeps_the_recently_read_rows(tmp_db):
+    sqlite = SqliteResponseCache(tmp_db, max_rows=2)
+    for key in ("a", "b", "c"):
+        sqlite.set(key, key)
+        time.sleep(0.01)
+    sqlite.get("a")
+    assert sqlite.evict() == 1
+    assert (sqlite.get("a"), sqlite.get("b"), sqlite.get("c")) == ("a", None, "c")
+
+
+def test_repeat_calls_are_answered_from_the_cache(tmp_db):
+    cache = ResponseCache(MemoryLRUCache(), SqliteResponseCache(tmp_db))
+    model = cached_model(cache)
+    first = model.invoke(MESSAGES)
+    assert model.invoke(MESSAGES).content == first.content
+    assert run(model.ainvoke(MESSAGES)).content == first.content
+    model.invoke([MESSAGES[0], HumanMessage(content="Another story.")])
+    assert cache.hits == {"memory": 2, "sqlite": 0} and cache.misses == 2
+
+
+def test_the_sqlite_tier_survives_a_restart(tmp_db):
+    first = cached_model(ResponseCache(MemoryLRUCache(), SqliteResponseCache(tmp_db))).invoke(MESSAGES)
+    # A new process: empty memory, same database
+    cache = ResponseCache(MemoryLRUCache(), SqliteResponseCache(tmp_db))
+    model = cached_model(cache)
+    assert run(model.ainvoke(MESSAGES)).content == first.content
+    assert model.invoke(MESSAGES).content == first.content
+    assert cache.hits == {"memory": 1, "sqlite": 1} and cache.misses == 0
+    assert cache.stats()["hit_ratio"] == 1.0
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from conftest import run
+from model_router import ModelRouter, parse_routes
+
+
+class Boom(Exception):
+    pass
+
+
+def fails(x):
+    raise Boom("quota")
+
+
+def answers(name: str, delay: float = 0.0, calls=None):
+    async def call(x):
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            if calls is not None:
+                calls.append(f"{name} cancelled")
+            raise
+        return name
+    return RunnableLambda(lambda x: name, afunc=call)
+
+
+def routed(node_models: dict, hedged=(), hedge_delay: float = 0.05):
+    routes = {"node": tuple(node_models)}
+    router = ModelRouter(routes=routes, hedge_nodes=set(hedged), hedge_delay=hedge_delay)
+    return router, router.runnable("node", lambda model, fallback: node_models[model])
+
+
+def test_parse_routes():
+    assert parse_routes("a,b=small>big;c=big") == {"a": ("small", "big"), "b": ("small", "big"), "c": ("big",)}
+    assert ModelRouter(routes={}).chain("anything")
+
+
+def test_falls_back_to_the_next_model():
+    router, model = routed({"small": RunnableLambda(fails), "big": answers("big")})
+    assert model.invoke("x") == "big"
+    assert run(model.ainvoke("x")) == "big"
+    stats = router.stats()["nodes"]["node"]["models"]
+    assert stats["small"]["fallbacks"] == 2 and stats["small"]["errors"] == 2
+    assert stats["big"]["calls"] == 2
+
+
+def test_last_model_error_is_raised():
+    _, model = routed({"small": RunnableLambda(fails), "big": RunnableLambda(fails)})
+    with pytest.raises(Boom):
+        model.invoke("x")
+
+
+def test_hedge_answers_from_the_faster_model_and_cancels_the_other():
+    calls = []
+    router, model = routed({"slow": answers("slow", 5, calls), "fast": answers("fast", 0.01, calls)}, hedged={"node"})
+
+    async def scenario():
+        result = await model.ainvoke("x")
+        await asyncio.sleep(0)
+        return result
+
+    assert run(scenario()) == "fast"
+    assert calls == ["slow cancelled"]
+    stats = router.stats()["nodes"]["node"]["models"]
+    assert stats["slow"]["hedges"] == 1 and stats["slow"]["cancelled"] == 1
+    assert stats["fast"]["hedge_wins"] == 1
+
+
+def test_no_hedge_when_the_first_model_is_quick():
+    calls = []
+    router, model = routed({"quick": answers("quick", 0.0, calls), "other": answers("other", 0.0, calls)}, hedged={"node"})
+    assert run(model.ainvoke("x")) == "quick"
+    assert "other" not in router.stats()["nodes"]["node"]["models"]
+
+
+def test_cancelling_the_caller_during_the_hedge_delay_cancels_the_call():
+    calls = []
+    _, model = routed({"slow": answers("slow", 5, calls), "fast": answers("fast", 0, calls)}, hedged={"node"},
+                      hedge_delay=1.0)
+
+    async def scenario():
+        task = asyncio.create_task(model.ainvoke("x"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+
+    run(scenario())
+    assert calls == ["slow cancelled"]
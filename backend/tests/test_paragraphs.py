@@ -0,0 +1,75 @@
+import pytest
+
+import paragraphs
+
+STORY = "The fox woke early.\n\nShe crossed the river.\n\n\nShe met a crow.\n\nThey became friends."
+
+
+def test_split_and_splice_keep_the_separators():
+    parts = paragraphs.split(STORY)
+    assert paragraphs.paragraphs(parts) == ["The fox woke early.", "She crossed the river.", "She met a crow.", "They became friends."]
+    assert "".join(parts) == STORY
+    revised = paragraphs.splice(parts, {1: "  She swam the river.\n", 3: "They parted ways."})
+    assert revised == "The fox woke early.\n\nShe swam the river.\n\n\nShe met a crow.\n\nThey parted ways."
+
+
+@pytest.mark.parametrize(
+    "feedback, expected",
+    [
+        ("Change the ending so it is happier", [3]),
+        ("make the second paragraph scarier", [1]),
+        ("Paragraphs 1 and 3 need more detail", [0, 2]),
+        ("a better opening and a darker last paragraph", [0, 3]),
+        ("Make the whole thing funnier", [0, 1, 2, 3]),
+        ("paragraph 9 is too long", None),
+        ("add a dragon", None),
+    ],
+)
+def test_locate(feedback, expected):
+    assert paragraphs.locate(feedback, 4) == expected
+
+
+def test_parse_located():
+    assert paragraphs.parse_located("2, 4", 4) == [1, 3]
+    assert paragraphs.parse_located("Paragraphs 3 and 7", 4) == [2]
+    assert paragraphs.parse_located("ALL of them", 3) == [0, 1, 2]
+    assert paragraphs.parse_located("none", 3) == []
+
+
+def test_numbered():
+    assert paragraphs.numbered(paragraphs.split("One.\n\nTwo.")) == "[1] One.\n\n[2] Two."
+
+
+def _state(feedback: str):
+    return {"prompt": "a fox", "story": STORY, "feedback": feedback, "revision_count": 0, "history": [], "messages": []}
+
+
+def test_incremental_revision_rewrites_only_the_located_paragraphs(fake_llm, monkeypatch):
+    import graph_nodes
+
+    monkeypatch.setattr(graph_nodes, "REVISION_MODE", "incremental")
+    update = graph_nodes.revise_story(_state("make the second paragraph scarier"))
+    assert update["changed_paragraphs"] == [1]
+    assert update["revision_count"] == 1
+    revised = paragraphs.paragraphs(paragraphs.split(update["story"]))
+    assert revised[1] == "She crossed the river. (make the second paragraph scarier)"
+    assert revised[0::2] == ["The fox woke early.", "She met a crow."]
+    assert revised[3] == "They became friends."
+    assert "(paragraphs 2)" in update["history"][0]
+
+    # The wording does not say: the model locates the paragraph (the last)
+    update = graph_nodes.revise_story(_state("add a dragon"))
+    assert update["changed_paragraphs"] == [3]
+
+
+def test_broad_feedback_falls_back_to_a_full_revision(fake_llm, monkeypatch):
+    import graph_nodes
+
+    monkeypatch.setattr(graph_nodes, "REVISION_MODE", "incremental")
+    update = graph_nodes.revise_story(_state("Make the whole thing funnier"))
+    assert update["changed_paragraphs"] is None
+
+    monkeypatch.setattr(graph_nodes, "REVISION_MODE", "full")
+    update = graph_nodes.revise_story(_state("make the second paragraph scarier"))
+    assert update["changed_paragraphs"] is None
+    assert update["history"] == ["Revision 1 applied."]
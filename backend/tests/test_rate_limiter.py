@@ -0,0 +1,131 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from config import LLM_MODEL
+from conftest import run
+from rate_limiter import RateLimiter, _Backoff, is_retryable, limiter, limiter_for, status_of
+
+
+def test_non_blocking_acquire_fails_once_the_bucket_is_empty():
+    # One request of burst, refilled at 19 per second
+    limits = RateLimiter(rpm=0, tpm=0)
+    limits.configure(rpm=20, tpm=0, burst_seconds=0.05, period=1.0)
+    assert limits.acquire(blocking=False)
+    assert not limits.acquire(blocking=False)
+    time.sleep(0.1)
+    assert limits.acquire(blocking=False)
+
+
+def test_callers_wait_only_for_the_refill():
+    limits = RateLimiter(rpm=0, tpm=0)
+    # Four requests of burst, refilled at 32 per second
+    limits.configure(rpm=20, tpm=0, burst_seconds=0.1, period=0.5)
+    start = time.perf_counter()
+    for _ in range(4):
+        limits.acquire()
+    assert time.perf_counter() - start < 0.05
+    for _ in range(4):
+        limits.acquire()
+    assert 0.08 < time.perf_counter() - start < 0.5
+
+
+def test_urgent_callers_are_served_first():
+    limits = RateLimiter(rpm=0, tpm=0)
+    limits.configure(rpm=20, tpm=0, burst_seconds=0.05, period=1.0)
+    order = []
+
+    async def call(priority: str):
+        await limits.aacquire(priority)
+        order.append(priority)
+
+    async def scenario():
+        while limits.acquire(blocking=False):
+            pass
+        # The speculative call queues first, the user's revision still wins
+        speculative = asyncio.create_task(call("speculative"))
+        await asyncio.sleep(0)
+        await asyncio.gather(call("interactive"), speculative)
+
+    run(scenario())
+    assert order == ["interactive", "speculative"]
+
+
+def test_settle_charges_the_real_usage():
+    limits = RateLimiter(rpm=0, tpm=0)
+    # A slow refill, so the levels below do not move while the test runs
+    limits.configure(rpm=0, tpm=6000, burst_seconds=600, tokens_per_call=100, period=3600)
+    assert limits.stats()["tokens_available"] == 1000
+    limits.acquire()
+    assert limits.stats()["tokens_available"] == 900
+    limits.settle(300)
+    assert limits.stats()["tokens_available"] == 700
+    assert limits.stats()["tokens_per_call"] == 140
+
+    # A failed call gives its reservation back
+    limits.acquire()
+    limits.settle(None)
+    assert limits.stats()["tokens_available"] == 700
+
+
+def test_pause_holds_every_caller_back():
+    limits = RateLimiter(rpm=600, tpm=0, burst_seconds=1)
+    limits.pause(0.2)
+    assert not limits.acquire(blocking=False)
+    assert limits.stats()["paused_for"] > 0
+    time.sleep(0.25)
+    assert limits.acquire(blocking=False)
+
+
+def test_backoff_follows_retry_after_and_pauses_on_429():
+    limits = RateLimiter(rpm=600, tpm=0, burst_seconds=1)
+    backoff = _Backoff(limits, initial=0.01, maximum=0.05)
+    error = Exception("429 RESOURCE_EXHAUSTED. Please retry in 1.5s.")
+    state = SimpleNamespace(outcome=SimpleNamespace(exception=lambda: error), attempt_number=1)
+    assert backoff(state) == 1.5
+    assert limits.stats()["paused_for"] > 1.0
+
+    error = Exception("503 UNAVAILABLE")
+    limits = RateLimiter(rpm=600, tpm=0, burst_seconds=1)
+    assert 0 <= _Backoff(limits, initial=0.01, maximum=0.05)(state) <= 0.01
+    assert limits.stats()["paused_for"] == 0
+
+
+def test_status_of_looks_through_wrapped_errors():
+    class ApiError(Exception):
+        code = 503
+
+    assert status_of(ApiError("down")) == 503
+    assert status_of(Exception("RESOURCE_EXHAUSTED: quota")) == 429
+    try:
+        try:
+            raise ApiError("down")
+        except ApiError as e:
+            raise RuntimeError("call failed") from e
+    except RuntimeError as wrapped:
+        assert status_of(wrapped) == 503
+    assert status_of(ValueError("bad prompt")) is None
+
+
+@pytest.mark.parametrize(
+    "error, retryable",
+    [
+        (asyncio.TimeoutError(), True),
+        (ConnectionError(), True),
+        (Exception("429 Too Many Requests"), True),
+        (Exception("400 INVALID_ARGUMENT"), False),
+        (ValueError("bad prompt"), False),
+    ],
+)
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+def test_each_model_has_its_own_budget():
+    assert limiter_for(None) is limiter
+    assert limiter_for(LLM_MODEL) is limiter
+    other = limiter_for("gemini-test-lite")
+    assert other is not limiter
+    assert limiter_for("gemini-test-lite") is other
@@ -0,0 +1,76 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from fake_llm import STORY_ENDING, STORY_PARAGRAPHS
+from revision_store import DeltaSerializer, StoryRevisions
+
+STORY = "\n\n".join(STORY_PARAGRAPHS + [STORY_ENDING])
+
+
+def revisions(n: int):
+    """A draft and n revisions, each rewording one paragraph of the last."""
+    drafts = [STORY]
+    for i in range(n):
+        paragraphs = drafts[-1].split("\n\n")
+        paragraphs[i % len(paragraphs)] += f" Revision {i} added this sentence."
+        drafts.append("\n\n".join(paragraphs))
+    return drafts
+
+
+def test_revisions_are_stored_as_a_delta_chain():
+    drafts = revisions(5)
+    store = StoryRevisions()
+    indexes = [store.add(draft) for draft in drafts]
+    assert isinstance(store.entries[0], str)
+    for i in indexes[1:]:
+        base, ops = store.entries[i]
+        assert base == i - 1
+        # Copies of the previous draft plus the inserted words, not the text again
+        assert sum(len(op) for op in ops if isinstance(op, str)) < len(drafts[i]) // 4
+    # Rebuilt from the stored entries alone, last first
+    loaded = StoryRevisions(store.entries)
+    assert [loaded.text(i) for i in reversed(indexes)] == list(reversed(drafts))
+
+
+def test_repeats_share_an_entry_and_unrelated_texts_are_stored_whole():
+    store = StoryRevisions()
+    first = store.add(STORY)
+    assert store.add(STORY) == first
+    other = store.add("A completely different tale about a kettle. " * 10)
+    assert isinstance(store.entries[other], str)
+
+
+def test_serializer_round_trip():
+    drafts = revisions(3)
+    state = {
+        "prompt": "a brave cat",
+        "story": drafts[-1],
+        "history": [f"Draft {i}" for i in range(len(drafts))],
+        "revision_count": 3,
+        "feedback": None,
+        "messages": [
+            HumanMessage(content="a brave cat"),
+            *[AIMessage(content=draft) for draft in drafts],
+            AIMessage(content="", tool_calls=[{"name": "fix_grammar_locally", "args": {"text": drafts[-1]}, "id": "call-1"}]),
+            ToolMessage(content=drafts[-1], tool_call_id="call-1"),
+        ],
+        # Short, but looks like a placeholder: must not be mistaken for one
+        "note": "\x00rev:0\x00",
+    }
+    serde = DeltaSerializer(min_length=64)
+    type_, blob = serde.dumps_typed(state)
+    assert type_.startswith(DeltaSerializer.PREFIX)
+    loaded = serde.loads_typed((type_, blob))
+    assert loaded == state
+    assert loaded["messages"][-2].tool_calls[0]["args"]["text"] == drafts[-1]
+    # Smaller than the same state without delta encoding
+    assert len(blob) < len(JsonPlusSerializer().dumps_typed(state)[1])
+
+
+def test_serializer_loads_plain_blobs_and_leaves_short_states_alone():
+    serde = DeltaSerializer(min_length=64)
+    plain = JsonPlusSerializer().dumps_typed({"story": STORY})
+    assert serde.loads_typed(plain) == {"story": STORY}
+    type_, blob = serde.dumps_typed({"story": "short"})
+    assert not type_.startswith(DeltaSerializer.PREFIX)
+    assert serde.loads_typed((type_, blob)) == {"story": "short"}
@@ -0,0 +1,79 @@
+import time
+
+from semantic_cache import HashingVectorizer, SemanticCache
+
+
+def test_rewordings_hit_and_other_prompts_miss():
+    cache = SemanticCache(None, threshold=0.8)
+    cache.add("a story about a brave cat", "The cat was brave.", generation_seconds=2.0)
+    prompt, story, score = cache.lookup("Write me a story about brave cats")
+    assert (prompt, story) == ("a story about a brave cat", "The cat was brave.")
+    assert score > 0.99
+    assert cache.lookup("a dragon guarding a lighthouse") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["saved_seconds"] == 2.0
+
+
+def test_the_closest_prompt_wins():
+    cache = SemanticCache(None, threshold=0.5)
+    cache.add("a brave cat climbs a mountain", "cat")
+    cache.add("a brave dog swims across the sea", "dog")
+    assert cache.lookup("the brave dog swam across the sea")[1] == "dog"
+
+
+def test_vectors_are_normalized():
+    vector = HashingVectorizer().embed("a curious fox in the snowy woods")
+    assert abs(sum(v * v for v in vector.values()) - 1.0) < 1e-9
+    # Nothing but stopwords
+    assert HashingVectorizer().embed("please write a story") == {}
+
+
+def test_entries_survive_a_restart(tmp_db):
+    cache = SemanticCache(tmp_db)
+    cache.add("a lonely robot", "Beep.")
+    cache.add("empty drafts are not cached", "")
+    cache.close()
+
+    reopened = SemanticCache(tmp_db)
+    assert len(reopened) == 1
+    assert reopened.lookup("the lonely robots")[1] == "Beep."
+    reopened.clear()
+    reopened.close()
+    assert len(SemanticCache(tmp_db)) == 0
+
+
+def test_least_recently_used_prompts_are_evicted(tmp_db):
+    cache = SemanticCache(tmp_db, max_entries=2)
+    cache.add("a brave cat", "cat")
+    cache.add("a clever fox", "fox")
+    assert cache.lookup("brave cats") is not None
+    cache.add("a wise owl", "owl")
+    assert cache.lookup("clever foxes") is None
+    assert cache.stats()["evictions"] == 1
+    cache.close()
+    assert len(SemanticCache(tmp_db, max_entries=2)) == 2
+
+
+def test_expired_entries_are_not_served():
+    cache = SemanticCache(None, ttl=0.05)
+    cache.add("a brave cat", "cat")
+    time.sleep(0.1)
+    assert cache.lookup("a brave cat") is None
+    assert len(cache) == 0
+
+
+def test_generate_story_serves_a_similar_prompts_draft(fake_llm, monkeypatch):
+    import graph_nodes
+
+    cache = SemanticCache(None)
+    monkeypatch.setattr(graph_nodes, "semantic_cache", cache)
+    monkeypatch.setattr(graph_nodes, "SEMANTIC_CACHE_MODE", "serve")
+    first = graph_nodes.generate_story({"prompt": "a brave cat"})
+    assert len(cache) == 1
+    second = graph_nodes.generate_story({"prompt": "write me a story about brave cats"})
+    assert second["story"] == first["story"]
+    assert "reused from a similar prompt" in second["history"][0]
+    # Served as is: no model call, so no usage
+    assert second["messages"][0].usage_metadata is None
+    assert first["messages"][0].usage_metadata is not None
@@ -0,0 +1,79 @@
+from starlette.requests import Request
+from starlette.responses import Response
+
+from conftest import run
+from session_index import SessionIndex, etag, story_hash
+
+
+def _request(if_none_match: str = None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_version_is_bumped_only_on_change(tmp_db):
+    index = SessionIndex(tmp_db)
+    first = index.update("s1", status="running")
+    assert first["version"] == 1
+    assert index.update("s1", status="running")["version"] == 1
+    assert index.update("s1", status="running", force=True)["version"] == 2
+    assert index.update("s1", revision_count=1)["version"] == 3
+    index.close()
+
+
+def test_observe_and_finish(tmp_db):
+    index = SessionIndex(tmp_db)
+    index.observe("s1", {"generate_story": {"story": "Once upon a time", "title": "The Fox"}})
+    index.observe("s1", {"__interrupt__": ()})
+    summary = index.get("s1")
+    assert summary["status"] == "awaiting_feedback"
+    assert summary["title"] == "The Fox"
+    assert summary["story_hash"] == story_hash("Once upon a time")
+
+    before = summary["version"]
+    # Always a new version, even when the status was already set
+    assert index.finish("s1", paused=True)["version"] == before + 1
+    assert index.finish("s1", paused=False)["status"] == "completed"
+    index.close()
+
+
+def test_versions_are_shared_through_the_store(tmp_db):
+    # Two workers without a memory cache never hand out the same ETag
+    a = SessionIndex(tmp_db, max_cached=0)
+    b = SessionIndex(tmp_db, max_cached=0)
+    a.update("s1", status="running")
+    tag = etag(b.get("s1"))
+    b.update("s1", force=True, status="running")
+    assert etag(a.get("s1")) != tag
+    assert a.get("s1")["version"] == 2
+    a.forget(["s1"])
+    assert b.get("s1") is None
+    a.close()
+    b.close()
+
+
+def test_etag_carries_version_and_story_hash():
+    assert etag({"version": 3, "story_hash": None}) == '"3-0"'
+    assert etag({"version": 3, "story_hash": "abc"}) == '"3-abc"'
+
+
+def test_unchanged_session_is_a_304(fake_llm):
+    import app
+
+    async def scenario():
+        async with app.lifespan(app.app):
+            started = await app.start_story(app.StoryRequest(prompt="a lighthouse keeper"))
+            fresh = Response()
+            summary = await app.get_session_summary(started.session_id, _request(), fresh)
+            tag = fresh.headers["ETag"]
+            cached = await app.get_session_summary(started.session_id, _request(f"W/{tag}"), Response())
+            full = await app.get_session(started.session_id, _request(tag), Response())
+            await app.provide_feedback(app.FeedbackRequest(session_id=started.session_id, feedback="add a storm"))
+            stale = await app.get_session_summary(started.session_id, _request(tag), Response())
+            return summary, tag, cached, full, stale
+
+    summary, tag, cached, full, stale = run(scenario())
+    assert summary["status"] == "awaiting_feedback"
+    assert tag == etag(summary)
+    assert cached.status_code == 304
+    assert full.status_code == 304
+    assert stale["revision_count"] == 1
@@ -0,0 +1,208 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from conftest import run
+from session_locks import RedisSessionLocks, SessionBusy, SessionLocks
+
+
+def test_hold_serializes_runs_of_a_session(tmp_db):
+    locks = SessionLocks(tmp_db, wait_seconds=5)
+    order = []
+
+    async def work(name: str):
+        async with locks.hold("s1"):
+            order.append(f"{name} in")
+            await asyncio.sleep(0.05)
+            order.append(f"{name} out")
+
+    async def scenario():
+        await asyncio.gather(work("a"), work("b"))
+
+    run(scenario())
+    locks.close()
+    assert order in (["a in", "a out", "b in", "b out"], ["b in", "b out", "a in", "a out"])
+
+
+def test_hold_times_out_with_session_busy(tmp_db):
+    locks = SessionLocks(tmp_db, wait_seconds=0.1)
+
+    async def scenario():
+        async with locks.hold("s1"):
+            with pytest.raises(SessionBusy):
+                async with locks.hold("s1"):
+                    pass
+            # Other sessions are not affected
+            async with locks.hold("s2"):
+                pass
+
+    run(scenario())
+    assert locks.stats()["sessions_locked"] == 0
+    locks.close()
+
+
+def test_leases_keep_other_workers_out(tmp_db):
+    a = SessionLocks(tmp_db, shared=True, lease_seconds=0.6, wait_seconds=0.1)
+    b = SessionLocks(tmp_db, shared=True, lease_seconds=0.6, wait_seconds=0.1)
+
+    async def scenario():
+        async with a.hold("s1"):
+            # Past the lease's first expiry: renewal keeps it
+            await asyncio.sleep(0.9)
+            with pytest.raises(SessionBusy):
+                async with b.hold("s1"):
+                    pass
+        async with b.hold("s1"):
+            pass
+
+    run(scenario())
+    a.close()
+    b.close()
+
+
+def test_busy_session_is_a_409(fake_llm, tmp_db):
+    import app
+
+    async def scenario():
+        async with app.lifespan(app.app):
+            app.session_locks = SessionLocks(tmp_db, wait_seconds=0.1)
+            async with app.session_locks.hold("busy"):
+                with pytest.raises(HTTPException) as raised:
+                    async with app._session_lock("busy"):
+                        pass
+            return raised.value
+
+    error = run(scenario())
+    assert error.status_code == 409
+
+
+def test_recall_checks_the_fingerprint(tmp_db):
+    locks = SessionLocks(tmp_db)
+    locks.remember("key", "fp-1", {"story": "x"})
+    assert locks.recall("key", "fp-1") == {"story": "x"}
+    assert locks.recall("other", "fp-1") is None
+    with pytest.raises(ValueError):
+        locks.recall("key", "fp-2")
+    locks.close()
+
+
+def test_duplicate_feedback_is_replayed(fake_llm):
+    import app
+
+    async def scenario():
+        async with app.lifespan(app.app):
+            started = await app.start_story(app.StoryRequest(prompt="a clockwork bird"))
+            request = app.FeedbackRequest(session_id=started.session_id, feedback="make it funnier")
+            # A double click: both arrive before either has finished
+            first, second = await asyncio.gather(app.provide_feedback(request), app.provide_feedback(request))
+            keyed = app.FeedbackRequest(session_id=started.session_id, feedback="shorter")
+            third = await app.provide_feedback(keyed, "retry-1")
+            replay = await app.provide_feedback(keyed, "retry-1")
+            with pytest.raises(HTTPException) as mismatch:
+                await app.provide_feedback(app.FeedbackRequest(session_id=started.session_id, feedback="longer"), "retry-1")
+            state = await app.graph.aget_state({"configurable": {"thread_id": started.session_id}})
+            return first, second, third, replay, mismatch.value, state.values["revision_count"]
+
+    first, second, third, replay, mismatch, revisions = run(scenario())
+    assert first == second
+    assert first.revision_count == 1
+    assert third.revision_count == 2 and replay == third
+    assert mismatch.status_code == 422
+    assert revisions == 2
+
+
+def test_a_run_that_loses_its_lease_is_cancelled(tmp_db):
+    a = SessionLocks(tmp_db, shared=True, lease_seconds=0.3, wait_seconds=0.1)
+    b = SessionLocks(tmp_db, shared=True, lease_seconds=0.3, wait_seconds=1.0)
+    steps = []
+
+    async def run_on_a():
+        async with a.hold("s1"):
+            steps.append("started")
+            # Another worker takes the session over
+            a._conn.execute("UPDATE session_leases SET owner = 'other', expires_at = 0")
+            a._conn.commit()
+            await asyncio.sleep(5)
+            steps.append("finished")
+
+    async def scenario():
+        with pytest.raises(SessionBusy, match="lost"):
+            await asyncio.wait_for(run_on_a(), 2)
+        assert not asyncio.current_task().cancelling()
+        async with b.hold("s1"):
+            pass
+
+    run(scenario())
+    assert steps == ["started"]
+    a.close()
+    b.close()
+
+
+def test_a_failing_store_keeps_the_lease_until_it_expires(tmp_db, monkeypatch):
+    locks = SessionLocks(tmp_db, shared=True, lease_seconds=0.3)
+    calls = []
+
+    def renew(session_id, owner, now):
+        calls.append(now)
+        if len(calls) == 1:
+            raise OSError("store unreachable")
+        return True
+
+    monkeypatch.setattr(locks, "_renew", renew)
+
+    async def scenario():
+        async with locks.hold("s1"):
+            await asyncio.sleep(0.5)
+
+    run(scenario())
+    assert len(calls) >= 2
+    locks.close()
+
+
+def test_store_calls_do_not_block_the_event_loop(tmp_db, monkeypatch):
+    locks = SessionLocks(tmp_db, shared=True)
+    try_lease = locks._try_lease
+
+    def slow_lease(*args):
+        time.sleep(0.2)
+        return try_lease(*args)
+
+    monkeypatch.setattr(locks, "_try_lease", slow_lease)
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        ticking = asyncio.create_task(ticker())
+        async with locks.hold("s1"):
+            await locks.aremember("key", "fp", {"story": "x"})
+            assert await locks.arecall("key", "fp") == {"story": "x"}
+        ticking.cancel()
+
+    run(scenario())
+    assert len(ticks) > 10
+    locks.close()
+
+
+def test_redis_leases_keep_other_workers_out():
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    a = RedisSessionLocks(client, wait_seconds=0.1)
+    b = RedisSessionLocks(client, wait_seconds=0.1)
+
+    async def scenario():
+        async with a.hold("s1"):
+            with pytest.raises(SessionBusy):
+                async with b.hold("s1"):
+                    pass
+        async with b.hold("s1"):
+            await b.aremember("key", "fp", {"story": "x"})
+        return await a.arecall("key", "fp")
+
+    assert run(scenario()) == {"story": "x"}
+    assert client.keys("story:lease:*") == []
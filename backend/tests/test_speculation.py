@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+import rate_limiter
+from conftest import run
+from speculation import Speculator
+
+STORY = "Once upon a time, a heron counted the stars.\n\nIn the end, patience paid."
+
+
+@pytest.fixture
+def speculator(fake_llm):
+    speculator = Speculator(enabled=True)
+    yield speculator
+    speculator.close()
+
+
+def test_speculated_results_are_used_for_the_same_story(speculator):
+    async def scenario():
+        speculator.start("s1", STORY)
+        return await speculator.take("s1", STORY, "title"), await speculator.take("s1", STORY, "moral")
+
+    assert run(scenario()) == ("The Hero of the Valley", "Courage grows through small, repeated acts.")
+    assert speculator.tokens["used"] > 0 and speculator.tokens["wasted"] == 0
+    assert speculator.stats()["sessions"] == 0
+
+
+def test_a_changed_story_wastes_the_speculation(speculator):
+    async def scenario():
+        speculator.start("s1", STORY)
+        await asyncio.sleep(0.05)
+        return await speculator.take("s1", STORY + " More.", "title")
+
+    assert run(scenario()) is None
+    assert speculator.tokens["wasted"] > 0 and speculator.tokens["used"] == 0
+
+
+def test_calls_cancelled_in_flight_count_their_prompt(speculator, fake_llm):
+    fake_llm.latency = 5
+
+    async def scenario():
+        speculator.start("s1", STORY)
+        await asyncio.sleep(0.05)
+        speculator.cancel("s1")
+        await asyncio.sleep(0)
+
+    run(scenario())
+    stats = speculator.stats()
+    assert stats["cancelled_in_flight"] == 2
+    assert stats["tokens"]["wasted"] > 2 * len(STORY) // 8
+
+
+def test_calls_cancelled_before_they_are_sent_cost_nothing(speculator, monkeypatch):
+    async def queued(self, priority="interactive", blocking=True):
+        await asyncio.sleep(5)
+        return True
+
+    monkeypatch.setattr(rate_limiter.RateLimiter, "aacquire", queued)
+
+    async def scenario():
+        speculator.start("s1", STORY)
+        await asyncio.sleep(0.05)
+        speculator.cancel("s1")
+        await asyncio.sleep(0)
+
+    run(scenario())
+    assert speculator.stats()["cancelled_in_flight"] == 0
+    assert speculator.tokens == {"used": 0, "wasted": 0}
+
+
+def test_a_finalizing_run_survives_cancelled_speculation(speculator, fake_llm):
+    fake_llm.latency = 0.2
+
+    async def scenario():
+        speculator.start("s1", STORY)
+        taking = asyncio.create_task(speculator.take("s1", STORY, "title"))
+        await asyncio.sleep(0.05)
+        speculator.cancel("s1")
+        return await taking
+
+    assert run(scenario()) is None
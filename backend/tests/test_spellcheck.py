@@ -0,0 +1,53 @@
+import pytest
+
+from spellcheck import SpellingEngine, damerau_levenshtein
+
+WORDS = {"valley": 50, "everyone": 40, "village": 30, "hero": 25, "the": 1000, "heron": 5, "here": 60, "wiser": 10}
+
+
+@pytest.fixture
+def engine():
+    return SpellingEngine(WORDS)
+
+
+def test_edit_distance_counts_transpositions_once():
+    assert damerau_levenshtein("valey", "valley", 2) == 1
+    assert damerau_levenshtein("hreo", "hero", 2) == 1
+    assert damerau_levenshtein("abcdef", "ghijkl", 2) == 3
+
+
+def test_misspellings_get_the_closest_then_most_frequent_word(engine):
+    assert engine.suggest("valey") == "valley"
+    assert engine.suggest("evryone") == "everyone"
+    # "hero" and "here" are both one edit away: the more frequent wins
+    assert engine.suggest("herr") == "here"
+    assert engine.suggest("heron") == "heron"
+    # Too far from every word: left as it is
+    assert engine.suggest("xylophone") == "xylophone"
+
+
+def test_case_and_layout_are_kept(engine):
+    text = "The hreo crossed the valey.\n\n  Evryone in the vilage was WISR."
+    assert engine.correct(text) == "The hero crossed the valley.\n\n  Everyone in the village was WISR."
+
+
+def test_unchanged_paragraphs_are_served_from_the_cache(engine):
+    story = "The hreo left.\n\nThe vilage waited."
+    engine.correct(story)
+    engine.correct(story.replace("left", "returned"))
+    assert engine.stats["paragraphs"] == 4 and engine.stats["paragraph_hits"] == 1
+    assert engine.stats["token_hits"] > 0
+
+
+def test_correction_rate(engine):
+    assert engine.correction_rate("the hreo the valey") == 0.5
+    assert engine.correction_rate("") == 0.0
+
+
+def test_agrees_with_textblob_on_its_dictionary():
+    textblob = pytest.importorskip("textblob")
+    from spellcheck import get_engine
+
+    engine = get_engine()
+    for word in ("valey", "evryone", "beautifull", "storry", "freind", "wisdum"):
+        assert engine.suggest(word) == str(textblob.Word(word).correct())
@@ -0,0 +1,73 @@
+import json
+
+import httpx
+
+from conftest import run
+
+
+def parse_sse(body: str):
+    events = []
+    for frame in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def stream(path: str, payload: dict):
+    import app
+
+    transport = httpx.ASGITransport(app=app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(path, json=payload)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    return parse_sse(response.text)
+
+
+def test_stream_start_then_feedback(fake_llm):
+    import app
+
+    async def scenario():
+        async with app.lifespan(app.app):
+            started = await stream("/api/stream/start", {"prompt": "a lantern that is afraid of the dark"})
+            session_id = started[0][1]["session_id"]
+            finished = await stream("/api/stream/feedback", {"session_id": session_id, "feedback": "done"})
+            return started, finished
+
+    started, finished = run(scenario())
+    names = [name for name, _ in started]
+    assert names[0] == "session"
+    assert names[-1] == "done"
+    assert "error" not in names
+    # The draft's tokens arrive while generate_story runs, before it reports done
+    first_token = names.index("token")
+    nodes = [data["node"] for name, data in started if name == "node"]
+    assert nodes[0] == "generate_story"
+    assert first_token < names.index("node")
+    assert all(data["node"] == "generate_story" for name, data in started if name == "token")
+    done = started[-1][1]
+    assert done["requires_feedback"] and done["status"] == "awaiting_feedback"
+    assert done["story"]
+
+    names = [name for name, _ in finished]
+    assert names[0] == "session" and names[-1] == "done"
+    nodes = {data["node"] for name, data in finished if name == "node"}
+    assert {"title_generator", "moral_extractor"} <= nodes
+    done = finished[-1][1]
+    assert done["story_complete"] and done["title"] and done["moral"]
+
+
+def test_stream_done_matches_stored_session(fake_llm):
+    import app
+
+    async def scenario():
+        async with app.lifespan(app.app):
+            events = await stream("/api/stream/start", {"prompt": "a snail who wants to race"})
+            transport = httpx.ASGITransport(app=app.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                session = await client.get(f"/api/session/{events[0][1]['session_id']}")
+            return events[-1][1], session.json()
+
+    done, session = run(scenario())
+    for field in ("story", "revision_count", "requires_feedback", "status"):
+        assert done[field] == session[field]
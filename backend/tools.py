@@ -1,11 +1,10 @@
 from langchain_core.tools import tool
-from textblob import TextBlob
+from spellcheck import get_engine
 
 # @track_node("fix_grammar_locally")
 @tool
 def fix_grammar_locally(text: str) -> str:
     """Corrects spelling and basic grammar mistakes in the story draft locally."""
-    # TextBlob doesn't require an API key or internet
-    corrected = TextBlob(text).correct()
-    return str(corrected)
-
+    # Runs offline against a preloaded dictionary index; unchanged paragraphs
+    # from earlier drafts are served from the engine's cache
+    return get_engine().correct(text)
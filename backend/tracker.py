@@ -1,17 +1,109 @@
 from state import State
+import asyncio
 import time
+import inspect
+import functools
 from datetime import datetime
+from typing import Dict, Optional
+
+from langgraph.errors import GraphBubbleUp
+from langchain_core.runnables.config import var_child_runnable_config
+
+from metrics import registry, record_span
+from config import NODE_LOG
 
 # -----------------------------
 # Utilities
 # -----------------------------
+# When each thread's last node finished, to measure how long the next one
+# waited to be scheduled. Cleared on interrupts so time spent waiting for the
+# user is not counted as queueing.
+_last_exit: Dict[str, int] = {}
+# Threads whose last node was final never pop their entry; cap the leftovers
+_LAST_EXIT_MAX = 10000
+
+
+def _thread_id(state) -> Optional[str]:
+    config = var_child_runnable_config.get()
+    if config:
+        thread_id = config.get("configurable", {}).get("thread_id")
+        if thread_id:
+            return str(thread_id)
+    return state.get("session_id") if isinstance(state, dict) else None
+
+
+class _NodeRun:
+    """Bookkeeping around one node call."""
+
+    __slots__ = ("name", "labels", "thread_id", "start_ns")
+
+    def __init__(self, name: str, labels, state):
+        self.name = name
+        self.labels = labels
+        self.thread_id = _thread_id(state)
+        self.start_ns = time.perf_counter_ns()
+        previous = _last_exit.pop(self.thread_id, None) if self.thread_id else None
+        if previous is not None:
+            registry.observe("story_node_queue_seconds", labels, (self.start_ns - previous) / 1e9)
+        registry.add("story_node_in_flight", labels, 1)
+        if NODE_LOG:
+            print(f"🟢 [{datetime.now().strftime('%H:%M:%S')}] ENTER: {name}")
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        end_ns = time.perf_counter_ns()
+        seconds = (end_ns - self.start_ns) / 1e9
+        if error is None:
+            outcome = "ok"
+        elif isinstance(error, GraphBubbleUp):
+            # interrupt() is control flow, not a failure
+            outcome = "interrupt"
+        elif isinstance(error, asyncio.CancelledError):
+            outcome = "cancelled"
+        else:
+            outcome = "error"
+            registry.inc("story_node_errors_total", self.labels + (("error", type(error).__name__),))
+        registry.add("story_node_in_flight", self.labels, -1)
+        registry.observe("story_node_duration_seconds", self.labels + (("outcome", outcome),), seconds)
+        if self.thread_id and outcome == "ok":
+            _last_exit[self.thread_id] = end_ns
+            if len(_last_exit) > _LAST_EXIT_MAX:
+                _last_exit.pop(next(iter(_last_exit)), None)
+        # Span timestamps are wall clock, as OpenTelemetry expects
+        wall_end = time.time_ns()
+        attributes = {"node": self.name}
+        if outcome == "error":
+            attributes["error"] = repr(error)
+        record_span(self.name, self.thread_id, wall_end - (end_ns - self.start_ns), wall_end, outcome, attributes)
+        if NODE_LOG:
+            print(f"✅ [{datetime.now().strftime('%H:%M:%S')}] EXIT: {self.name} ({seconds:.2f}s, {outcome})\n")
+
+
 def track_node(node_name: str):
+    labels = (("node", node_name),)
+
     def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(state: State):
+                run = _NodeRun(node_name, labels, state)
+                try:
+                    result = await func(state)
+                except BaseException as e:
+                    run.finish(e)
+                    raise
+                run.finish()
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
         def wrapper(state: State):
-            print(f"🟢 [{datetime.now().strftime('%H:%M:%S')}] ENTER: {node_name}")
-            start = time.time()
-            result = func(state)
-            print(f"✅ [{datetime.now().strftime('%H:%M:%S')}] EXIT: {node_name} ({time.time()-start:.2f}s)\n")
+            run = _NodeRun(node_name, labels, state)
+            try:
+                result = func(state)
+            except BaseException as e:
+                run.finish(e)
+                raise
+            run.finish()
             return result
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
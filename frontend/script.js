@@ -272,6 +272,90 @@ function updateUISections(requiresFeedback, storyComplete, hasStory) {
     }
 }
 
+// Friendly status text for node transitions reported by the stream
+const NODE_STATUS = {
+    generate_story: 'Draft written, polishing...',
+    grammar_check: 'Checking grammar and spelling...',
+    execute_tool: 'Fixing grammar and spelling...',
+    apply_fix: 'Applying corrections...',
+    fix_grammar: 'Fixing grammar and spelling...',
+    revise_story: 'Revision written, polishing...',
+    human_feedback: 'Almost there...'
+};
+
+// POST to a Server-Sent Events endpoint and render story tokens as they arrive.
+// Resolves with the final session payload (same shape as the JSON endpoints).
+async function streamSession(path, body) {
+    const response = await fetch(`${API_BASE_URL}${path}`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+        },
+        body: JSON.stringify(body)
+    });
+
+    if (!response.ok) {
+        const error = await response.json();
+        throw new Error(error.detail || 'Request failed');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let streamedStory = '';
+    let streamedNode = null;
+    let renderPending = false;
+
+    const render = () => {
+        renderPending = false;
+        displayStory(streamedStory);
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            });
+            const payload = data ? JSON.parse(data) : {};
+
+            if (event === 'token') {
+                // A new node starts a fresh draft (e.g. a revision replacing the story)
+                if (payload.node !== streamedNode) {
+                    streamedNode = payload.node;
+                    streamedStory = '';
+                }
+                streamedStory += payload.text;
+                if (!renderPending) {
+                    renderPending = true;
+                    requestAnimationFrame(render);
+                }
+            } else if (event === 'node') {
+                if (NODE_STATUS[payload.node]) {
+                    statusText.textContent = NODE_STATUS[payload.node];
+                }
+            } else if (event === 'error') {
+                throw new Error(payload.detail || 'Story generation failed');
+            } else if (event === 'done') {
+                return payload;
+            }
+        }
+    }
+
+    throw new Error('Connection closed before the story was finished');
+}
+
 // Start new story
 async function startStory() {
     const prompt = promptInput.value.trim();
@@ -290,20 +374,7 @@ async function startStory() {
     statusText.textContent = 'Crafting your story...';
 
     try {
-        const response = await fetch(`${API_BASE_URL}/api/start`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ prompt })
-        });
-
-        if (!response.ok) {
-            const error = await response.json();
-            throw new Error(error.detail || 'Failed to start story generation');
-        }
-
-        const data = await response.json();
+        const data = await streamSession('/api/stream/start', { prompt });
         currentSessionId = data.session_id;
         currentStoryData = data;
         
@@ -350,23 +421,10 @@ async function submitFeedback() {
     statusText.textContent = 'Applying your creative touch...';
 
     try {
-        const response = await fetch(`${API_BASE_URL}/api/feedback`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                session_id: currentSessionId,
-                feedback: feedback
-            })
+        const data = await streamSession('/api/stream/feedback', {
+            session_id: currentSessionId,
+            feedback: feedback
         });
-
-        if (!response.ok) {
-            const error = await response.json();
-            throw new Error(error.detail || 'Failed to apply feedback');
-        }
-
-        const data = await response.json();
         currentStoryData = data;
         
         // Update UI